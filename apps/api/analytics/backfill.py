@@ -0,0 +1,38 @@
+"""
+Rebuild the daily analytics rollups from order history.
+
+Run from apps/api:
+    python -m analytics.backfill              # every mess
+    python -m analytics.backfill --mess SLUG  # one mess
+"""
+import argparse
+import asyncio
+from sqlalchemy import select
+from db.session import AsyncSessionLocal, engine
+# Every mapped model must be imported for relationship resolution
+from auth.models import User, Customer
+from mess.models import Mess
+from mess_table.models import MessTable
+from menu.models import MenuItem, MenuItemCategory
+from orders.models import Order, OrderItem, OrderTransaction
+from .rollups import rebuild_rollups
+
+
+async def backfill(slug: str = None) -> None:
+    async with AsyncSessionLocal() as db:
+        mess_id = None
+        if slug:
+            mess_id = (await db.execute(select(Mess.id).where(Mess.slug == slug))).scalar_one_or_none()
+            if mess_id is None:
+                raise SystemExit(f"Mess {slug!r} not found")
+        # One transaction: readers see either the old or the rebuilt rollups
+        await rebuild_rollups(db, mess_id)
+        await db.commit()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mess", help="slug of a single mess to rebuild")
+    args = parser.parse_args()
+    asyncio.run(backfill(args.mess))
@@ -0,0 +1,26 @@
+from sqlalchemy import BigInteger, Column, Date, DateTime, ForeignKey, Integer
+from sqlalchemy.dialects.postgresql import UUID
+from db.base import Base
+
+
+class DailyItemSales(Base):
+    """Units sold and revenue per menu item per day, from completed orders"""
+    __tablename__ = "daily_item_sales"
+
+    mess_id = Column(UUID(as_uuid=True), ForeignKey("mess.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    menu_item_id = Column(UUID(as_uuid=True), ForeignKey("menu_item.id", ondelete="CASCADE"), primary_key=True)
+    quantity = Column(Integer, nullable=False, default=0)
+    revenue = Column(BigInteger, nullable=False, default=0)
+
+
+class DailyCustomerSpend(Base):
+    """Completed orders and spend per customer per day"""
+    __tablename__ = "daily_customer_spend"
+
+    mess_id = Column(UUID(as_uuid=True), ForeignKey("mess.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    customer_id = Column(UUID(as_uuid=True), ForeignKey("customer.id", ondelete="CASCADE"), primary_key=True)
+    orders = Column(Integer, nullable=False, default=0)
+    spent = Column(BigInteger, nullable=False, default=0)
+    last_order_at = Column(DateTime(timezone=True), nullable=True)
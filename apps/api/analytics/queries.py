@@ -0,0 +1,202 @@
+import uuid
+from datetime import date, datetime, time, timedelta
+from typing import Optional
+from zoneinfo import ZoneInfo
+from sqlalchemy import DateTime, and_, cast, desc, func, literal_column, select, text, true
+from sqlalchemy.dialects.postgresql import JSON, aggregate_order_by
+from auth.models import Customer
+from core.config import settings
+from menu.models import MenuItem, MenuItemCategory
+from orders.models import Order, OrderItem
+from .models import DailyCustomerSpend, DailyItemSales
+from .rollups import completed_orders_filter
+from .schema import AnalyticsGranularityEnum
+
+TOP_LIMIT = 10
+
+
+def in_range(day_column, start: Optional[date], end: Optional[date]):
+    """Inclusive day range; open ends are unbounded"""
+    conditions = []
+    if start is not None:
+        conditions.append(day_column >= start)
+    if end is not None:
+        conditions.append(day_column <= end)
+    return and_(true(), *conditions)
+
+
+def json_rows(subquery, *order_by):
+    """
+    Rows of a subquery as one JSON array (empty array when no rows), in the given order
+    """
+    row = literal_column(subquery.name)
+    return (
+        select(func.coalesce(func.json_agg(aggregate_order_by(row, *order_by)), text("'[]'::json"), type_=JSON))
+        .select_from(subquery)
+        .scalar_subquery()
+    )
+
+
+def analytics_statement(mess_id: uuid.UUID, start: Optional[date] = None, end: Optional[date] = None):
+    """
+    Overview counters and top menu items/customers for a mess in a single statement.
+    Sales figures come from the daily rollups, so the cost grows with the number of
+    days in the range rather than with order history.
+    """
+    spend_in_range = and_(DailyCustomerSpend.mess_id == mess_id, in_range(DailyCustomerSpend.day, start, end))
+    revenue = select(func.coalesce(func.sum(DailyCustomerSpend.spent), 0)).where(spend_in_range).scalar_subquery()
+    orders = select(func.coalesce(func.sum(DailyCustomerSpend.orders), 0)).where(spend_in_range).scalar_subquery()
+    customers = select(func.count(Customer.id)).where(Customer.mess_id == mess_id).scalar_subquery()
+    items = (
+        select(func.count(MenuItem.id))
+        .where(MenuItem.mess_id == mess_id, MenuItem.is_active == True)
+        .scalar_subquery()
+    )
+
+    sold_count = func.sum(DailyItemSales.quantity).label('sold_count')
+    top_menu_items = (
+        select(
+            MenuItem.id,
+            MenuItem.name,
+            MenuItem.primary_image.label('image'),
+            MenuItemCategory.name.label('category_name'),
+            MenuItem.price,
+            sold_count,
+            MenuItem.spiciness.label('spicy_level'),
+            MenuItem.is_veg,
+            MenuItem.in_stock,
+        )
+        .select_from(DailyItemSales)
+        .join(MenuItem, MenuItem.id == DailyItemSales.menu_item_id)
+        .join(MenuItemCategory, MenuItem.category_id == MenuItemCategory.id)
+        .where(
+            DailyItemSales.mess_id == mess_id,
+            in_range(DailyItemSales.day, start, end),
+            MenuItem.is_active == True,
+        )
+        .group_by(MenuItem.id, MenuItemCategory.id)
+        .order_by(desc('sold_count'))
+        .limit(TOP_LIMIT)
+        .subquery('top_menu_items')
+    )
+
+    total_spent = func.sum(DailyCustomerSpend.spent).label('total_spent')
+    top_customers = (
+        select(
+            Customer.id,
+            Customer.name,
+            Customer.email,
+            Customer.image,
+            func.sum(DailyCustomerSpend.orders).label('total_orders'),
+            total_spent,
+            func.max(DailyCustomerSpend.last_order_at).label('last_order_date'),
+        )
+        .select_from(DailyCustomerSpend)
+        .join(Customer, Customer.id == DailyCustomerSpend.customer_id)
+        .where(spend_in_range)
+        .group_by(Customer.id)
+        .order_by(desc('total_spent'))
+        .limit(TOP_LIMIT)
+        .subquery('top_customers')
+    )
+
+    return select(
+        revenue.label('revenue'),
+        orders.label('orders'),
+        customers.label('customers'),
+        items.label('items'),
+        json_rows(top_menu_items, top_menu_items.c.sold_count.desc()).label('top_menu_items'),
+        json_rows(top_customers, top_customers.c.total_spent.desc()).label('top_customers'),
+    )
+
+
+def local_midnight(day: date) -> datetime:
+    return datetime.combine(day, time.min, ZoneInfo(settings.ANALYTICS_TIMEZONE))
+
+
+def hourly_statement(mess_id: uuid.UUID, start: date, end: date):
+    """
+    Revenue, orders and units sold per local hour, straight from orders. The
+    created_at range is sargable, so ix_orders_mess_status_created bounds the scan
+    to the completed orders of this mess in the range.
+    """
+    bucket = func.date_trunc('hour', func.timezone(settings.ANALYTICS_TIMEZONE, Order.created_at)).label('bucket')
+    return (
+        select(
+            bucket,
+            func.coalesce(func.sum(OrderItem.total_price), 0).label('revenue'),
+            func.count(func.distinct(Order.id)).label('orders'),
+            func.coalesce(
+                func.sum(OrderItem.quantity).filter(OrderItem.menu_item_id.isnot(None)), 0
+            ).label('items_sold'),
+        )
+        .outerjoin(OrderItem, and_(OrderItem.order_id == Order.id, OrderItem.is_cancelled == False))
+        .where(
+            Order.mess_id == mess_id,
+            completed_orders_filter(),
+            Order.created_at >= local_midnight(start),
+            Order.created_at < local_midnight(end + timedelta(days=1)),
+        )
+        .group_by(bucket)
+        .order_by(bucket)
+    )
+
+
+def rollup_statement(mess_id: uuid.UUID, granularity: AnalyticsGranularityEnum, start: date, end: date):
+    """
+    Revenue, orders and units sold per day or week (weeks start on Monday) from the
+    daily rollups, so a year costs a few hundred days of rows rather than its orders
+    """
+    def truncated(day_column):
+        # Cast to a plain timestamp: date_trunc on a date would go through timestamptz
+        return func.date_trunc(granularity.value, cast(day_column, DateTime)).label('bucket')
+
+    spend_bucket = truncated(DailyCustomerSpend.day)
+    spend = (
+        select(
+            spend_bucket,
+            func.sum(DailyCustomerSpend.spent).label('revenue'),
+            func.sum(DailyCustomerSpend.orders).label('orders'),
+        )
+        .where(DailyCustomerSpend.mess_id == mess_id, in_range(DailyCustomerSpend.day, start, end))
+        .group_by(spend_bucket)
+        .subquery('spend')
+    )
+    sales_bucket = truncated(DailyItemSales.day)
+    sales = (
+        select(sales_bucket, func.sum(DailyItemSales.quantity).label('items_sold'))
+        .where(DailyItemSales.mess_id == mess_id, in_range(DailyItemSales.day, start, end))
+        .group_by(sales_bucket)
+        .subquery('sales')
+    )
+    # Item sales only come from completed orders, which always have a spend row that day
+    return (
+        select(
+            spend.c.bucket,
+            spend.c.revenue,
+            spend.c.orders,
+            func.coalesce(sales.c.items_sold, 0).label('items_sold'),
+        )
+        .outerjoin(sales, sales.c.bucket == spend.c.bucket)
+        .order_by(spend.c.bucket)
+    )
+
+
+def timeseries_statement(mess_id: uuid.UUID, granularity: AnalyticsGranularityEnum, start: date, end: date):
+    if granularity == AnalyticsGranularityEnum.HOUR:
+        return hourly_statement(mess_id, start, end)
+    return rollup_statement(mess_id, granularity, start, end)
+
+
+def bucket_starts(granularity: AnalyticsGranularityEnum, start: date, end: date):
+    """Every bucket in the range as naive local timestamps, matching what date_trunc returns"""
+    if granularity == AnalyticsGranularityEnum.HOUR:
+        current, step = datetime.combine(start, time.min), timedelta(hours=1)
+    elif granularity == AnalyticsGranularityEnum.DAY:
+        current, step = datetime.combine(start, time.min), timedelta(days=1)
+    else:
+        current, step = datetime.combine(start - timedelta(days=start.weekday()), time.min), timedelta(weeks=1)
+    stop = datetime.combine(end + timedelta(days=1), time.min)
+    while current < stop:
+        yield current
+        current += step
@@ -0,0 +1,95 @@
+import uuid
+from typing import Optional
+from sqlalchemy import and_, delete, func, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from core.config import settings
+from orders.models import Order, OrderItem
+from orders.schema import OrderStatusEnum
+from .models import DailyCustomerSpend, DailyItemSales
+
+# Local calendar day of the order in the analytics timezone
+order_day = func.date(func.timezone(settings.ANALYTICS_TIMEZONE, Order.created_at))
+
+
+def completed_orders_filter():
+    return and_(Order.status == OrderStatusEnum.COMPLETED, Order.is_cancelled == False)
+
+
+def item_sales_rows(*where):
+    return (
+        select(
+            Order.mess_id,
+            order_day.label('day'),
+            OrderItem.menu_item_id,
+            func.sum(OrderItem.quantity).label('quantity'),
+            func.sum(OrderItem.total_price).label('revenue'),
+        )
+        .join(OrderItem, OrderItem.order_id == Order.id)
+        .where(*where, OrderItem.is_cancelled == False, OrderItem.menu_item_id.isnot(None))
+        .group_by(Order.mess_id, order_day, OrderItem.menu_item_id)
+    )
+
+
+def customer_spend_rows(*where):
+    return (
+        select(
+            Order.mess_id,
+            order_day.label('day'),
+            Order.customer_id,
+            func.count(Order.id).label('orders'),
+            func.sum(Order.total_price).label('spent'),
+            func.max(Order.created_at).label('last_order_at'),
+        )
+        .where(*where)
+        .group_by(Order.mess_id, order_day, Order.customer_id)
+    )
+
+
+ITEM_COLUMNS = ['mess_id', 'day', 'menu_item_id', 'quantity', 'revenue']
+CUSTOMER_COLUMNS = ['mess_id', 'day', 'customer_id', 'orders', 'spent', 'last_order_at']
+
+
+async def record_completed_order(db: AsyncSession, order_id: uuid.UUID) -> None:
+    """
+    Add an order to the daily rollups. Call once, in the transaction that moves it to COMPLETED;
+    completed orders are never modified afterwards, so rollups only ever grow.
+    """
+    items = insert(DailyItemSales).from_select(ITEM_COLUMNS, item_sales_rows(Order.id == order_id))
+    await db.execute(items.on_conflict_do_update(
+        index_elements=['mess_id', 'day', 'menu_item_id'],
+        set_={
+            'quantity': DailyItemSales.quantity + items.excluded.quantity,
+            'revenue': DailyItemSales.revenue + items.excluded.revenue,
+        },
+    ))
+
+    customers = insert(DailyCustomerSpend).from_select(CUSTOMER_COLUMNS, customer_spend_rows(Order.id == order_id))
+    await db.execute(customers.on_conflict_do_update(
+        index_elements=['mess_id', 'day', 'customer_id'],
+        set_={
+            'orders': DailyCustomerSpend.orders + customers.excluded.orders,
+            'spent': DailyCustomerSpend.spent + customers.excluded.spent,
+            'last_order_at': func.greatest(DailyCustomerSpend.last_order_at, customers.excluded.last_order_at),
+        },
+    ))
+
+
+async def rebuild_rollups(db: AsyncSession, mess_id: Optional[uuid.UUID] = None) -> None:
+    """
+    Recompute the rollups from order history, for one mess or all of them.
+    The tables are locked until db commits, so orders completing meanwhile are
+    added on top of the rebuilt rows instead of racing with them.
+    """
+    await db.execute(text("LOCK TABLE daily_item_sales, daily_customer_spend IN EXCLUSIVE MODE"))
+    where = [completed_orders_filter()]
+    if mess_id is not None:
+        where.append(Order.mess_id == mess_id)
+        await db.execute(delete(DailyItemSales).where(DailyItemSales.mess_id == mess_id))
+        await db.execute(delete(DailyCustomerSpend).where(DailyCustomerSpend.mess_id == mess_id))
+    else:
+        await db.execute(delete(DailyItemSales))
+        await db.execute(delete(DailyCustomerSpend))
+
+    await db.execute(insert(DailyItemSales).from_select(ITEM_COLUMNS, item_sales_rows(*where)))
+    await db.execute(insert(DailyCustomerSpend).from_select(CUSTOMER_COLUMNS, customer_spend_rows(*where)))
@@ -1,6 +1,8 @@
 from pydantic import BaseModel
 from uuid import UUID
 from typing import List
+from enum import Enum
+from datetime import date, datetime
 
 from menu.enums import SpicinessEnum
 
@@ -35,3 +37,22 @@ class AnalyticsResponse(BaseModel):
     top_menu_items: List[AnalyticsTopMenuItemsResponse]
     top_customers: List[AnalyticsTopCustomersResponse]
     currency: str
+
+class AnalyticsGranularityEnum(str,Enum):
+    HOUR = "hour"
+    DAY = "day"
+    WEEK = "week"
+
+class AnalyticsBucketResponse(BaseModel):
+    bucket: datetime
+    revenue: float
+    orders: int
+    items_sold: int
+
+class AnalyticsTimeseriesResponse(BaseModel):
+    granularity: AnalyticsGranularityEnum
+    start: date
+    end: date
+    timezone: str
+    buckets: List[AnalyticsBucketResponse]
+    currency: str
@@ -2,6 +2,7 @@ from fastapi_users.authentication import (
     AuthenticationBackend,
     BearerTransport,
 )
+from sqlalchemy.exc import InvalidRequestError
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import Depends
 from typing import Optional, AsyncGenerator
@@ -9,11 +10,26 @@ from fastapi_users.authentication.strategy import DatabaseStrategy
 from db.session import get_async_session
 from .models import AccessToken, User, Customer,CustomerAccessToken
 from .main import CustomerManager, UserManager
+from .token_cache import CUSTOMER, USER, hash_token, token_cache
 from fastapi_users_db_sqlalchemy.access_token import (
     SQLAlchemyAccessTokenDatabase,
 )
 # Authentication backend
 
+async def get_cached_user(session: AsyncSession, kind: str, token: str):
+    """
+    User for a cached token, merged into this request's session without a query
+    """
+    cached = token_cache.get(kind, token)
+    if cached is None:
+        return None
+    try:
+        return await session.merge(cached, load=False)
+    except InvalidRequestError:
+        # The cached instance has unflushed changes in another request
+        return None
+
+
 # Custom Database Strategy with additional validation
 class CustomDatabaseStrategy(DatabaseStrategy):
     def __init__(self, database: SQLAlchemyAccessTokenDatabase):
@@ -23,7 +39,11 @@ class CustomDatabaseStrategy(DatabaseStrategy):
     async def read_token(self, token: Optional[str], user_manager: UserManager) -> Optional[User]:
         if not token:
             return None
-            
+
+        user = await get_cached_user(self.database.session, USER, token)
+        if user is not None:
+            return user
+
         # Get user from parent method
         user = await super().read_token(token, user_manager)
         if not user:
@@ -38,8 +58,14 @@ class CustomDatabaseStrategy(DatabaseStrategy):
             except Exception:
                 pass  # Ignore deletion errors
             return None
-            
+
+        token_cache.put(USER, token, user)
         return user
+
+    async def destroy_token(self, token: str, user: User) -> None:
+        await token_cache.notify(self.database.session, USER, tokens=[token])
+        await super().destroy_token(token, user)
+        token_cache.invalidate_tokens(USER, [hash_token(token)])
     
 
 class CustomerDatabaseStrategy(DatabaseStrategy):
@@ -49,7 +75,11 @@ class CustomerDatabaseStrategy(DatabaseStrategy):
     async def read_token(self, token: Optional[str], user_manager: CustomerManager) -> Optional[Customer]:
         if not token:
             return None
-        
+
+        user = await get_cached_user(self.database.session, CUSTOMER, token)
+        if user is not None:
+            return user
+
         user = await super().read_token(token, user_manager)
         if not user:
             return None
@@ -60,8 +90,14 @@ class CustomerDatabaseStrategy(DatabaseStrategy):
             except Exception:
                 pass 
             return None
-        
+
+        token_cache.put(CUSTOMER, token, user)
         return user
+
+    async def destroy_token(self, token: str, user: Customer) -> None:
+        await token_cache.notify(self.database.session, CUSTOMER, tokens=[token])
+        await super().destroy_token(token, user)
+        token_cache.invalidate_tokens(CUSTOMER, [hash_token(token)])
     
     
 
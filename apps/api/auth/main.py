@@ -11,6 +11,7 @@ from .models import Customer, SQLAlchemyCustomerDatabase, User, SQLAlchemyUserDa
 from core.config import settings
 from mess.crud import mess_crud
 from mess.models import Mess
+from .token_cache import CUSTOMER, USER, token_cache
 from httpx import AsyncClient
 
 
@@ -118,6 +119,12 @@ class UserManager(UUIDIDMixin, BaseUserManager[User, uuid.UUID]):  # Changed to
     async def on_after_reset_password(self, user: User, request: Request | None = None) -> None:
         print(f"User {user.id} has reset their password.")
 
+    async def on_after_update(self, user: User, update_dict: dict, request: Request | None = None) -> None:
+        token_cache.invalidate_users(USER, [user.id])
+
+    async def on_after_delete(self, user: User, request: Request | None = None) -> None:
+        token_cache.invalidate_users(USER, [user.id])
+
 
 
 
@@ -250,6 +257,7 @@ class CustomerManager(UUIDIDMixin, BaseUserManager[Customer, uuid.UUID]):
         await self.customer_db.update(user, update_dict)
         await self.customer_db.session.commit()
         await self.customer_db.session.refresh(user)
+        token_cache.invalidate_users(CUSTOMER, [user.id])
         return user
         
     
@@ -1,14 +1,12 @@
 from datetime import UTC, datetime, timedelta
 import uuid
 from fastapi_users import FastAPIUsers
-from fastapi_users_db_sqlalchemy.access_token import (
-    SQLAlchemyAccessTokenDatabase,
-)
-from db.session import get_async_session
+from db.session import AsyncSessionLocal
 from core.config import settings
-from auth.models import User, AccessToken,Customer
+from auth.models import User, AccessToken,Customer,CustomerAccessToken
 from auth.main import  get_user_manager,get_customer_manager
 from auth.config import auth_backend,customer_auth_backend
+from auth.token_cache import CUSTOMER, USER, hash_token, token_cache
 from sqlalchemy import select, delete
 
 
@@ -38,42 +36,31 @@ current_active_customer = fastapi_customer.current_user(active=True)
 # Utility functions for token management
 async def revoke_user_tokens(user_id: uuid.UUID):
     """Revoke all tokens for a specific user"""
-    
-    async with get_async_session() as session:
-        access_tokens_db = SQLAlchemyAccessTokenDatabase(session, AccessToken)
-        # Get all user tokens and delete them
-        
-        result = await session.execute(
-            select(AccessToken).where(AccessToken.user_id == user_id)
-        )
-        tokens = result.scalars().all()
-        
-        for token in tokens:
-            await access_tokens_db.delete(token.token)
+    async with AsyncSessionLocal() as session:
+        await session.execute(delete(AccessToken).where(AccessToken.user_id == user_id))
+        await token_cache.notify(session, USER, user_ids=[user_id])
+        await session.commit()
+    token_cache.invalidate_users(USER, [user_id])
 
 async def revoke_customer_tokens(customer_id: uuid.UUID):
     """Revoke all tokens for a specific customer"""
-    async with get_async_session() as session:
-        access_tokens_db = SQLAlchemyAccessTokenDatabase(session, AccessToken)
-        result = await session.execute(
-            select(AccessToken).where(AccessToken.user_id == customer_id)
-        )
-        tokens = result.scalars().all()
-        for token in tokens:
-            await access_tokens_db.delete(token.token)
+    async with AsyncSessionLocal() as session:
+        await session.execute(delete(CustomerAccessToken).where(CustomerAccessToken.user_id == customer_id))
+        await token_cache.notify(session, CUSTOMER, user_ids=[customer_id])
+        await session.commit()
+    token_cache.invalidate_users(CUSTOMER, [customer_id])
 
 async def revoke_token(token: str):
     """Revoke a specific token"""
-    
-    async with get_async_session() as session:
-        access_tokens_db = SQLAlchemyAccessTokenDatabase(session, AccessToken)
-        await access_tokens_db.delete(token)
+    async with AsyncSessionLocal() as session:
+        await session.execute(delete(AccessToken).where(AccessToken.token == token))
+        await token_cache.notify(session, USER, tokens=[token])
+        await session.commit()
+    token_cache.invalidate_tokens(USER, [hash_token(token)])
 
 async def cleanup_expired_tokens():
     """Clean up expired tokens - can be called by a background task"""
-    from sqlalchemy import delete
-    
-    async with get_async_session() as session:
+    async with AsyncSessionLocal() as session:
         # Calculate expiry time based on your token lifetime
         expiry_time = datetime.now(UTC) - timedelta(seconds=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60)
         
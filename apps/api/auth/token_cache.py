@@ -0,0 +1,129 @@
+import hashlib
+import json
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Iterable, Set, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from core.config import settings
+from db.listener import listener, notify
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = "token_cache"
+
+# Staff and customer tokens live in separate tables, so entries are keyed by kind too
+USER = "user"
+CUSTOMER = "customer"
+
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class TokenCache:
+    """
+    Access token -> authenticated user, per worker, keyed by token hash so raw
+    tokens are never held in memory. Revocation and logout invalidate entries
+    locally and, through Postgres NOTIFY, in every other worker; ttl bounds
+    staleness for anything else (deactivation, profile edits elsewhere).
+    """
+
+    def __init__(self, ttl: int = 60, maxsize: int = 10000, channel: str = NOTIFY_CHANNEL):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.channel = channel
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, object]]" = OrderedDict()
+        self._by_user: Dict[Tuple[str, str], Set[str]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, kind: str, token: str):
+        key = (kind, hash_token(token))
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires, user = entry
+            if time.monotonic() < expires:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return user
+            self._discard(key)
+        self.misses += 1
+        return None
+
+    def put(self, kind: str, token: str, user) -> None:
+        key = (kind, hash_token(token))
+        self._discard(key)
+        self._entries[key] = (time.monotonic() + self.ttl, user)
+        self._by_user.setdefault((kind, str(user.id)), set()).add(key[1])
+        while len(self._entries) > self.maxsize:
+            self._discard(next(iter(self._entries)))
+
+    def _discard(self, key: Tuple[str, str]) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        user_key = (key[0], str(entry[1].id))
+        hashes = self._by_user.get(user_key)
+        if hashes is not None:
+            hashes.discard(key[1])
+            if not hashes:
+                del self._by_user[user_key]
+
+    def invalidate_tokens(self, kind: str, token_hashes: Iterable[str]) -> None:
+        for token_hash in token_hashes:
+            self._discard((kind, token_hash))
+
+    def invalidate_users(self, kind: str, user_ids: Iterable) -> None:
+        for user_id in user_ids:
+            for token_hash in list(self._by_user.get((kind, str(user_id)), ())):
+                self._discard((kind, token_hash))
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._by_user.clear()
+
+    async def notify(
+        self,
+        db: AsyncSession,
+        kind: str,
+        tokens: Iterable[str] = (),
+        user_ids: Iterable[uuid.UUID] = (),
+    ) -> None:
+        """
+        Queue an invalidation for all workers; Postgres delivers it when db commits
+        """
+        payload = {
+            "kind": kind,
+            "tokens": [hash_token(token) for token in tokens],
+            "users": [str(user_id) for user_id in user_ids],
+        }
+        await notify(db, self.channel, json.dumps(payload))
+
+    def on_notify(self, payload: str) -> None:
+        try:
+            message = json.loads(payload)
+            kind = message["kind"]
+        except (ValueError, KeyError, TypeError):
+            logger.warning("Ignoring malformed %s notification: %r", self.channel, payload)
+            return
+        self.invalidate_tokens(kind, message.get("tokens", ()))
+        self.invalidate_users(kind, message.get("users", ()))
+
+    async def on_connect(self) -> None:
+        # Revocations published while we were disconnected were missed
+        self.clear()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "size": len(self._entries),
+        }
+
+
+token_cache = TokenCache(ttl=settings.TOKEN_CACHE_TTL_SECONDS, maxsize=settings.TOKEN_CACHE_MAX_SIZE)
+listener.subscribe(token_cache.channel, token_cache.on_notify, on_connect=token_cache.on_connect)
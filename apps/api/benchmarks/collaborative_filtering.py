@@ -0,0 +1,162 @@
+"""
+Collaborative filtering: legacy dict/loop implementation versus the
+array-backed PreferenceProfiles engine. Also checks that both produce the
+same item scores (within tolerance) for every sampled user.
+
+Run from apps/api:
+    python -m benchmarks.collaborative_filtering
+"""
+import random
+import time
+import uuid
+from collections import defaultdict
+from types import SimpleNamespace
+import numpy as np
+from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import StandardScaler
+from menu.preference_profiles import PreferenceProfiles
+
+USER_COUNTS = [1000, 10000, 30000]
+MENU_SIZE = 60
+SAMPLED_USERS = 20
+TOLERANCE = 1e-9
+
+SPICINESS_MAP = {'high': 1.0, 'medium': 0.5, 'low': 0.0}
+
+
+def legacy_profiles(interactions):
+    user_data = defaultdict(list)
+    for interaction in interactions:
+        user_data[str(interaction.user_id)].append({
+            'calories': interaction.calories,
+            'spiciness': interaction.spiciness,
+            'is_veg': interaction.is_veg,
+            'quantity': interaction.quantity,
+        })
+    user_profiles = {}
+    for user_id, orders in user_data.items():
+        total_quantity = sum(order['quantity'] for order in orders)
+        avg_calories = sum(order['calories'] * order['quantity'] for order in orders) / total_quantity
+        spice_weights = defaultdict(float)
+        for order in orders:
+            spice_weights[SPICINESS_MAP.get(order['spiciness'], 0.0)] += order['quantity']
+        total_spice_quantity = sum(spice_weights.values())
+        spice_prefs = {k: v / total_spice_quantity for k, v in spice_weights.items()}
+        veg_quantity = sum(order['quantity'] for order in orders if order['is_veg'])
+        user_profiles[user_id] = {
+            'avg_calories': avg_calories,
+            'spice_low': spice_prefs.get(0.0, 0.0),
+            'spice_medium': spice_prefs.get(0.5, 0.0),
+            'spice_high': spice_prefs.get(1.0, 0.0),
+            'veg_ratio': veg_quantity / total_quantity,
+        }
+    return user_profiles
+
+
+def legacy_similar_users(user_profiles, target_user_id, top_k=5):
+    keys = ['avg_calories', 'spice_low', 'spice_medium', 'spice_high', 'veg_ratio']
+    target_vector = [user_profiles[target_user_id][k] for k in keys]
+    other_users, other_vectors = [], []
+    for user_id, profile in user_profiles.items():
+        if user_id != target_user_id:
+            other_users.append(user_id)
+            other_vectors.append([profile[k] for k in keys])
+    normalized = StandardScaler().fit_transform([target_vector] + other_vectors)
+    similarities = cosine_similarity(normalized[0].reshape(1, -1), normalized[1:])[0]
+    user_similarities = [(other_users[i], sim) for i, sim in enumerate(similarities) if sim > 0.1]
+    user_similarities.sort(key=lambda x: x[1], reverse=True)
+    return user_similarities[:top_k]
+
+
+def legacy_score_items(items, similar_users, user_profiles):
+    item_scores = []
+    total_similarity = sum(sim for _, sim in similar_users)
+    for item in items:
+        if not item.in_stock or not item.is_active or not item.calories:
+            item_scores.append(0.0)
+            continue
+        score = 0.0
+        for user_id, similarity in similar_users:
+            profile = user_profiles[user_id]
+            calorie_match = max(0, 1 - abs(item.calories - profile['avg_calories']) / profile['avg_calories'])
+            spice_val = SPICINESS_MAP.get(item.spiciness, 0.0)
+            if spice_val == 0.0:
+                spice_match = profile['spice_low']
+            elif spice_val == 0.5:
+                spice_match = profile['spice_medium']
+            else:
+                spice_match = profile['spice_high']
+            veg_match = profile['veg_ratio'] if item.is_veg else 1 - profile['veg_ratio']
+            score += ((calorie_match * 0.4 + spice_match * 0.3 + veg_match * 0.3) * similarity) / total_similarity
+        item_scores.append(score)
+    return np.array(item_scores)
+
+
+def make_menu(n: int):
+    return [
+        SimpleNamespace(
+            id=uuid.uuid4(),
+            calories=random.choice([None, random.uniform(100, 1200)]),
+            is_veg=random.random() < 0.5,
+            spiciness=random.choice(["low", "medium", "high", None]),
+            in_stock=random.random() < 0.95,
+            is_active=True,
+        )
+        for _ in range(n)
+    ]
+
+
+def make_interactions(users: int, menu):
+    rows = []
+    with_calories = [item for item in menu if item.calories]
+    for _ in range(users):
+        user_id = uuid.uuid4()
+        for item in random.sample(with_calories, random.randint(1, 6)):
+            rows.append(SimpleNamespace(
+                user_id=user_id,
+                calories=item.calories,
+                spiciness=item.spiciness,
+                is_veg=item.is_veg,
+                quantity=random.randint(1, 4),
+                lines=1,
+            ))
+    return rows
+
+
+def main():
+    random.seed(11)
+    menu = make_menu(MENU_SIZE)
+    print(f"{'users':>6} {'build old':>10} {'build new':>10} {'query old':>10} {'query new':>10} {'max diff':>9}")
+    for users in USER_COUNTS:
+        interactions = make_interactions(users, menu)
+
+        start = time.perf_counter()
+        old_profiles = legacy_profiles(interactions)
+        build_old = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        new_profiles = PreferenceProfiles.from_interactions(interactions)
+        build_new = (time.perf_counter() - start) * 1000
+
+        sampled = random.sample(list(old_profiles.keys()), SAMPLED_USERS)
+        query_old = query_new = 0.0
+        max_diff = 0.0
+        for user_id in sampled:
+            start = time.perf_counter()
+            similar = legacy_similar_users(old_profiles, user_id)
+            old_scores = legacy_score_items(menu, similar, old_profiles) if similar else np.zeros(len(menu))
+            query_old += time.perf_counter() - start
+
+            start = time.perf_counter()
+            rows, similarities = new_profiles.similar_users(user_id)
+            new_scores = new_profiles.score_items(menu, rows, similarities)
+            query_new += time.perf_counter() - start
+
+            max_diff = max(max_diff, float(np.abs(old_scores - new_scores).max()))
+
+        print(f"{users:>6} {build_old:>8.1f}ms {build_new:>8.1f}ms "
+              f"{query_old / SAMPLED_USERS * 1000:>8.2f}ms {query_new / SAMPLED_USERS * 1000:>8.2f}ms {max_diff:>9.1e}")
+        assert max_diff < TOLERANCE, "engine diverged from legacy scores"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+In-memory menu filtering: per-item Python predicates versus MenuColumns mask
+intersection (which also produces facet counts). Checks both return the same
+items; for name queries every substring hit must also be a fuzzy search hit.
+
+Run from apps/api:
+    python -m benchmarks.menu_filters
+"""
+import random
+import time
+import uuid
+from datetime import datetime
+from menu.columns import MenuColumns
+from menu.schema import MenuItemSnapshot
+
+MENU_SIZES = [50, 500, 5000]
+REPEATS = 200
+WORDS = ["paneer", "tikka", "chicken", "momo", "veg", "thali", "dal", "fried", "rice", "masala", "butter", "naan"]
+QUERIES = [
+    {},
+    {"q": "tikka"},
+    {"q": "ma", "vegType": "veg"},
+    {"calorieMins": 200, "calorieMaxes": 600, "spiceLevel": "medium"},
+    {"category": "cat-3", "vegType": "non-veg", "q": "chicken"},
+]
+
+
+def make_menu(n: int):
+    now = datetime.now()
+    return [
+        MenuItemSnapshot(
+            id=uuid.uuid4(), mess_id=uuid.uuid4(), category_id=uuid.uuid4(),
+            name=" ".join(random.sample(WORDS, 2)).title(), price=random.randint(50, 900),
+            calories=random.choice([None, random.uniform(100, 1200)]),
+            spiciness=random.choice(["low", "medium", "high", None]),
+            is_veg=random.random() < 0.5, created_at=now, updated_at=now,
+            category_slug=f"cat-{random.randint(0, 9)}",
+        )
+        for _ in range(n)
+    ]
+
+
+def naive_filter(items, calorieMins=0, calorieMaxes=0, spiceLevel="", vegType="", category="", q=""):
+    result = []
+    for item in items:
+        if category and category != "all" and item.category_slug != category:
+            continue
+        if q and q.lower() not in item.name.lower():
+            continue
+        if calorieMaxes and (item.calories is None or item.calories > calorieMaxes):
+            continue
+        if calorieMins and (item.calories is None or item.calories < calorieMins):
+            continue
+        if spiceLevel and item.spiciness != spiceLevel:
+            continue
+        if vegType and item.is_veg != (vegType == "veg"):
+            continue
+        result.append(item)
+    return result
+
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        fn()
+    return (time.perf_counter() - start) / REPEATS * 1e6
+
+
+def main():
+    random.seed(3)
+    print(f"{'items':>6} {'naive (us)':>11} {'columns (us)':>13}")
+    for size in MENU_SIZES:
+        items = make_menu(size)
+        columns = MenuColumns(items)
+        for query in QUERIES:
+            expected, actual = naive_filter(items, **query), columns.filter(**query)[0]
+            if "q" in query:
+                # fuzzy search adds trigram matches and orders by relevance
+                assert set(map(id, expected)) <= set(map(id, actual)), query
+            else:
+                assert actual == expected, query
+        naive = sum(timed(lambda: naive_filter(items, **query)) for query in QUERIES) / len(QUERIES)
+        masked = sum(timed(lambda: columns.filter(**query)) for query in QUERIES) / len(QUERIES)
+        print(f"{size:>6} {naive:>11.1f} {masked:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Similar-customer lookup: full scan versus the KD-tree neighbour index.
+Reports per-query latency and recall of the top-5 neighbours, including
+after a batch of incremental profile updates.
+
+Run from apps/api:
+    python -m benchmarks.neighbour_index
+"""
+import random
+import time
+import numpy as np
+from menu.preference_profiles import PreferenceProfiles, SUM_COLUMNS
+
+USER_COUNTS = [10000, 50000, 200000]
+QUERIES = 200
+TOP_K = 5
+
+
+def make_profiles(users: int) -> PreferenceProfiles:
+    rng = np.random.default_rng(users)
+    quantity = rng.integers(1, 40, users).astype(np.float64)
+    spice = rng.dirichlet([1, 1, 1], users) * quantity[:, None]
+    sums = np.zeros((users, SUM_COLUMNS))
+    sums[:, 0] = rng.uniform(150, 1100, users) * quantity
+    sums[:, 1] = quantity
+    sums[:, 2:5] = spice
+    sums[:, 5] = rng.uniform(0, 1, users) * quantity
+    return PreferenceProfiles([f"user-{i}" for i in range(users)], sums, np.ones(users, dtype=np.int64))
+
+
+def run(profiles: PreferenceProfiles, user_ids):
+    start = time.perf_counter()
+    results = [set(profiles.similar_users(user_id, top_k=TOP_K)[0].tolist()) for user_id in user_ids]
+    return results, (time.perf_counter() - start) / len(user_ids) * 1000
+
+
+def recall(expected, actual) -> float:
+    hits = sum(len(e & a) for e, a in zip(expected, actual))
+    return hits / max(sum(len(e) for e in expected), 1)
+
+
+def main():
+    random.seed(5)
+    print(f"{'users':>7} {'scan':>9} {'tree':>9} {'build':>9} {'recall':>7} {'recall after updates':>21}")
+    for users in USER_COUNTS:
+        profiles = make_profiles(users)
+        user_ids = random.sample(profiles.user_ids, QUERIES)
+
+        exact, scan_ms = run(profiles, user_ids)
+
+        start = time.perf_counter()
+        profiles.build_neighbour_index()
+        build_ms = (time.perf_counter() - start) * 1000
+        approx, tree_ms = run(profiles, user_ids)
+
+        for user_id in random.sample(profiles.user_ids, users // 50):
+            delta = np.zeros(SUM_COLUMNS)
+            delta[0], delta[1], delta[4] = 900.0, 1.0, 1.0
+            profiles.apply(user_id, delta, 1)
+        approx_updated, _ = run(profiles, user_ids)
+        profiles.drop_neighbour_index()
+        exact_updated, _ = run(profiles, user_ids)
+
+        print(f"{users:>7} {scan_ms:>7.2f}ms {tree_ms:>7.2f}ms {build_ms:>7.0f}ms "
+              f"{recall(exact, approx):>7.3f} {recall(exact_updated, approx_updated):>21.3f}")
+
+
+if __name__ == "__main__":
+    main()
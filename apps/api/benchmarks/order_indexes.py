@@ -0,0 +1,295 @@
+"""
+Order hot-path indexes: seeds a throwaway schema with synthetic messes,
+customers and orders (1M by default), then reports EXPLAIN ANALYZE execution
+times for the order and analytics queries without and with the indexes from
+the order hot-path migrations.
+
+Needs a Postgres database (13+). Everything is created in the bench_orders
+schema, which is dropped afterwards unless --keep is given.
+
+Run from apps/api:
+    python -m benchmarks.order_indexes [--orders 1000000] [--messes 10] [--keep]
+
+BENCHMARK_DATABASE_URI overrides the application database.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+from datetime import date, timedelta
+from sqlalchemy import select, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
+from core.config import settings
+from db.base import Base
+import auth.models  # noqa: F401  (tables referenced by foreign keys)
+import mess.models  # noqa: F401
+import mess_table.models  # noqa: F401
+import menu.models  # noqa: F401
+from analytics.models import DailyCustomerSpend, DailyItemSales  # noqa: F401
+from analytics.queries import analytics_statement, timeseries_statement
+from analytics.rollups import rebuild_rollups
+from analytics.schema import AnalyticsGranularityEnum
+from orders.feed import active_orders_query
+from orders.models import Order, OrderItem, active_orders
+
+SCHEMA = "bench_orders"
+REPEATS = 5
+CUSTOMERS_PER_MESS = 2000
+TABLES_PER_MESS = 20
+CATEGORIES_PER_MESS = 5
+ITEMS_PER_CATEGORY = 12
+INDEXES = [
+    "ix_orders_mess_status_created",
+    "ix_orders_customer_created",
+    "ix_orders_mess_active",
+    "ix_orders_customer_active",
+    "ix_order_items_order_id",
+    "ix_order_items_menu_item_id",
+]
+
+SEED = [
+    """
+    INSERT INTO "user" (id, email, hashed_password, is_active, is_superuser, is_verified)
+    VALUES (gen_random_uuid(), 'owner@bench.local', '-', true, false, true)
+    """,
+    """
+    INSERT INTO mess (id, name, slug, owner_id, is_active, currency)
+    SELECT gen_random_uuid(), 'Bench ' || g, 'bench-' || g, (SELECT id FROM "user"), true, 'NPR'
+    FROM generate_series(1, :messes) g
+    """,
+    """
+    INSERT INTO menu_item_category (id, name, slug, is_active, mess_id)
+    SELECT gen_random_uuid(), 'Category ' || c, m.slug || '-cat-' || c, true, m.id
+    FROM mess m, generate_series(1, :categories) c
+    """,
+    """
+    INSERT INTO menu_item (id, mess_id, name, price, in_stock, category_id, is_active, is_veg, created_at, updated_at)
+    SELECT gen_random_uuid(), c.mess_id, c.name || ' item ' || i, 100 + floor(random() * 800), true, c.id, true,
+           random() < 0.5, now(), now()
+    FROM menu_item_category c, generate_series(1, :items) i
+    """,
+    """
+    INSERT INTO customer (id, email, hashed_password, is_active, is_superuser, is_verified, mess_id, name, created_at)
+    SELECT gen_random_uuid(), 'customer' || g || '@bench.local', '-', true, false, true, m.id, 'Customer ' || g, now()
+    FROM mess m, generate_series(1, :customers) g
+    """,
+    """
+    INSERT INTO mess_tables (id, table_name, capacity, mess_id, is_active, enabled)
+    SELECT gen_random_uuid(), 'Table ' || g, 4, m.id, true, true
+    FROM mess m, generate_series(1, :tables) g
+    """,
+    # Numbered lookups so orders can pick a random customer/table/item of their own mess
+    """
+    CREATE TEMP TABLE bench_mess AS
+    SELECT row_number() OVER (ORDER BY id) - 1 AS mess_no, id FROM mess
+    """,
+    """
+    CREATE TEMP TABLE bench_customers AS
+    SELECT b.mess_no, row_number() OVER (PARTITION BY c.mess_id ORDER BY c.id) AS n, c.id, c.mess_id
+    FROM customer c JOIN bench_mess b ON b.id = c.mess_id
+    """,
+    """
+    CREATE TEMP TABLE bench_tables AS
+    SELECT b.mess_no, row_number() OVER (PARTITION BY t.mess_id ORDER BY t.id) AS n, t.id
+    FROM mess_tables t JOIN bench_mess b ON b.id = t.mess_id
+    """,
+    """
+    CREATE TEMP TABLE bench_items AS
+    SELECT row_number() OVER (PARTITION BY i.mess_id ORDER BY i.id) AS n, i.id, i.mess_id, i.price
+    FROM menu_item i
+    """,
+    "CREATE INDEX ON bench_customers (mess_no, n)",
+    "CREATE INDEX ON bench_tables (mess_no, n)",
+    "CREATE INDEX ON bench_items (mess_id, n)",
+    # About 1% cancelled and 0.3% still in service (placed in the last few hours), the rest completed
+    """
+    INSERT INTO orders (id, customer_id, mess_id, table_id, status, created_at, updated_at, is_cancelled, has_added_items)
+    SELECT gen_random_uuid(), c.id, c.mess_id, t.id, CAST(o.status AS orderstatusenum), o.created_at, o.created_at,
+           o.status = 'CANCELLED', false
+    FROM (
+        SELECT g % :messes AS mess_no,
+               1 + floor(random() * :customers)::int AS customer_no,
+               1 + floor(random() * :tables)::int AS table_no,
+               CASE WHEN r < 0.01 THEN 'CANCELLED'
+                    WHEN r < 0.013 THEN (ARRAY['PENDING', 'RECEIVED', 'PREPARING', 'READY', 'SERVED'])[1 + floor(random() * 5)::int]
+                    ELSE 'COMPLETED' END AS status,
+               CASE WHEN r >= 0.01 AND r < 0.013 THEN now() - random() * interval '3 hours'
+                    ELSE now() - random() * interval '365 days' END AS created_at
+        FROM (SELECT g, random() AS r FROM generate_series(1, :orders) g) s
+    ) o
+    JOIN bench_customers c ON c.mess_no = o.mess_no AND c.n = o.customer_no
+    JOIN bench_tables t ON t.mess_no = o.mess_no AND t.n = o.table_no
+    """,
+    # One to four lines per order, derived from the order id so the lateral series is per row
+    """
+    INSERT INTO order_items (id, order_id, menu_item_id, quantity, total_price, is_cancelled)
+    SELECT gen_random_uuid(), o.id, i.id, 1 + (k + h) % 3, (i.price * (1 + (k + h) % 3))::int, (h + k) % 50 = 0
+    FROM (SELECT id, mess_id, abs(hashtext(id::text)) AS h FROM orders) o
+    CROSS JOIN LATERAL generate_series(1, 1 + o.h % 4) k
+    JOIN bench_items i ON i.mess_id = o.mess_id AND i.n = 1 + (o.h / 7 + k * 13) % :menu_size
+    """,
+    """
+    UPDATE orders
+    SET total_price = live.total_price, item_count = live.item_count
+    FROM (
+        SELECT order_id, sum(total_price) AS total_price, count(*) AS item_count
+        FROM order_items WHERE NOT is_cancelled GROUP BY order_id
+    ) AS live
+    WHERE live.order_id = orders.id
+    """,
+]
+
+
+def literal_sql(statement) -> str:
+    return str(statement.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+
+def loaded_items(order_ids):
+    # What selectinload(Order.items) issues after the main query
+    return select(OrderItem).where(OrderItem.order_id.in_(order_ids))
+
+
+async def build_queries(conn):
+    """The statements each endpoint issues, for a busy mess and one of its customers"""
+    mess_id = (await conn.execute(text("SELECT id FROM bench_mess WHERE mess_no = 0"))).scalar_one()
+    customer_id, table_id = (await conn.execute(
+        select(Order.customer_id, Order.table_id).where(Order.mess_id == mess_id, active_orders()).limit(1)
+    )).one()
+    active = (await conn.execute(
+        select(Order.id).where(Order.mess_id == mess_id, active_orders()).limit(50)
+    )).scalars().all()
+    mine = (await conn.execute(select(Order.id).where(Order.customer_id == customer_id))).scalars().all()
+    today = date.today()
+
+    return {
+        "get_orders (page of 50)": active_orders_query(mess_id, 50),
+        "get_orders items": loaded_items(active),
+        "get_order_popup": select(Order).where(
+            Order.mess_id == mess_id,
+            Order.customer_id == customer_id,
+            active_orders(),
+            Order.table_id == table_id,
+        ).order_by(Order.created_at.desc()).limit(1),
+        "get_my_orders": select(Order).where(Order.customer_id == customer_id),
+        "get_my_orders items": loaded_items(mine),
+        "analytics overview (30d)": analytics_statement(mess_id, today - timedelta(days=29), today),
+        "analytics overview (all)": analytics_statement(mess_id),
+        "timeseries hour (7d)": timeseries_statement(
+            mess_id, AnalyticsGranularityEnum.HOUR, today - timedelta(days=6), today
+        ),
+        "timeseries day (365d)": timeseries_statement(
+            mess_id, AnalyticsGranularityEnum.DAY, today - timedelta(days=364), today
+        ),
+        "timeseries week (365d)": timeseries_statement(
+            mess_id, AnalyticsGranularityEnum.WEEK, today - timedelta(days=364), today
+        ),
+    }
+
+
+def plan_indexes(plan) -> set:
+    names = {plan["Index Name"]} if "Index Name" in plan else set()
+    for child in plan.get("Plans", ()):
+        names |= plan_indexes(child)
+    return names
+
+
+async def explain(conn, statement):
+    """Median execution time in ms over REPEATS runs and the indexes the plan used"""
+    sql = text("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + literal_sql(statement).replace(":", r"\:"))
+    timings, indexes = [], set()
+    for _ in range(REPEATS + 1):
+        result = (await conn.execute(sql)).scalar_one()
+        report = (json.loads(result) if isinstance(result, str) else result)[0]
+        timings.append(report["Execution Time"])
+        indexes = plan_indexes(report["Plan"])
+    return statistics.median(timings[1:]), indexes
+
+
+async def measure(conn, queries):
+    await conn.execute(text("ANALYZE"))
+    return {name: await explain(conn, statement) for name, statement in queries.items()}
+
+
+def index_objects():
+    return [
+        index
+        for table in (Order.__table__, OrderItem.__table__)
+        for index in table.indexes
+        if index.name in INDEXES
+    ]
+
+
+async def seed(conn, orders: int, messes: int) -> None:
+    params = {
+        "orders": orders,
+        "messes": messes,
+        "customers": CUSTOMERS_PER_MESS,
+        "tables": TABLES_PER_MESS,
+        "categories": CATEGORIES_PER_MESS,
+        "items": ITEMS_PER_CATEGORY,
+        "menu_size": CATEGORIES_PER_MESS * ITEMS_PER_CATEGORY,
+    }
+    for statement in SEED:
+        sql = text(statement)
+        await conn.execute(sql.bindparams(**{key: value for key, value in params.items() if key in sql.compile().params}))
+
+    async with AsyncSession(bind=conn) as session:
+        await rebuild_rollups(session)
+
+
+async def run(orders: int, messes: int, keep: bool) -> None:
+    uri = os.environ.get("BENCHMARK_DATABASE_URI") or settings.DATABASE_URI
+    engine = create_async_engine(uri.split("?")[0], poolclass=NullPool)
+    async with engine.connect() as conn:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm SCHEMA public"))
+        await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        await conn.execute(text(f"SET search_path TO {SCHEMA}, public"))
+        await conn.run_sync(Base.metadata.create_all)
+        try:
+            # Load without the indexes under test; it is faster and gives the baseline
+            for name in INDEXES:
+                await conn.execute(text(f"DROP INDEX {name}"))
+            started = time.perf_counter()
+            await seed(conn, orders, messes)
+            await conn.commit()
+            print(f"seeded {orders} orders across {messes} messes in {time.perf_counter() - started:.0f}s")
+
+            await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.execute(text("VACUUM ANALYZE"))
+            queries = await build_queries(conn)
+            before = await measure(conn, queries)
+
+            started = time.perf_counter()
+            for index in index_objects():
+                await conn.run_sync(index.create)
+            print(f"built {len(INDEXES)} indexes in {time.perf_counter() - started:.1f}s\n")
+            after = await measure(conn, queries)
+
+            print(f"{'query':<26} {'before (ms)':>12} {'after (ms)':>11} {'speedup':>8}  indexes used after")
+            for name in queries:
+                (slow, _), (fast, used) = before[name], after[name]
+                print(f"{name:<26} {slow:>12.2f} {fast:>11.2f} {slow / fast if fast else 0:>7.1f}x  {', '.join(sorted(used)) or '-'}")
+        finally:
+            if not keep:
+                await conn.rollback()
+                await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+                await conn.commit()
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--orders", type=int, default=1_000_000)
+    parser.add_argument("--messes", type=int, default=10)
+    parser.add_argument("--keep", action="store_true", help=f"leave the {SCHEMA} schema in place")
+    args = parser.parse_args()
+    asyncio.run(run(args.orders, args.messes, args.keep))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Order placement throughput: the previous create_order database path (menu SELECT,
+order INSERT + flush, item INSERTs, commit, refresh, re-SELECT with selectinloads)
+against the single INSERT ... RETURNING statement that also prices the lines.
+Concurrent clients place orders for a fixed time; reports orders/sec and
+latency percentiles for each path.
+
+Needs a Postgres database. Everything is created in the bench_placement schema,
+which is dropped afterwards.
+
+Run from apps/api:
+    python -m benchmarks.order_placement [--clients 20] [--seconds 10] [--lines 3]
+
+BENCHMARK_DATABASE_URI overrides the application database.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime, timezone
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import selectinload, sessionmaker
+from core.config import settings
+from db.base import Base
+from auth.models import Customer, User
+from mess.models import Mess
+from mess_table.models import MessTable
+from menu.models import MenuItem, MenuItemCategory
+from menu.cache import to_snapshot
+from analytics.models import DailyCustomerSpend, DailyItemSales  # noqa: F401
+from orders import crud
+from orders.models import Order, OrderItem, OrderStatusEnum
+
+SCHEMA = "bench_placement"
+MENU_SIZE = 40
+
+
+async def seed(db: AsyncSession, clients: int):
+    owner = User(email="owner@bench.local", hashed_password="-", is_active=True, is_superuser=False, is_verified=True)
+    db.add(owner)
+    await db.flush()
+    mess = Mess(name="Bench", slug="bench", owner_id=owner.id)
+    db.add(mess)
+    await db.flush()
+    category = MenuItemCategory(name="Mains", slug="bench-mains", mess_id=mess.id)
+    table = MessTable(table_name="Table 1", capacity=4, mess_id=mess.id, is_active=True)
+    db.add_all([category, table])
+    await db.flush()
+    items = [
+        MenuItem(mess_id=mess.id, category_id=category.id, name=f"Item {i}", price=random.randint(100, 900),
+                 calories=random.uniform(150, 900), is_veg=i % 2 == 0)
+        for i in range(MENU_SIZE)
+    ]
+    customers = [
+        Customer(email=f"customer{i}@bench.local", hashed_password="-", is_active=True, is_superuser=False,
+                 is_verified=True, mess_id=mess.id)
+        for i in range(clients)
+    ]
+    db.add_all(items + customers)
+    await db.commit()
+    for item in items:
+        item.category = category
+    return mess, table, customers, {item.id: to_snapshot(item) for item in items}
+
+
+async def legacy_place(db: AsyncSession, mess, table, customer, picks) -> None:
+    """create_order as it was: seven round trips"""
+    ids = [menu_item_id for menu_item_id, _ in picks]
+    result = await db.execute(select(MenuItem).filter(MenuItem.id.in_(ids)))
+    menu_items = {item.id: item for item in result.scalars().all()}
+    order = Order(customer_id=customer.id, mess_id=mess.id, table_id=table.id, status=OrderStatusEnum.PENDING)
+    db.add(order)
+    await db.flush()
+    db.add_all([
+        OrderItem(order_id=order.id, menu_item_id=menu_item_id, quantity=quantity,
+                  total_price=menu_items[menu_item_id].price * quantity)
+        for menu_item_id, quantity in picks
+    ])
+    await db.commit()
+    await db.refresh(order)
+    await db.execute(
+        select(Order).filter(Order.id == order.id).options(
+            selectinload(Order.customer), selectinload(Order.table),
+            selectinload(Order.items), selectinload(Order.transaction),
+        )
+    )
+
+
+async def returning_place(db: AsyncSession, mess, table, customer, picks) -> None:
+    """create_order now: one statement that prices the lines against menu_item, and the commit"""
+    lines = [(uuid.uuid4(), menu_item_id, quantity) for menu_item_id, quantity in picks]
+    now = datetime.now(timezone.utc)
+    order = Order(
+        id=uuid.uuid4(), customer_id=customer.id, mess_id=mess.id, table_id=table.id,
+        status=OrderStatusEnum.PENDING, created_at=now, updated_at=now,
+        item_count=len(lines),
+    )
+    result = await db.execute(crud.place_order_statement(order, lines))
+    assert result.scalars().first() is not None
+    await db.commit()
+
+
+async def drive(Session, place, customers, menu_ids, line_count: int, seconds: float):
+    """Each customer places orders back to back until time is up"""
+    latencies = []
+    deadline = time.perf_counter() + seconds
+
+    async def client(customer):
+        async with Session() as db:
+            while time.perf_counter() < deadline:
+                picks = [(menu_item_id, random.randint(1, 3)) for menu_item_id in random.sample(menu_ids, line_count)]
+                started = time.perf_counter()
+                await place(db, customer, picks)
+                latencies.append(time.perf_counter() - started)
+                db.expunge_all()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(customer) for customer in customers))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return (
+        len(latencies) / elapsed,
+        statistics.median(latencies) * 1000,
+        latencies[int(len(latencies) * 0.95)] * 1000,
+    )
+
+
+async def run(clients: int, seconds: float, line_count: int) -> None:
+    uri = os.environ.get("BENCHMARK_DATABASE_URI") or settings.DATABASE_URI
+    engine = create_async_engine(
+        uri.split("?")[0], pool_size=clients, max_overflow=0,
+        connect_args={"server_settings": {"search_path": f"{SCHEMA}, public"}},
+    )
+    Session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm SCHEMA public"))
+        await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        await conn.run_sync(Base.metadata.create_all)
+    try:
+        async with Session() as db:
+            mess, table, customers, menu = await seed(db, clients)
+        menu_ids = list(menu)
+
+        print(f"{clients} clients, {line_count} lines per order, {seconds:.0f}s per path\n")
+        print(f"{'path':<22} {'orders/s':>9} {'p50 (ms)':>9} {'p95 (ms)':>9}")
+        paths = [
+            ("legacy (7 round trips)", lambda db, customer, picks: legacy_place(db, mess, table, customer, picks)),
+            ("insert ... returning", lambda db, customer, picks: returning_place(db, mess, table, customer, picks)),
+        ]
+        for name, place in paths:
+            rate, p50, p95 = await drive(Session, place, customers, menu_ids, line_count, seconds)
+            print(f"{name:<22} {rate:>9.1f} {p50:>9.2f} {p95:>9.2f}")
+    finally:
+        async with engine.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--lines", type=int, default=3, help="order lines per order")
+    args = parser.parse_args()
+    asyncio.run(run(args.clients, args.seconds, min(args.lines, MENU_SIZE)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Content-based ranking latency: per-request StandardScaler + cosine_similarity
+versus the precomputed per-mess recommendation index.
+
+Run from apps/api:
+    python -m benchmarks.recommendation_index
+"""
+import random
+import time
+import uuid
+from types import SimpleNamespace
+from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import StandardScaler
+from menu.recommendation_index import MessRecommendationIndex, build_user_vector
+
+MENU_SIZES = [50, 500, 5000]
+REPEATS = 50
+
+
+def legacy_content_based(items, calories, spices, vegTypesArray):
+    """The per-request ranking the display route used before the index: fit a scaler, then cosine similarity"""
+    if not items:
+        return []
+    
+    # Create feature vectors for all items
+    item_features = []
+    for item in items:
+        if not item.in_stock or not item.is_active:
+            continue
+            
+        spiciness_map = {'high': 1.0, 'medium': 0.5, 'low': 0.0, None: 0.0}
+        veg_pref_map = {'veg': 1, 'non-veg': 0, None: 0}
+        spiciness_val = spiciness_map.get(item.spiciness, 0.0)
+        veg_pref_val = veg_pref_map.get(item.is_veg, 0)
+        
+        feature_vector = [
+            item.calories or 0,
+            veg_pref_val,
+            spiciness_val
+        ]
+        item_features.append(feature_vector)
+    
+    if not item_features:
+        return []
+    
+    if calories:
+        avg_calories = sum(calories) / len(calories)
+    else:
+        avg_calories = 500
+
+    if vegTypesArray:
+        veg_pref = sum(veg_pref_map.get(veg_type, 0) for veg_type in vegTypesArray) / len(vegTypesArray)
+    else:
+        veg_pref = 0.5
+    
+    if spices:
+        avg_spiciness = sum(spiciness_map.get(spice, 0) for spice in spices) / len(spices)
+    else:
+        avg_spiciness = 0.25
+
+    
+    
+    user_vector = [avg_calories, veg_pref, avg_spiciness]
+    
+    scaler = StandardScaler()
+    item_features_scaled = scaler.fit_transform(item_features)
+    user_vector_scaled = scaler.transform([user_vector])[0]
+    
+    similarities = cosine_similarity([user_vector_scaled], item_features_scaled)[0]
+    
+    active_items = [item for item in items if item.in_stock and item.is_active]
+    item_scores = list(zip(active_items, similarities))
+    item_scores.sort(key=lambda x: x[1], reverse=True)
+    
+    return [item for item, _ in item_scores]
+
+
+def make_items(n: int):
+    return [
+        SimpleNamespace(
+            id=uuid.uuid4(),
+            calories=random.choice([None, random.uniform(100, 1200)]),
+            is_veg=random.random() < 0.5,
+            spiciness=random.choice(["low", "medium", "high", None]),
+            in_stock=random.random() < 0.95,
+            is_active=random.random() < 0.95,
+        )
+        for _ in range(n)
+    ]
+
+
+def timed(fn, repeats: int = REPEATS) -> float:
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+def main():
+    random.seed(7)
+    calories = [450, 620, 380]
+    spices = ["medium", "high"]
+    veg_types = ["veg"]
+    user_vector = build_user_vector(calories, spices, veg_types)
+
+    print(f"{'items':>6} {'old (ms)':>10} {'new (ms)':>10} {'build (ms)':>11} {'speedup':>8}")
+    for size in MENU_SIZES:
+        items = make_items(size)
+        old = timed(lambda: legacy_content_based(items, calories, spices, veg_types))
+        build = timed(lambda: MessRecommendationIndex(items), repeats=5)
+        index = MessRecommendationIndex(items)
+        new = timed(lambda: index.rank(items, user_vector))
+        print(f"{size:>6} {old:>10.3f} {new:>10.3f} {build:>11.3f} {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -27,10 +27,48 @@ class Settings(BaseSettings):
             
         # Build PostgreSQL connection string with SSL parameters for Neon
         return f"postgresql+asyncpg://{info.data.get('POSTGRES_USER')}:{info.data.get('PGPASSWORD').get_secret_value()}@{info.data.get('POSTGRES_HOST')}:{info.data.get('POSTGRES_PORT')}/{info.data.get('POSTGRES_DB')}?sslmode={info.data.get('SSL_MODE')}"
+    # Optional read replica for GET requests
+    REPLICA_DATABASE_URI: Optional[str] = None
+    READ_YOUR_WRITES_SECONDS: int = 5  # reads stay on the primary this long after a client's write
+
+    # Database connection pool
+    DB_POOL_SIZE: int = 20
+    DB_MAX_OVERFLOW: int = 0
+    DB_POOL_TIMEOUT: int = 30  # seconds to wait for a free connection
+    DB_POOL_PRE_PING: bool = True
+    DB_POOL_RECYCLE: int = 3600  # Recycle connections after 1 hour
+    SQL_SAMPLE_RATE: float = 0.0  # share of statements logged; can be changed at runtime via /metrics/sql-sample-rate
+
     # Security
     SECRET_KEY: SecretStr
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60
+    TOKEN_CACHE_TTL_SECONDS: int = 60  # how long a resolved access token skips the database
+    TOKEN_CACHE_MAX_SIZE: int = 10000
     
+    # Mess lookup by slug
+    MESS_CACHE_MAX_SIZE: int = 1000
+    MESS_CACHE_TTL_SECONDS: int = 300
+    MESS_NEGATIVE_CACHE_MAX_SIZE: int = 1000
+    MESS_NEGATIVE_CACHE_TTL_SECONDS: int = 30  # how long an unknown slug stays cached as missing
+
+    # Menu display snapshot cache
+    MENU_CACHE_TTL_SECONDS: int = 300
+    MENU_SEARCH_SIMILARITY_THRESHOLD: float = 0.3  # trigram word similarity for fuzzy name search
+
+    # Idempotency-Key replay for order creation and checkout
+    IDEMPOTENCY_KEY_TTL_SECONDS: int = 86400  # how long a key and its response are kept
+    IDEMPOTENCY_CACHE_MAX_SIZE: int = 10000  # responses held in memory per worker
+
+    # Analytics
+    ANALYTICS_TIMEZONE: str = "UTC"  # calendar days of the daily rollups
+    ANALYTICS_HOURLY_MAX_DAYS: int = 31  # longest range served with hourly buckets (read from orders, not rollups)
+
+    # Recommendations
+    RECOMMENDATION_CROSS_TENANT: bool = False  # also use neighbours from other messes
+    RECOMMENDATION_MAX_PARTITIONS: int = 32  # per-mess profile partitions kept in memory
+    RECOMMENDATION_ANN_MIN_USERS: int = 5000  # use a KD-tree for neighbour search from this many customers
+    RECOMMENDATION_PROFILE_TTL_SECONDS: int = 900  # reload a partition's profiles from the database after this long
+
     # CORS
     BACKEND_CORS_ORIGINS: List[str]=["http://localhost:8000","http://localhost:3000","http://localhost:3001"]
     
@@ -0,0 +1,100 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional
+import asyncpg
+from sqlalchemy import select, func
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from .session import RECENT_WRITERS_CHANNEL, connect_raw, on_recent_writers, replica_engine
+
+logger = logging.getLogger(__name__)
+
+
+async def notify(db: AsyncSession, channel: str, payload: str) -> None:
+    """
+    Queue a NOTIFY on db's transaction; Postgres delivers it to every listener on commit
+    """
+    await db.execute(select(func.pg_notify(channel, payload)))
+
+
+class NotificationListener:
+    """
+    One LISTEN connection per worker, outside the pool, dispatching NOTIFY payloads
+    to in-process caches. Notifications sent while disconnected are lost, so
+    subscribers get on_connect after every (re)connect and on_disconnect when it drops.
+    """
+
+    def __init__(self):
+        self._handlers: Dict[str, List[Callable[[str], None]]] = {}
+        self._on_connect: List[Callable[[], Awaitable[None]]] = []
+        self._on_disconnect: List[Callable[[], None]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(
+        self,
+        channel: str,
+        handler: Callable[[str], None],
+        on_connect: Optional[Callable[[], Awaitable[None]]] = None,
+        on_disconnect: Optional[Callable[[], None]] = None,
+    ) -> None:
+        self._handlers.setdefault(channel, []).append(handler)
+        if on_connect is not None:
+            self._on_connect.append(on_connect)
+        if on_disconnect is not None:
+            self._on_disconnect.append(on_disconnect)
+
+    def _dispatch(self, connection, pid, channel, payload) -> None:
+        for handler in self._handlers.get(channel, ()):
+            try:
+                handler(payload)
+            except Exception:
+                logger.exception("Handler for %s notification failed", channel)
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _listen(self) -> None:
+        delay = 1
+        while True:
+            try:
+                connection = await connect_raw()
+            except (OSError, asyncpg.PostgresError) as e:
+                logger.warning("Notification listener could not connect, retrying in %ss: %s", delay, e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60)
+                continue
+
+            closed = asyncio.Event()
+            connection.add_termination_listener(lambda _: closed.set())
+            try:
+                for channel in self._handlers:
+                    await connection.add_listener(channel, self._dispatch)
+                for callback in self._on_connect:
+                    await callback()
+                delay = 1
+                await closed.wait()
+                logger.warning("Notification listener connection lost, reconnecting")
+            except (OSError, asyncpg.PostgresError, SQLAlchemyError) as e:
+                logger.warning("Notification listener failed, retrying in %ss: %s", delay, e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60)
+            finally:
+                for callback in self._on_disconnect:
+                    callback()
+                if not connection.is_closed():
+                    await connection.close()
+
+
+listener = NotificationListener()
+if replica_engine is not None:
+    listener.subscribe(RECENT_WRITERS_CHANNEL, on_recent_writers)
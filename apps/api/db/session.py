@@ -1,37 +1,218 @@
-from typing import AsyncGenerator
+from contextlib import asynccontextmanager
+from contextvars import ContextVar, copy_context
+from typing import AsyncGenerator, AsyncIterator, Coroutine, List, Optional
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import asyncpg
+from fastapi import Request
+from sqlalchemy import event, exc, func, select
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 import ssl
 from core.config import settings
+from utils.lru import ExpiringLRU
+from .telemetry import pool_telemetry, sql_sampler
+
+logger = logging.getLogger(__name__)
 
 # Create SSL context for Neon
 ssl_context = ssl.create_default_context()
 ssl_context.check_hostname = False
 ssl_context.verify_mode = ssl.CERT_NONE
 
-engine = create_async_engine(
-    settings.DATABASE_URI.split("?")[0], 
-    echo=True,
-    pool_pre_ping=True,
-    pool_size=20,
-    max_overflow=0,
-    pool_recycle=3600,  # Recycle connections after 1 hour
-    connect_args={
-        "ssl": ssl_context,
-        "server_settings": {
-            "application_name": "fastapi_app",
-        }
-    }
-)
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """
+    Queue pool that reports how long each checkout waited and whether it needed an overflow connection
+    """
+
+    def _do_get(self):
+        started = time.perf_counter()
+        overflow = self._overflow
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            pool_telemetry.timeouts += 1
+            raise
+        pool_telemetry.record_checkout(time.perf_counter() - started, self._overflow > overflow and self._overflow > 0)
+        return connection
+
+
+def build_engine(uri: str, application_name: str, **pool_options):
+    return create_async_engine(
+        uri.split("?")[0],
+        echo=False,  # use SQL_SAMPLE_RATE / sql_sampler instead
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        connect_args={
+            "ssl": ssl_context,
+            "server_settings": {
+                "application_name": application_name,
+            }
+        },
+        **pool_options,
+    )
+
+
+engine = build_engine(settings.DATABASE_URI, "fastapi_app", poolclass=InstrumentedPool)
+replica_engine = build_engine(settings.REPLICA_DATABASE_URI, "fastapi_app_replica") if settings.REPLICA_DATABASE_URI else None
+
+pool_telemetry.instrument(engine.sync_engine.pool)
+sql_sampler.instrument(engine.sync_engine)
+if replica_engine is not None:
+    sql_sampler.instrument(replica_engine.sync_engine)
+
+
+# Clients (by IP and by token) that wrote recently; their reads stay on the primary
+# until the replica has caught up. Each worker marks its own writers at once and
+# learns about the others' through RECENT_WRITERS_CHANNEL, delivered with the
+# writing commit, so a read sent to another worker right after is covered too
+# once the notification has arrived.
+recent_writers = ExpiringLRU(maxsize=100000, ttl=settings.READ_YOUR_WRITES_SECONDS)
+RECENT_WRITERS_CHANNEL = "recent_writers"
+
+
+def on_recent_writers(payload: str) -> None:
+    try:
+        keys = json.loads(payload)
+    except ValueError:
+        logger.warning("Ignoring malformed %s notification: %r", RECENT_WRITERS_CHANNEL, payload)
+        return
+    for key in keys:
+        recent_writers.put(key, True)
+
+
+class RoutingSession(Session):
+    """
+    Sends a session's statements to the replica given in info["replica"] until it
+    first writes (a flush, a DML statement, or a statement executed with
+    bind_arguments={"writes": True}, e.g. a SELECT over data-modifying CTEs); from
+    then on everything, reads included, goes to the primary, and the request's
+    clients are marked as recent writers, in every worker once the session commits.
+    Sessions without a replica behave like a plain Session on the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, writes=False, **kw):
+        replica = self.info.get("replica")
+        writing = writes or self._flushing or getattr(clause, "is_dml", False)
+        if writing and not self.info.get("wrote"):
+            self.info["wrote"] = True
+            for key in self.info.get("client_keys", ()):
+                recent_writers.put(key, True)
+        if replica is None or self.info.get("wrote"):
+            return engine.sync_engine
+        return replica.sync_engine
+
+
+@event.listens_for(RoutingSession, "before_commit")
+def publish_recent_writers(session: RoutingSession) -> None:
+    """Queue the NOTIFY for the session's clients once it has written"""
+    keys = session.info.get("client_keys")
+    if replica_engine is None or not keys or not session.info.get("wrote") or session.info.get("published"):
+        return
+    session.info["published"] = True
+    session.execute(select(func.pg_notify(RECENT_WRITERS_CHANNEL, json.dumps(keys))))
+
 
 AsyncSessionLocal = sessionmaker(
     engine, 
     class_=AsyncSession, 
+    sync_session_class=RoutingSession,
     expire_on_commit=False,
     future=True
 )
 
 
-async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
+def client_keys(request: Request) -> List[str]:
+    keys = []
+    if request.client is not None:
+        keys.append(f"ip:{request.client.host}")
+    authorization = request.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        keys.append("token:" + hashlib.sha256(authorization[7:].encode()).hexdigest())
+    return keys
+
+
+def replica_for(request: Request, keys: List[str]):
+    """
+    The replica engine for read requests from clients without a recent write, else None
+    """
+    if replica_engine is None or request.method not in ("GET", "HEAD"):
+        return None
+    if any(recent_writers.get(key)[0] for key in keys):
+        return None
+    return replica_engine
+
+
+async def connect_raw() -> asyncpg.Connection:
+    """
+    Dedicated asyncpg connection outside the pool, for long-lived LISTEN sessions
+    """
+    return await asyncpg.connect(
+        settings.DATABASE_URI.split("?")[0].replace("postgresql+asyncpg", "postgresql"),
+        ssl=ssl_context,
+        server_settings={"application_name": "fastapi_app_listener"},
+    )
+
+
+# The session of the request being handled, so helpers outside the dependency
+# graph (cached lookups, recommendation loaders) reuse its connection
+_request_session: ContextVar[Optional[AsyncSession]] = ContextVar("request_session", default=None)
+
+
+async def get_async_session(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    """
+    One session per request: FastAPI caches this dependency within a request, and
+    the session is also published to use_session() for code that is not injected.
+    GET/HEAD requests read from the replica, when configured (see RoutingSession).
+    """
+    session = _request_session.get()
+    if session is not None:
+        yield session
+        return
+
+    async with AsyncSessionLocal() as session:
+        keys = client_keys(request)
+        session.info["client_keys"] = keys
+        session.info["replica"] = replica_for(request, keys)
+        token = _request_session.set(session)
+        try:
+            yield session
+        finally:
+            try:
+                _request_session.reset(token)
+            except ValueError:
+                # Teardown ran in a different context than setup
+                _request_session.set(None)
+
+
+@asynccontextmanager
+async def use_session() -> AsyncIterator[AsyncSession]:
+    """
+    The current request's session, or a short-lived one outside a request (startup, listeners)
+    """
+    session = _request_session.get()
+    if session is not None:
+        yield session
+        return
+
     async with AsyncSessionLocal() as session:
-        yield session
\ No newline at end of file
+        yield session
+
+
+def spawn_detached(coro: Coroutine) -> asyncio.Task:
+    """
+    Run coro as a task outside the current request's session, so use_session()
+    inside it opens its own. Tasks otherwise copy the request's context, and would
+    query its session concurrently with the request or after it closed.
+    """
+    context = copy_context()
+    context.run(_request_session.set, None)
+    return asyncio.get_running_loop().create_task(coro, context=context)
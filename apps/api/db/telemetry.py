@@ -0,0 +1,141 @@
+import logging
+import logging.handlers
+import queue
+import random
+import time
+from contextvars import ContextVar
+from typing import Dict, Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+from core.config import settings
+
+# ASGI scope of the request being handled; the route template is resolved lazily
+# because routing happens after the telemetry middleware runs
+current_scope: ContextVar[Optional[dict]] = ContextVar("current_scope", default=None)
+
+
+def current_route() -> str:
+    scope = current_scope.get()
+    if scope is None:
+        return "background"
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class _Timing:
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "avg_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "max_ms": self.max * 1000,
+        }
+
+
+class PoolTelemetry:
+    """
+    Connection pool counters: checkout wait, overflow and timeouts (recorded by
+    InstrumentedPool), and connection hold time per route (pool checkout/checkin events)
+    """
+
+    def __init__(self):
+        self.pool: Optional[Pool] = None
+        self.checkout_wait = _Timing()
+        self.overflows = 0
+        self.timeouts = 0
+        self.hold_by_route: Dict[str, _Timing] = {}
+
+    def instrument(self, pool: Pool) -> None:
+        self.pool = pool
+        event.listen(pool, "checkout", self._on_checkout)
+        event.listen(pool, "checkin", self._on_checkin)
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy) -> None:
+        connection_record.info["checked_out_at"] = time.perf_counter()
+
+    def _on_checkin(self, dbapi_connection, connection_record) -> None:
+        started = connection_record.info.pop("checked_out_at", None)
+        if started is None:
+            return
+        route = current_route()
+        timing = self.hold_by_route.get(route)
+        if timing is None:
+            timing = self.hold_by_route[route] = _Timing()
+        timing.add(time.perf_counter() - started)
+
+    def record_checkout(self, waited: float, overflowed: bool) -> None:
+        self.checkout_wait.add(waited)
+        if overflowed:
+            self.overflows += 1
+
+    def snapshot(self) -> Dict:
+        pool = self.pool
+        return {
+            "size": pool.size() if pool is not None else 0,
+            "in_use": pool.checkedout() if pool is not None else 0,
+            "idle": pool.checkedin() if pool is not None else 0,
+            "overflow": max(pool.overflow(), 0) if pool is not None else 0,
+            "overflow_events": self.overflows,
+            "timeouts": self.timeouts,
+            "checkout_wait": self.checkout_wait.as_dict(),
+            "hold_by_route": {route: timing.as_dict() for route, timing in self.hold_by_route.items()},
+        }
+
+
+class SQLSampler:
+    """
+    Replacement for engine echo: logs a random sample of statements with their
+    duration. Records go through a queue and are written by a background thread,
+    so the request path never blocks on log I/O. rate can be changed at runtime.
+    """
+
+    def __init__(self, rate: float = 0.0, logger_name: str = "sql.sample"):
+        self.rate = rate
+        self.logger = logging.getLogger(logger_name)
+        self.logger.propagate = False
+        self._queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+        self.logger.addHandler(logging.handlers.QueueHandler(self._queue))
+        self.logger.setLevel(logging.INFO)
+        self._writer: Optional[logging.handlers.QueueListener] = None
+
+    def instrument(self, engine: Engine) -> None:
+        event.listen(engine, "before_cursor_execute", self._before)
+        event.listen(engine, "after_cursor_execute", self._after)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        if self.rate > 0 and random.random() < self.rate:
+            conn.info["sql_sample_started"] = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        started = conn.info.pop("sql_sample_started", None)
+        if started is not None:
+            self.logger.info(
+                "%.1fms [%s] %s %r",
+                (time.perf_counter() - started) * 1000, current_route(), statement, parameters,
+            )
+
+    def start(self) -> None:
+        if self._writer is None:
+            self._writer = logging.handlers.QueueListener(self._queue, logging.StreamHandler())
+            self._writer.start()
+
+    def stop(self) -> None:
+        if self._writer is not None:
+            self._writer.stop()
+            self._writer = None
+
+
+pool_telemetry = PoolTelemetry()
+sql_sampler = SQLSampler(rate=settings.SQL_SAMPLE_RATE)
@@ -7,13 +7,16 @@ sys.path.append(os.path.dirname(__file__))
 
 from typing import Union
 from contextlib import asynccontextmanager
-from fastapi import  FastAPI
+from fastapi import  Depends, FastAPI, Query
 from core.socket import sio
 from fastapi.middleware.cors import CORSMiddleware
-from auth.security import fastapi_users
-from core.config import settings
+from auth.security import fastapi_users, current_superuser
 from auth.schemas import UserRead, UserUpdate
-from db.session import engine
+from db.session import engine, replica_engine
+from db.listener import listener
+from db.telemetry import pool_telemetry, sql_sampler
+from middleware.db_telemetry import DBTelemetryMiddleware
+from auth.token_cache import token_cache
 from core.schema import ResponseMessage
 from auth.routes import router as auth_router
 from upload.route import file_router
@@ -25,8 +28,14 @@ from analytics.routes import router as analytics_router
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    sql_sampler.start()
+    await listener.start()
     yield
+    await listener.stop()
+    sql_sampler.stop()
     await engine.dispose()
+    if replica_engine is not None:
+        await replica_engine.dispose()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -39,7 +48,10 @@ app.add_middleware(
     allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Order feed paging and conditional polling; replayed idempotent responses
+    expose_headers=["ETag", "X-Next-Cursor", "Idempotent-Replayed"],
 )
+app.add_middleware(DBTelemetryMiddleware)
 
 app.include_router(auth_router)
 app.include_router(file_router)
@@ -63,6 +75,16 @@ def read_root():
 async def health_check():
     return {"message": "API is running"}
 
+@app.get("/metrics", dependencies=[Depends(current_superuser)])
+async def metrics():
+    return {"token_cache": token_cache.stats(), "pool": pool_telemetry.snapshot()}
+
+@app.put("/metrics/sql-sample-rate", dependencies=[Depends(current_superuser)])
+async def set_sql_sample_rate(rate: float = Query(..., ge=0.0, le=1.0)):
+    """Log this share of SQL statements from now on (0 turns sampling off)"""
+    sql_sampler.rate = rate
+    return {"rate": rate}
+
 @app.get("/items/{item_id}")
 def read_item(item_id: int, q: Union[str, None] = None):
     return {"item_id": item_id, "q": q}
@@ -0,0 +1,78 @@
+import logging
+import time
+import uuid
+from typing import Dict, Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from core.config import settings
+from db.listener import listener, notify
+from .models import MenuItem, MenuItemCategory
+from .schema import MenuItemSnapshot
+from .columns import MenuColumns
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = "menu_cache"
+
+
+def to_snapshot(item: MenuItem) -> MenuItemSnapshot:
+    snapshot = MenuItemSnapshot.model_validate(item, from_attributes=True)
+    snapshot.category_slug = item.category.slug if item.category else None
+    return snapshot
+
+
+class MenuSnapshotCache:
+    """
+    Per-mess snapshot of the display menu, held as MenuColumns for in-memory filtering.
+    The menu item and category write routes invalidate it locally after commit, and
+    in every other worker through a Postgres NOTIFY sent in the writing transaction;
+    ttl bounds staleness only while the listener is disconnected.
+    """
+
+    def __init__(self, ttl: int = 300, channel: str = NOTIFY_CHANNEL):
+        self.ttl = ttl
+        self.channel = channel
+        self._snapshots: Dict[uuid.UUID, Tuple[float, MenuColumns]] = {}
+
+    async def get(self, db: AsyncSession, mess_id: uuid.UUID) -> MenuColumns:
+        cached = self._snapshots.get(mess_id)
+        if cached is not None and time.monotonic() - cached[0] < self.ttl:
+            return cached[1]
+
+        result = await db.execute(
+            select(MenuItem).options(
+                selectinload(MenuItem.category).load_only(MenuItemCategory.name, MenuItemCategory.slug),
+            ).filter(MenuItem.mess_id == mess_id)
+        )
+        snapshot = MenuColumns([to_snapshot(item) for item in result.scalars().all()])
+        self._snapshots[mess_id] = (time.monotonic(), snapshot)
+        return snapshot
+
+    def invalidate(self, mess_id: Optional[uuid.UUID] = None) -> None:
+        if mess_id is None:
+            self._snapshots.clear()
+        else:
+            self._snapshots.pop(mess_id, None)
+
+    async def notify(self, db: AsyncSession, mess_id: uuid.UUID) -> None:
+        """
+        Queue an invalidation for all workers; Postgres delivers it when db commits
+        """
+        await notify(db, self.channel, str(mess_id))
+
+    def on_notify(self, payload: str) -> None:
+        try:
+            mess_id = uuid.UUID(payload)
+        except ValueError:
+            logger.warning("Ignoring malformed %s notification: %r", self.channel, payload)
+            return
+        self.invalidate(mess_id)
+
+    async def on_connect(self) -> None:
+        # Menu writes published while we were disconnected were missed
+        self.invalidate()
+
+
+menu_cache = MenuSnapshotCache(ttl=settings.MENU_CACHE_TTL_SECONDS)
+listener.subscribe(menu_cache.channel, menu_cache.on_notify, on_connect=menu_cache.on_connect)
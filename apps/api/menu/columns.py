@@ -0,0 +1,186 @@
+import re
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from .schema import MenuItemSnapshot
+
+SPICE_LEVELS = ('low', 'medium', 'high')
+NGRAM = 3
+WORD = re.compile(r"[^\W_]+")
+
+
+def ngrams(text: str, n: int = NGRAM) -> set:
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def word_trigrams(text: Optional[str]) -> set:
+    """
+    Trigrams as pg_trgm extracts them: lowercase alphanumeric words,
+    each padded with two spaces in front and one behind
+    """
+    grams = set()
+    for word in WORD.findall((text or "").lower()):
+        grams |= ngrams(f"  {word} ")
+    return grams
+
+
+def build_postings(texts) -> Dict[str, np.ndarray]:
+    postings = defaultdict(list)
+    for row, text in enumerate(texts):
+        for gram in word_trigrams(text):
+            postings[gram].append(row)
+    return {gram: np.array(rows, dtype=np.int64) for gram, rows in postings.items()}
+
+
+class MenuColumns:
+    """
+    Columnar view of a menu snapshot.
+    Every display filter is a boolean mask over the item rows, so any combination
+    resolves by mask intersection; facet counts come from the same masks.
+    """
+
+    def __init__(self, items: List[MenuItemSnapshot]):
+        self.items = items
+        self.by_id = {item.id: item for item in items}
+        n = len(items)
+        self._rows = np.empty(n, dtype=object)
+        self._rows[:] = items
+
+        self.calories = np.array([item.calories if item.calories is not None else np.nan for item in items], dtype=np.float64)
+        self.prices = np.array([item.price for item in items], dtype=np.float64)
+        self.is_veg = np.array([bool(item.is_veg) for item in items], dtype=bool)
+
+        spice_codes = {level: code for code, level in enumerate(SPICE_LEVELS)}
+        self.spice = np.array([spice_codes.get(item.spiciness, -1) for item in items], dtype=np.int8)
+
+        self.category_slugs: List[Optional[str]] = []
+        category_codes: Dict[Optional[str], int] = {}
+        codes = []
+        for item in items:
+            if item.category_slug not in category_codes:
+                category_codes[item.category_slug] = len(self.category_slugs)
+                self.category_slugs.append(item.category_slug)
+            codes.append(category_codes[item.category_slug])
+        self.category_codes = category_codes
+        self.category = np.array(codes, dtype=np.int32)
+
+        self.names = np.array([item.name.lower() for item in items], dtype=str)
+        # One trigram index per text column, shared by substring and fuzzy name matching
+        self.name_trigrams = build_postings(item.name for item in items)
+        self.description_trigrams = build_postings(item.description for item in items)
+
+        self._all = np.ones(n, dtype=bool)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def name_mask(self, q: str) -> np.ndarray:
+        """
+        Rows whose lowercase name contains q. Candidates come from the word trigram
+        index: every trigram of q made only of word characters lies inside one word
+        of a matching name, so it is among that name's word trigrams.
+        """
+        needle = q.lower()
+        mask = np.zeros(len(self.items), dtype=bool)
+        grams = {gram for gram in ngrams(needle) if WORD.fullmatch(gram)}
+        if grams:
+            lists = [self.name_trigrams.get(gram) for gram in grams]
+            if any(rows is None for rows in lists):
+                return mask
+            lists.sort(key=len)
+            candidates = lists[0]
+            for rows in lists[1:]:
+                candidates = np.intersect1d(candidates, rows, assume_unique=True)
+        else:
+            candidates = np.arange(len(self.items))
+        if len(candidates):
+            mask[candidates[np.char.find(self.names[candidates], needle) >= 0]] = True
+        return mask
+
+    def _trigram_scores(self, postings: Dict[str, np.ndarray], grams: set) -> np.ndarray:
+        hits = [postings[gram] for gram in grams if gram in postings]
+        if not hits:
+            return np.zeros(len(self.items))
+        return np.bincount(np.concatenate(hits), minlength=len(self.items)) / len(grams)
+
+    def similarity(self, q: str) -> np.ndarray:
+        """
+        Per-row fuzzy match score of q against name and description: the share of
+        q's trigrams found in the text (close to pg_trgm word_similarity)
+        """
+        grams = word_trigrams(q)
+        if not grams:
+            return np.zeros(len(self.items))
+        return np.maximum(
+            self._trigram_scores(self.name_trigrams, grams),
+            self._trigram_scores(self.description_trigrams, grams),
+        )
+
+    def category_mask(self, category: str) -> np.ndarray:
+        if not category or category == "all":
+            return self._all
+        code = self.category_codes.get(category)
+        if code is None:
+            return ~self._all
+        return self.category == code
+
+    def spice_mask(self, spiceLevel: str) -> np.ndarray:
+        if not spiceLevel:
+            return self._all
+        if spiceLevel not in SPICE_LEVELS:
+            return ~self._all
+        return self.spice == SPICE_LEVELS.index(spiceLevel)
+
+    def filter(
+        self,
+        calorieMins: int = 0,
+        calorieMaxes: int = 0,
+        spiceLevel: str = "",
+        vegType: str = "",
+        category: str = "",
+        q: str = "",
+        similarity_threshold: float = 0.3,
+    ) -> Tuple[List[MenuItemSnapshot], Dict[str, Dict[str, int]]]:
+        """
+        Items matching every filter, plus facet counts per category slug and spice level.
+        Each facet is counted with all other filters applied, so counts show what
+        selecting that value would return.
+
+        q matches names containing it, or names/descriptions with trigram similarity of
+        at least similarity_threshold; matches are returned best first, substring hits leading.
+        """
+        base = self._all.copy()
+        relevance = None
+        if q:
+            substring = self.name_mask(q)
+            relevance = self.similarity(q) + substring
+            base &= substring | (relevance >= similarity_threshold)
+        # NaN comparisons are False, so items without calories never match a bound
+        if calorieMaxes:
+            base &= self.calories <= calorieMaxes
+        if calorieMins:
+            base &= self.calories >= calorieMins
+        if vegType:
+            base &= self.is_veg == (vegType == "veg")
+
+        category_mask = self.category_mask(category)
+        spice_mask = self.spice_mask(spiceLevel)
+        mask = base & category_mask & spice_mask
+
+        category_counts = np.bincount(self.category[base & spice_mask], minlength=len(self.category_slugs))
+        spice_rows = self.spice[base & category_mask]
+        spice_counts = np.bincount(spice_rows[spice_rows >= 0], minlength=len(SPICE_LEVELS))
+
+        facets = {
+            "categories": {
+                slug: int(count)
+                for slug, count in zip(self.category_slugs, category_counts)
+                if slug is not None
+            },
+            "spice_levels": dict(zip(SPICE_LEVELS, spice_counts.tolist())),
+        }
+        if relevance is None:
+            return self._rows[mask].tolist(), facets
+        rows = np.flatnonzero(mask)
+        rows = rows[np.argsort(-relevance[rows], kind="stable")]
+        return self._rows[rows].tolist(), facets
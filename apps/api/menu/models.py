@@ -1,4 +1,4 @@
-from sqlalchemy import ARRAY, Column, Float, String, Boolean, DateTime, ForeignKey, Enum as SqlEnum
+from sqlalchemy import ARRAY, Column, Float, String, Boolean, DateTime, ForeignKey, Index, Enum as SqlEnum
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from datetime import datetime,UTC, timezone
@@ -33,6 +33,11 @@ class MenuItem(Base):
     orders = relationship("OrderItem", back_populates="menu_item")
     mess = relationship("Mess", back_populates="menu_items")
 
+    __table_args__ = (
+        Index('ix_menu_item_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        Index('ix_menu_item_description_trgm', 'description', postgresql_using='gin', postgresql_ops={'description': 'gin_trgm_ops'}),
+    )
+
 
 
 class MenuItemCategory(Base):
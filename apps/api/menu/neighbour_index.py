@@ -0,0 +1,22 @@
+import numpy as np
+from sklearn.neighbors import KDTree
+
+
+class NeighbourIndex:
+    """
+    KD-tree over unit-length preference vectors.
+    For unit vectors euclidean distance is monotonic in cosine similarity
+    (|a - b|^2 = 2 - 2 cos), so the nearest rows are also the most similar ones.
+    """
+
+    def __init__(self, vectors: np.ndarray, leaf_size: int = 40):
+        self.size = len(vectors)
+        self.tree = KDTree(vectors, leaf_size=leaf_size) if self.size else None
+
+    def query(self, vector: np.ndarray, k: int) -> np.ndarray:
+        """Rows of the k nearest indexed vectors"""
+        if self.tree is None:
+            return np.empty(0, dtype=np.int64)
+        k = min(k, self.size)
+        _, rows = self.tree.query(vector.reshape(1, -1), k=k)
+        return rows[0]
@@ -0,0 +1,245 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
+from .models import MenuItem
+from .neighbour_index import NeighbourIndex
+
+PROFILE_FEATURES = ('avg_calories', 'spice_low', 'spice_medium', 'spice_high', 'veg_ratio')
+SPICE_BUCKETS = {'low': 0, 'medium': 1, 'high': 2, None: 0}
+
+# Columns of the running sums matrix
+CALORIE_QUANTITY, QUANTITY, SPICE_LOW, SPICE_MEDIUM, SPICE_HIGH, VEG_QUANTITY = range(6)
+SUM_COLUMNS = 6
+
+# Menu item columns a line's contribution is computed from
+ITEM_FEATURES = ('calories', 'spiciness', 'is_veg')
+
+
+def spice_bucket(spiciness) -> int:
+    return SPICE_BUCKETS.get(spiciness, 0)
+
+
+def line_delta(item, quantity: int) -> Optional[np.ndarray]:
+    """
+    Running sums contributed by one order line; None for items without calories
+    """
+    if item is None or item.calories is None:
+        return None
+    delta = np.zeros(SUM_COLUMNS)
+    delta[CALORIE_QUANTITY] = item.calories * quantity
+    delta[QUANTITY] = quantity
+    delta[SPICE_LOW + spice_bucket(item.spiciness)] = quantity
+    if item.is_veg:
+        delta[VEG_QUANTITY] = quantity
+    return delta
+
+
+class PreferenceProfiles:
+    """
+    User preference profiles kept as contiguous NumPy arrays.
+
+    `sums` holds per-user running totals (calorie-weighted quantity, quantity,
+    quantity per spice bucket, veg quantity); `matrix` holds the derived
+    profiles in PROFILE_FEATURES order. Row i belongs to user_ids[i].
+
+    Once build_neighbour_index() has been called, similar-user search queries a
+    KD-tree instead of scanning every row. Rows changed since the last build are
+    always re-checked exactly, and the tree is rebuilt when more than
+    rebuild_fraction of it is stale.
+    """
+
+    oversample = 4
+    rebuild_fraction = 0.1
+
+    def __init__(self, user_ids: Iterable[str] = (), sums: Optional[np.ndarray] = None,
+                 interactions: Optional[np.ndarray] = None):
+        self.user_ids: List[str] = [str(user_id) for user_id in user_ids]
+        self.rows: Dict[str, int] = {user_id: i for i, user_id in enumerate(self.user_ids)}
+        n = len(self.user_ids)
+        self._sums = np.zeros((max(n, 16), SUM_COLUMNS))
+        self._interactions = np.zeros(max(n, 16), dtype=np.int64)
+        if sums is not None:
+            self._sums[:n] = np.asarray(sums, dtype=np.float64).reshape(n, SUM_COLUMNS)
+        if interactions is not None:
+            self._interactions[:n] = interactions
+        self._dirty = True
+        self._neighbours: Optional[NeighbourIndex] = None
+        self._stale_rows: Set[int] = set()
+
+    @property
+    def sums(self) -> np.ndarray:
+        return self._sums[:len(self.user_ids)]
+
+    @property
+    def interactions(self) -> np.ndarray:
+        return self._interactions[:len(self.user_ids)]
+
+    @classmethod
+    def from_interactions(cls, interactions) -> "PreferenceProfiles":
+        """
+        Build profiles from (user_id, calories, spiciness, is_veg, quantity, lines)
+        rows; lines is how many order lines a row adds up, and is what a user's
+        interaction count counts, as in PreferenceProfileStore.record()
+        """
+        if not interactions:
+            return cls()
+
+        user_keys = np.array([str(row.user_id) for row in interactions])
+        calories = np.array([row.calories for row in interactions], dtype=np.float64)
+        quantity = np.array([row.quantity for row in interactions], dtype=np.float64)
+        buckets = np.array([spice_bucket(row.spiciness) for row in interactions], dtype=np.int64)
+        is_veg = np.array([bool(row.is_veg) for row in interactions])
+        lines = np.array([row.lines for row in interactions], dtype=np.int64)
+
+        user_ids, inverse = np.unique(user_keys, return_inverse=True)
+        n = len(user_ids)
+
+        sums = np.zeros((n, SUM_COLUMNS))
+        sums[:, CALORIE_QUANTITY] = np.bincount(inverse, weights=calories * quantity, minlength=n)
+        sums[:, QUANTITY] = np.bincount(inverse, weights=quantity, minlength=n)
+        for bucket, column in ((0, SPICE_LOW), (1, SPICE_MEDIUM), (2, SPICE_HIGH)):
+            sums[:, column] = np.bincount(inverse, weights=quantity * (buckets == bucket), minlength=n)
+        sums[:, VEG_QUANTITY] = np.bincount(inverse, weights=quantity * is_veg, minlength=n)
+
+        return cls(user_ids.tolist(), sums, np.bincount(inverse, weights=lines, minlength=n).astype(np.int64))
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+    def __contains__(self, user_id) -> bool:
+        row = self.rows.get(str(user_id))
+        return row is not None and self._sums[row, QUANTITY] > 0
+
+    def _row_for(self, user_id) -> int:
+        key = str(user_id)
+        row = self.rows.get(key)
+        if row is None:
+            row = len(self.user_ids)
+            if row == len(self._sums):
+                self._sums = np.concatenate([self._sums, np.zeros_like(self._sums)])
+                self._interactions = np.concatenate([self._interactions, np.zeros_like(self._interactions)])
+            self.user_ids.append(key)
+            self.rows[key] = row
+        return row
+
+    def apply(self, user_id, delta: np.ndarray, interactions: int = 0) -> None:
+        """
+        Add a delta to one user's running sums; derived profiles refresh lazily
+        """
+        row = self._row_for(user_id)
+        self._sums[row] += delta
+        self._interactions[row] += interactions
+        self._dirty = True
+        if self._neighbours is not None:
+            self._stale_rows.add(row)
+
+    def _refresh(self) -> None:
+        """
+        Recompute derived profiles and their standardized, unit-length form
+        """
+        if not self._dirty:
+            return
+        self._dirty = False
+        quantity = self.sums[:, QUANTITY]
+        safe_quantity = np.where(quantity > 0, quantity, 1.0)
+
+        self.matrix = np.empty((len(self.user_ids), len(PROFILE_FEATURES)))
+        self.matrix[:, 0] = self.sums[:, CALORIE_QUANTITY] / safe_quantity
+        self.matrix[:, 1] = self.sums[:, SPICE_LOW] / safe_quantity
+        self.matrix[:, 2] = self.sums[:, SPICE_MEDIUM] / safe_quantity
+        self.matrix[:, 3] = self.sums[:, SPICE_HIGH] / safe_quantity
+        self.matrix[:, 4] = self.sums[:, VEG_QUANTITY] / safe_quantity
+        self.active = quantity > 0
+
+        # Same statistics as StandardScaler over all users
+        if self.active.any():
+            mean = self.matrix[self.active].mean(axis=0)
+            scale = self.matrix[self.active].std(axis=0)
+        else:
+            mean, scale = np.zeros(len(PROFILE_FEATURES)), np.ones(len(PROFILE_FEATURES))
+        scale[scale == 0.0] = 1.0
+        scaled = (self.matrix - mean) / scale
+        norms = np.linalg.norm(scaled, axis=1, keepdims=True)
+        norms[norms == 0.0] = 1.0
+        self.normalized = scaled / norms
+
+    def profile(self, user_id) -> Dict:
+        self._refresh()
+        row = self.rows[str(user_id)]
+        profile = dict(zip(PROFILE_FEATURES, self.matrix[row].tolist()))
+        profile['total_orders'] = int(self.interactions[row])
+        return profile
+
+    @property
+    def has_neighbour_index(self) -> bool:
+        return self._neighbours is not None
+
+    def build_neighbour_index(self) -> None:
+        """
+        (Re)build the KD-tree from the current profiles
+        """
+        self._refresh()
+        self._neighbours = NeighbourIndex(self.normalized)
+        self._stale_rows = set()
+
+    def drop_neighbour_index(self) -> None:
+        self._neighbours = None
+        self._stale_rows = set()
+
+    def _candidate_rows(self, target: int, top_k: int) -> np.ndarray:
+        if self._neighbours is None:
+            return np.arange(len(self.user_ids))
+        if len(self._stale_rows) > self.rebuild_fraction * max(self._neighbours.size, 1):
+            self.build_neighbour_index()
+        candidates = self._neighbours.query(self.normalized[target], k=top_k * self.oversample + 1)
+        if self._stale_rows:
+            candidates = np.union1d(candidates, np.fromiter(self._stale_rows, dtype=np.int64))
+        return candidates
+
+    def similar_users(self, user_id, top_k: int = 5, min_similarity: float = 0.1) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Rows and cosine similarities of the top_k users most similar to user_id
+        """
+        target = self.rows.get(str(user_id))
+        if target is None or len(self.user_ids) < 2:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        self._refresh()
+
+        candidates = self._candidate_rows(target, top_k)
+        similarities = self.normalized[candidates] @ self.normalized[target]
+        keep = (similarities > min_similarity) & self.active[candidates] & (candidates != target)
+        candidates, similarities = candidates[keep], similarities[keep]
+        if not len(candidates):
+            return candidates, similarities
+
+        order = np.argsort(-similarities, kind="stable")[:top_k]
+        return candidates[order], similarities[order]
+
+    def score_items(self, items: List[MenuItem], rows: np.ndarray, similarities: np.ndarray) -> np.ndarray:
+        """
+        Score items by how well they match the preferences of the given users,
+        weighted by similarity. Inactive, out of stock or calorie-less items score 0.
+        """
+        if not items or not len(rows):
+            return np.zeros(len(items))
+        self._refresh()
+
+        valid = np.array([bool(item.in_stock and item.is_active and item.calories) for item in items])
+        calories = np.array([item.calories if valid[i] else 0.0 for i, item in enumerate(items)], dtype=np.float64)
+        buckets = np.array([spice_bucket(item.spiciness) for item in items], dtype=np.int64)
+        is_veg = np.array([bool(item.is_veg) for item in items])
+
+        profiles = self.matrix[rows]
+        avg_calories = profiles[:, 0]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            calorie_diff = np.abs(calories[:, None] - avg_calories[None, :]) / avg_calories[None, :]
+        calorie_match = np.where(avg_calories[None, :] > 0, np.maximum(0.0, 1.0 - calorie_diff), 0.0)
+
+        spice_match = profiles[:, 1 + buckets].T
+        veg_ratio = profiles[:, 4][None, :]
+        veg_match = np.where(is_veg[:, None], veg_ratio, 1.0 - veg_ratio)
+
+        preference = calorie_match * 0.4 + spice_match * 0.3 + veg_match * 0.3
+        weights = similarities / similarities.sum()
+        scores = preference @ weights
+        scores[~valid] = 0.0
+        return scores
@@ -0,0 +1,184 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import select, func
+from core.config import settings
+from db.session import spawn_detached, use_session
+from orders.models import Order, OrderItem
+from auth.models import Customer
+from .models import MenuItem
+from .preference_profiles import PreferenceProfiles, SUM_COLUMNS, line_delta
+
+
+async def load_user_preference_profiles(mess_id: Optional[uuid.UUID] = None) -> PreferenceProfiles:
+    """
+    Full aggregation of ordered item features per user, for one mess or (mess_id=None) all messes.
+    Only used to seed a partition; afterwards profiles are maintained from order events.
+    """
+    async with use_session() as db:
+        query = select(
+            Customer.id.label('user_id'),
+            MenuItem.calories,
+            MenuItem.spiciness,
+            MenuItem.is_veg,
+            func.sum(OrderItem.quantity).label('quantity'),
+            func.count(OrderItem.id).label('lines')
+        ).select_from(Customer).join(Order).join(OrderItem).join(MenuItem).filter(
+            Order.is_cancelled == False,
+            OrderItem.is_cancelled == False,
+            MenuItem.calories.isnot(None)
+        ).group_by(Customer.id, MenuItem.calories, MenuItem.spiciness, MenuItem.is_veg)
+
+        if mess_id is not None:
+            query = query.filter(Customer.mess_id == mess_id)
+
+        result = await db.execute(query)
+        return PreferenceProfiles.from_interactions(result.all())
+
+
+class PreferenceProfileStore:
+    """
+    Preference profiles partitioned by mess, loaded on first use and evicted least recently used first.
+    Partitions are updated incrementally by the order routes; each order event only touches
+    the running sums of the customer who placed the order.
+
+    Events are only seen by the worker that handled them, so a partition is reloaded
+    from the database once it is older than ttl; that is how workers converge. Events
+    recorded while a load is running may be missing from its query, and are applied
+    to the new partition when it is installed.
+
+    With cross_tenant enabled a single platform-wide partition (key None) is used instead,
+    so neighbours can come from any mess.
+    """
+
+    def __init__(self, max_partitions: int = 32, cross_tenant: bool = False, ann_min_users: int = 5000,
+                 ttl: int = 900):
+        self.max_partitions = max_partitions
+        self.cross_tenant = cross_tenant
+        self.ann_min_users = ann_min_users
+        self.ttl = ttl
+        self._partitions: "OrderedDict[Optional[uuid.UUID], PreferenceProfiles]" = OrderedDict()
+        self._expires: Dict[Optional[uuid.UUID], float] = {}
+        self._loading: Dict[Optional[uuid.UUID], asyncio.Future] = {}
+        # Bumped on every eviction so loads that raced with a menu edit are not installed
+        self._version = 0
+        # (customer_id, delta, interactions) recorded while the partition loads
+        self._pending: Dict[Optional[uuid.UUID], List[Tuple[uuid.UUID, np.ndarray, int]]] = {}
+
+    def _key(self, mess_id: uuid.UUID) -> Optional[uuid.UUID]:
+        return None if self.cross_tenant else mess_id
+
+    def _fresh(self, key: Optional[uuid.UUID]) -> Optional[PreferenceProfiles]:
+        profiles = self._partitions.get(key)
+        if profiles is not None and time.monotonic() >= self._expires[key]:
+            return None
+        return profiles
+
+    async def get(self, mess_id: uuid.UUID) -> PreferenceProfiles:
+        key = self._key(mess_id)
+        profiles = self._fresh(key)
+        if profiles is None:
+            # Concurrent callers share one load, which stays registered until it is
+            # done, so a caller arriving late never starts a second one. It runs on its
+            # own session: the callers waiting on it must not depend on whichever one started it
+            load = self._loading.get(key)
+            if load is None:
+                load = spawn_detached(self._load(key))
+                self._loading[key] = load
+                load.add_done_callback(lambda done: self._loading.pop(key, None))
+            profiles = await asyncio.shield(load)
+        if key in self._partitions:
+            self._partitions.move_to_end(key)
+        return profiles
+
+    async def _load(self, key: Optional[uuid.UUID]) -> PreferenceProfiles:
+        # An event committed just before the query starts but recorded after this
+        # point is counted twice; the next reload corrects it
+        version = self._version
+        self._pending[key] = []
+        try:
+            profiles = await load_user_preference_profiles(key)
+        finally:
+            pending = self._pending.pop(key)
+        for customer_id, delta, interactions in pending:
+            profiles.apply(customer_id, delta, interactions)
+        if len(profiles) >= self.ann_min_users:
+            profiles.build_neighbour_index()
+        if version != self._version:
+            return profiles
+        self._partitions[key] = profiles
+        self._partitions.move_to_end(key)
+        self._expires[key] = time.monotonic() + self.ttl
+        self._evict()
+        return profiles
+
+    def _evict(self) -> None:
+        while len(self._partitions) > self.max_partitions:
+            key, _ = self._partitions.popitem(last=False)
+            self._expires.pop(key, None)
+
+    def record(self, mess_id: uuid.UUID, customer_id: uuid.UUID, lines: Iterable[Tuple[object, int]], sign: int = 1) -> None:
+        """
+        Apply order lines to a customer's profile. A customer's interaction count is
+        the number of their order lines with calories, as in the partition's query.
+        lines: (menu item or row with calories/spiciness/is_veg, quantity) pairs
+        sign: 1 for ordered items, -1 for cancelled items
+        """
+        key = self._key(mess_id)
+        profiles = self._partitions.get(key)
+        pending = self._pending.get(key)
+        if profiles is None and pending is None:
+            # Not loaded, the partition's initial aggregation will include this write
+            return
+
+        delta = np.zeros(SUM_COLUMNS)
+        interactions = 0
+        for item, quantity in lines:
+            line = line_delta(item, quantity)
+            if line is None:
+                continue
+            delta += line
+            interactions += 1
+
+        if not interactions:
+            return
+        if profiles is not None:
+            profiles.apply(customer_id, sign * delta, sign * interactions)
+        if pending is not None:
+            pending.append((customer_id, sign * delta, sign * interactions))
+
+    def refresh_neighbour_index(self, mess_id: Optional[uuid.UUID] = None) -> None:
+        """
+        Rebuild the neighbour index of one loaded partition, or of every loaded partition.
+        Partitions that have grown past ann_min_users get an index for the first time.
+        """
+        if mess_id is None:
+            partitions = list(self._partitions.values())
+        else:
+            profiles = self._partitions.get(self._key(mess_id))
+            partitions = [profiles] if profiles is not None else []
+
+        for profiles in partitions:
+            if profiles.has_neighbour_index or len(profiles) >= self.ann_min_users:
+                profiles.build_neighbour_index()
+
+    def evict(self, mess_id: Optional[uuid.UUID] = None) -> None:
+        """Drop one mess's partition, or every partition when mess_id is None"""
+        self._version += 1
+        if mess_id is None:
+            self._partitions.clear()
+            self._expires.clear()
+        else:
+            self._partitions.pop(self._key(mess_id), None)
+            self._expires.pop(self._key(mess_id), None)
+
+
+preference_store = PreferenceProfileStore(
+    max_partitions=settings.RECOMMENDATION_MAX_PARTITIONS,
+    cross_tenant=settings.RECOMMENDATION_CROSS_TENANT,
+    ann_min_users=settings.RECOMMENDATION_ANN_MIN_USERS,
+    ttl=settings.RECOMMENDATION_PROFILE_TTL_SECONDS,
+)
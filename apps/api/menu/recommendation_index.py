@@ -0,0 +1,138 @@
+import uuid
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .models import MenuItem
+
+SPICINESS_MAP = {'high': 1.0, 'medium': 0.5, 'low': 0.0, None: 0.0}
+VEG_PREF_MAP = {'veg': 1, 'non-veg': 0, None: 0}
+
+
+def item_feature_vector(item) -> List[float]:
+    """
+    Content features of a menu item: [calories, is_veg, spiciness]
+    """
+    return [
+        float(item.calories or 0),
+        1.0 if item.is_veg else 0.0,
+        SPICINESS_MAP.get(item.spiciness, 0.0),
+    ]
+
+
+def build_user_vector(calories: List[int], spices: List[str], vegTypesArray: List[str]) -> List[float]:
+    """
+    User taste vector in the same feature space as item_feature_vector
+    """
+    if calories:
+        avg_calories = sum(calories) / len(calories)
+    else:
+        avg_calories = 500
+
+    if vegTypesArray:
+        veg_pref = sum(VEG_PREF_MAP.get(veg_type, 0) for veg_type in vegTypesArray) / len(vegTypesArray)
+    else:
+        veg_pref = 0.5
+
+    if spices:
+        avg_spiciness = sum(SPICINESS_MAP.get(spice, 0) for spice in spices) / len(spices)
+    else:
+        avg_spiciness = 0.25
+
+    return [avg_calories, veg_pref, avg_spiciness]
+
+
+class MessRecommendationIndex:
+    """
+    Normalized item feature matrix for a single mess.
+    Only active, in-stock items are indexed. Scaling statistics are computed when
+    the index is built, so ranking a request is one matrix-vector product.
+    """
+
+    def __init__(self, items: Sequence = ()):
+        self.source = items
+        self._features: Dict[uuid.UUID, List[float]] = {
+            item.id: item_feature_vector(item)
+            for item in items
+            if item.in_stock and item.is_active
+        }
+        self._rebuild()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _rebuild(self) -> None:
+        self.ids = list(self._features.keys())
+        self.positions = {item_id: i for i, item_id in enumerate(self.ids)}
+        raw = np.array([self._features[item_id] for item_id in self.ids], dtype=np.float64).reshape(-1, 3)
+
+        # Same statistics as StandardScaler (population std, zero variance -> 1)
+        self.mean = raw.mean(axis=0) if len(raw) else np.zeros(3)
+        scale = raw.std(axis=0) if len(raw) else np.ones(3)
+        scale[scale == 0.0] = 1.0
+        self.scale = scale
+
+        scaled = (raw - self.mean) / self.scale
+        norms = np.linalg.norm(scaled, axis=1, keepdims=True)
+        norms[norms == 0.0] = 1.0
+        self.normalized = scaled / norms
+
+    def scores(self, user_vector: List[float]) -> np.ndarray:
+        """
+        Cosine similarity of every indexed item against the user vector
+        """
+        user_scaled = (np.asarray(user_vector, dtype=np.float64) - self.mean) / self.scale
+        norm = np.linalg.norm(user_scaled)
+        if norm == 0.0:
+            return np.zeros(len(self.ids))
+        return self.normalized @ (user_scaled / norm)
+
+    def rank(self, items: List[MenuItem], user_vector: List[float]) -> List[MenuItem]:
+        """
+        Sort the given (possibly filtered) items by similarity to the user vector.
+        Items that are not indexed (inactive or out of stock) are dropped.
+        """
+        if not items or not self.ids:
+            return []
+
+        rows = [self.positions.get(item.id) for item in items]
+        ranked = [(item, row) for item, row in zip(items, rows) if row is not None]
+        if not ranked:
+            return []
+
+        item_scores = self.scores(user_vector)[[row for _, row in ranked]]
+        order = np.argsort(-item_scores, kind="stable")
+        return [ranked[i][0] for i in order]
+
+
+class RecommendationIndexRegistry:
+    """
+    Per-mess recommendation indexes, built on first use. Menu writes invalidate the
+    menu snapshot, and the next display request rebuilds the index from the new one.
+    """
+
+    def __init__(self):
+        self._indexes: Dict[uuid.UUID, MessRecommendationIndex] = {}
+
+    async def get(self, db: AsyncSession, mess_id: uuid.UUID, items: Optional[Sequence] = None) -> MessRecommendationIndex:
+        """
+        Index for the mess, built from `items` (the full menu) when given, else loaded from the database.
+        A different `items` sequence than the index was built from (a reloaded snapshot) triggers a rebuild.
+        """
+        index = self._indexes.get(mess_id)
+        if index is None or (items is not None and index.source is not items):
+            if items is None:
+                result = await db.execute(select(MenuItem).filter(MenuItem.mess_id == mess_id))
+                items = result.scalars().all()
+            index = MessRecommendationIndex(items)
+            self._indexes[mess_id] = index
+        return index
+
+    def invalidate(self, mess_id: Optional[uuid.UUID] = None) -> None:
+        if mess_id is None:
+            self._indexes.clear()
+        else:
+            self._indexes.pop(mess_id, None)
+
+
+recommendation_indexes = RecommendationIndexRegistry()
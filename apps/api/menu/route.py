@@ -1,9 +1,10 @@
 from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException, Query, status, Request
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import exists, select, func
+from sqlalchemy import exists, select, func, or_
 from sqlalchemy.orm import  selectinload, load_only
 from db.session import get_async_session
+from core.config import settings
 from .schema import CategoryResponse, MenuItemCategoryCreate, MenuItemCategoryUpdate, MenuItemCategoryResponse, MenuItemCreate, MenuItemCreateResponse, MenuItemDisplayResponse, MenuItemUpdate, MenuItemResponse, MenuResponse
 from .models import MenuItem, MenuItemCategory
 import uuid
@@ -11,7 +12,11 @@ from upload.route import file_router
 from mess.dependencies import  get_mess_and_user_context, require_mess_access, MessContext
 from mess.crud import mess_crud
 from orders.models import Order, OrderItem
-from .recommendation import get_menu_recommendations_content_based, get_collaborative_filtering_recommendations
+from .recommendation import get_collaborative_filtering_recommendations
+from .recommendation_index import recommendation_indexes, build_user_vector
+from .cache import menu_cache
+from .preference_profiles import ITEM_FEATURES
+from .profile_store import preference_store
 from auth.dep import optional_current_customer
 from auth.models import Customer
 from .utils import get_user_menu_items, get_popular_menu_items
@@ -37,8 +42,10 @@ async def create_category(
 
     db_category = MenuItemCategory(**category.model_dump())
     db.add(db_category)
+    await menu_cache.notify(db, context.mess.id)
     await db.commit()
     await db.refresh(db_category)   
+    menu_cache.invalidate(context.mess.id)
     return db_category
 
 @router.get("/categories", response_model=list[CategoryResponse])
@@ -100,8 +107,10 @@ async def update_category(
     for key, value in category.model_dump(exclude_unset=True).items():
         setattr(db_category, key, value)
     
+    await menu_cache.notify(db, context.mess.id)
     await db.commit()
     await db.refresh(db_category)
+    menu_cache.invalidate(context.mess.id)
     return db_category
 
 @router.delete("/categories/{category_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -121,7 +130,9 @@ async def delete_category(
         raise HTTPException(status_code=404, detail="Category not found")
     
     await db.delete(db_category)
+    await menu_cache.notify(db, context.mess.id)
     await db.commit()
+    menu_cache.invalidate(context.mess.id)
 
 # Menu Item Routes
 @router.post("/items", response_model=MenuItemCreateResponse)
@@ -136,21 +147,40 @@ async def create_menu_item(
     item.mess_id = context.mess.id
     db_item = MenuItem(**item.model_dump())
     db.add(db_item)
+    await menu_cache.notify(db, context.mess.id)
     await db.commit()
     await db.refresh(db_item)
+    menu_cache.invalidate(context.mess.id)
     
     return MenuItemCreateResponse(id=db_item.id)
 
 @router.get("/items", response_model=list[MenuItemDisplayResponse])
 async def get_menu_items(
+    q: str = "",
     context: MessContext = Depends(require_mess_access),
     db: AsyncSession = Depends(get_async_session),
 ):
     # changed from joinedload to selectinload
-    result = await db.execute(select(MenuItem).options(
+    query = select(MenuItem).options(
         selectinload(MenuItem.category).load_only(MenuItemCategory.name),
         ).filter(MenuItem.mess_id == context.mess.id)
+
+    if q:
+        # `column %> q` is q <% column (pg_trgm word similarity), served by the gin_trgm_ops indexes
+        await db.execute(select(func.set_config(
+            'pg_trgm.word_similarity_threshold', str(settings.MENU_SEARCH_SIMILARITY_THRESHOLD), True
+        )))
+        relevance = func.greatest(
+            func.word_similarity(q, MenuItem.name),
+            func.coalesce(func.word_similarity(q, MenuItem.description), 0),
         )
+        query = query.filter(or_(
+            MenuItem.name.ilike(f"%{q}%"),
+            MenuItem.name.op('%>')(q),
+            MenuItem.description.op('%>')(q),
+        )).order_by(relevance.desc())
+
+    result = await db.execute(query)
     items = result.scalars().all()
     return items
 
@@ -167,48 +197,27 @@ async def get_menu_items_display(
     db: AsyncSession = Depends(get_async_session),
     auth: Optional[Customer] = Depends(optional_current_customer)
 ):
-    print("_________________________")
-    print(auth)
-    print(calorieMins)
-    print(calorieMaxes)
-    print(spiceLevel)
-    print(vegType)
-    print(category)
-    print(q)
-    print("_________________________")
-    
     mess = await mess_crud.get_by_slug(db, mess_slug)
 
     if not mess:
         raise HTTPException(status_code=404, detail="Mess not found")
-    # changed from joinedload to selectinload
-    query = select(MenuItem).options(
-        selectinload(MenuItem.category).load_only(MenuItemCategory.name),
-    ).filter(MenuItem.mess_id == mess.id)
-    
-    if category and category != "all":
-        query = query.filter(MenuItem.category.has(MenuItemCategory.slug == category))
-    
-    if q and q != "":
-        query = query.filter(MenuItem.name.ilike(f"%{q}%"))
 
-    if calorieMaxes and calorieMaxes != 0:
-        query = query.filter(MenuItem.calories <= calorieMaxes)
-    
-    if calorieMins and calorieMins != 0:
-        query = query.filter(MenuItem.calories >= calorieMins) 
-
-    if spiceLevel and spiceLevel != "":
-        query = query.filter(MenuItem.spiciness == spiceLevel)
-    
-    if vegType and vegType != "":
-        query = query.filter(MenuItem.is_veg == (vegType == "veg"))
-
-    
-    
-    result = await db.execute(query)
-    items = result.scalars().all()
+    menu = await menu_cache.get(db, mess.id)
+    items, facets = menu.filter(
+        calorieMins=calorieMins,
+        calorieMaxes=calorieMaxes,
+        spiceLevel=spiceLevel,
+        vegType=vegType,
+        category=category,
+        q=q,
+        similarity_threshold=settings.MENU_SEARCH_SIMILARITY_THRESHOLD,
+    )
+    if q:
+        # Search results keep their relevance order
+        items = [item for item in items if item.in_stock and item.is_active]
+        return MenuResponse(currency=mess.currency, items=items, facets=facets)
     try:
+        index = await recommendation_indexes.get(db, mess.id, items=menu.items)
         if auth and len(items) > 5:
             print("***************************")
             print(get_user_menu_items.cache_info())
@@ -225,22 +234,18 @@ async def get_menu_items_display(
             spices=list(set(spices)) if spices else []
             vegTypesArray=list(set(vegTypesArray)) if vegTypesArray else []
     
-            sorted_items =get_menu_recommendations_content_based(
-                items=items, 
-                calories=calories, 
-                spices=spices, 
-                vegTypesArray=vegTypesArray
-            )
+            sorted_items = index.rank(items, build_user_vector(calories, spices, vegTypesArray))
 
             if len(user_menu_items)< 5:
-                return MenuResponse(currency=mess.currency, items=sorted_items)
+                return MenuResponse(currency=mess.currency, items=sorted_items, facets=facets)
 
             collab_sorted_items =await get_collaborative_filtering_recommendations(
                 items=sorted_items, 
                 user_id=auth.id, 
+                mess_id=mess.id,
             )
 
-            return MenuResponse(currency=mess.currency, items=collab_sorted_items)
+            return MenuResponse(currency=mess.currency, items=collab_sorted_items, facets=facets)
         else:
             popular_items = await get_popular_menu_items()
             calories=[]
@@ -255,18 +260,13 @@ async def get_menu_items_display(
             print(spices)
             print(vegTypesArray)
             print("***************************")
-            sorted_items =get_menu_recommendations_content_based(
-                items=items, 
-                calories=calories, 
-                spices=spices, 
-                vegTypesArray=vegTypesArray
-            )
-            return MenuResponse(currency=mess.currency, items=sorted_items)
+            sorted_items = index.rank(items, build_user_vector(calories, spices, vegTypesArray))
+            return MenuResponse(currency=mess.currency, items=sorted_items, facets=facets)
     except Exception as e:
         print("*************************** error Recommendation ***************************")
         print(e)
         print("***************************")
-        return MenuResponse(currency=mess.currency, items=items)
+        return MenuResponse(currency=mess.currency, items=items, facets=facets)
     
 
 @router.get("/items/{item_id}", response_model=MenuItemResponse)
@@ -307,11 +307,17 @@ async def update_menu_item(
         raise HTTPException(status_code=404, detail="Menu item not found")
     
     update_data = item.model_dump(exclude_unset=True)
+    features_changed = any(key in update_data and update_data[key] != getattr(db_item, key) for key in ITEM_FEATURES)
     for key, value in update_data.items():
         setattr(db_item, key, value)
     
+    await menu_cache.notify(db, context.mess.id)
     await db.commit()
     await db.refresh(db_item)
+    menu_cache.invalidate(context.mess.id)
+    if features_changed:
+        # Profiles hold the features items had when ordered; reload so later cancellations subtract what was added
+        preference_store.evict(context.mess.id)
     return db_item
 
 @router.delete("/items/{item_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -339,4 +345,8 @@ async def delete_menu_item(
         await db.delete(image)
     
     await db.delete(db_item)
+    await menu_cache.notify(db, context.mess.id)
     await db.commit()
+    menu_cache.invalidate(context.mess.id)
+    # Its order lines lose their menu item, so they drop out of a reloaded partition
+    preference_store.evict(context.mess.id)
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Dict, Optional, List
 from datetime import datetime
 import uuid
 from .enums import SpicinessEnum
@@ -104,15 +104,27 @@ class MenuItemResponse(MenuItemBase):
         from_attributes = True
 
 
+class MenuFacets(BaseModel):
+    categories: Dict[str, int] = {}
+    spice_levels: Dict[str, int] = {}
+
+
 class MenuResponse(BaseModel):
     currency: str
     items: List[MenuItemResponse]
+    facets: Optional[MenuFacets] = None
 
 class MenuItemDisplayResponse(MenuItemBase):
     id: uuid.UUID
     category:Optional[MenuItemCategoryDisplay] = None
    
 
+class MenuItemSnapshot(MenuItemResponse):
+    """Cached display row; category fields are used for in-memory filtering only"""
+    category: Optional[MenuItemCategoryDisplay] = None
+    category_slug: Optional[str] = None
+
+
 class MenuItemCreateResponse(BaseModel):
     id: uuid.UUID
 
@@ -1,15 +1,17 @@
 from sqlalchemy import select, func
 from sqlalchemy.ext.asyncio import AsyncSession
-from db.session import get_async_session
+from db.session import AsyncSessionLocal
 from .models import MenuItem
 from orders.models import Order, OrderItem
 from auth.models import Customer
 from async_lru import alru_cache
 from datetime import datetime, timedelta
 
+# alru_cache runs a miss as a task copying the first caller's context, which may outlive
+# that request; the cached loaders therefore open their own session, never the request's
 @alru_cache(maxsize=100, ttl=300)
 async def get_user_menu_items(email: str):
-    async for db in get_async_session():
+    async with AsyncSessionLocal() as db:
         result = await db.execute(
         select(
             MenuItem.id,
@@ -29,7 +31,7 @@ async def get_user_menu_items(email: str):
 
 @alru_cache(maxsize=100, ttl=300)
 async def get_popular_menu_items(top_k: int = 7):
-    async for db in get_async_session():
+    async with AsyncSessionLocal() as db:
         today = datetime.now().date()
         result = await db.execute(
         select(
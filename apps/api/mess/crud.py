@@ -1,21 +1,11 @@
 from typing import List, Optional
 from uuid import UUID
-from async_lru import alru_cache
-from sqlalchemy import select,insert
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from db.session import get_async_session
 from .models import Mess
+from .registry import mess_registry
 from .schema import MessCreate, MessUpdate
 
-@alru_cache(maxsize=100, ttl=300)
-async def _get_mess_by_slug_cached(slug: str) -> Optional[Mess]:
-    async for db in get_async_session():  
-        result = await db.execute(select(Mess).filter(Mess.slug == slug))
-        mess = result.scalar_one_or_none()
-        if mess:
-            db.expunge(mess)
-        return mess
-
 class MessCRUD:
     async def get(self, db: AsyncSession, id: UUID) -> Optional[Mess]:
         """Get a single mess by ID"""
@@ -58,8 +48,11 @@ class MessCRUD:
             slug=obj_in.slug,
                     )
         db.add(db_obj)
+        # Clears a cached "not found" for the slug
+        await mess_registry.notify(db, db_obj.slug)
         await db.commit()
         await db.refresh(db_obj)
+        mess_registry.invalidate(db_obj.slug)
         return db_obj
 
     async def update(
@@ -69,36 +62,29 @@ class MessCRUD:
         obj_in: MessUpdate
     ) -> Mess:
         """Update a mess"""
-
-
-        print("***************************")
-        print(obj_in)
-        print("***************************")
+        slugs = {db_obj.slug}
         update_data = obj_in.model_dump(exclude_unset=True)
         for field, value in update_data.items():
             setattr(db_obj, field, value)
-            if field == 'slug':
-                print(f"db_obj.slug after setattr: {db_obj.slug}") 
+        slugs.add(db_obj.slug)
+        await mess_registry.notify(db, *slugs)
         await db.commit()
         await db.refresh(db_obj)
-        _get_mess_by_slug_cached.cache_clear()
-        print("***************************")
-        print(db_obj.slug)
-        print("***************************")
+        mess_registry.invalidate(*slugs)
         return db_obj
 
     async def remove(self, db: AsyncSession, id: UUID) -> None:
         """Delete a mess"""
         obj = await self.get(db, id)
-        _get_mess_by_slug_cached.cache_clear()
         if obj:
             await db.delete(obj)
+            await mess_registry.notify(db, obj.slug)
             await db.commit()
+            mess_registry.invalidate(obj.slug)
 
     async def get_by_slug(self, db: AsyncSession, slug: str) -> Optional[Mess]:
         """Get a mess by slug"""
-
-        return await _get_mess_by_slug_cached(slug)
+        return await mess_registry.get(slug)
 
     
 
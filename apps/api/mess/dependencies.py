@@ -1,12 +1,15 @@
-from functools import lru_cache
 from fastapi import Depends, HTTPException
-from sqlalchemy import select
+from sqlalchemy import exists, select
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import lazyload
 from db.session import get_async_session
 from mess.crud import mess_crud
-from auth.security import current_active_user,current_active_customer
+from mess.registry import mess_registry, staff_memberships
+from auth.config import bearer_transport, get_cached_user
+from auth.security import current_active_customer
+from auth.token_cache import USER, token_cache
 from mess.models import Mess, mess_staff
-from auth.models import Customer
+from auth.models import AccessToken, Customer, User
 
 class MessContext:
     def __init__(self, mess, user, is_owner: bool = False, is_staff: bool = False, current_customer: Customer = None):
@@ -24,26 +27,54 @@ class MessCustomerContext:
 
 async def get_mess_and_user_context(
     mess_slug: str,
+    token: str = Depends(bearer_transport.scheme),
     db: AsyncSession = Depends(get_async_session),
-    current_user = Depends(current_active_user)
 ) -> MessContext:
-    """Get mess and check if user has access"""
-    mess = await mess_crud.get_by_slug(db, mess_slug)
-    if not mess:
+    """
+    Resolve the token's user, the mess and staff membership together: from the
+    token, mess and membership caches when all are warm, else in one joined query
+    """
+    user = await get_cached_user(db, USER, token)
+    found, mess = mess_registry.cached(mess_slug)
+    if found and mess is None:
         raise HTTPException(status_code=404, detail="Mess not found")
-    
-    is_owner = mess.owner_id == current_user.id
-    if not is_owner:
-        is_staff = await db.execute(
-            select(mess_staff).where(
-                mess_staff.c.user_id == current_user.id,
-                mess_staff.c.mess_id == mess.id
-            )
-        ).scalar_one_or_none() is not None
-    else:
-        is_staff = True
-    
-    return MessContext(mess, current_user, is_owner, is_staff)
+
+    if user is not None and mess is not None:
+        cached, is_staff = staff_memberships.get((user.id, mess.id))
+        if cached:
+            return build_mess_context(mess, user, is_staff)
+
+    version = mess_registry.version
+    staff = exists().where(mess_staff.c.user_id == User.id, mess_staff.c.mess_id == Mess.id)
+    result = await db.execute(
+        select(User, Mess, staff.label("is_staff"))
+        .select_from(AccessToken)
+        .join(User, User.id == AccessToken.user_id)
+        .outerjoin(Mess, Mess.slug == mess_slug)
+        .where(AccessToken.token == token)
+        # oauth_accounts is only needed at login; skip its selectin round trip
+        .options(lazyload(User.oauth_accounts))
+    )
+    row = result.one_or_none()
+    if row is None or not row.User.is_active:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    user, mess, is_staff = row
+    token_cache.put(USER, token, user)
+    if mess is None:
+        mess_registry.store(mess_slug, None, version)
+        raise HTTPException(status_code=404, detail="Mess not found")
+
+    # Cached messes are shared across requests, so they must not belong to this session
+    db.expunge(mess)
+    mess_registry.store(mess_slug, mess, version)
+    staff_memberships.put((user.id, mess.id), is_staff)
+    return build_mess_context(mess, user, is_staff)
+
+
+def build_mess_context(mess: Mess, user: User, is_staff: bool) -> MessContext:
+    is_owner = mess.owner_id == user.id
+    return MessContext(mess, user, is_owner, is_owner or is_staff)
 
 async def require_mess_access(
     context: MessContext = Depends(get_mess_and_user_context)
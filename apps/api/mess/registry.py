@@ -0,0 +1,192 @@
+import asyncio
+import json
+import logging
+from typing import Dict, Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
+from core.config import settings
+from db.listener import listener, notify
+from db.session import spawn_detached, use_session
+from utils.bloom import BloomFilter
+from utils.lru import ExpiringLRU
+from .models import Mess
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = "mess_registry"
+
+
+def detached_mess(row) -> Mess:
+    mess = Mess(**row)
+    make_transient_to_detached(mess)
+    return mess
+
+
+class MessRegistry:
+    """
+    Per-worker cache of mess rows by slug, used by every `/{mess_slug}/...` route.
+    Writes invalidate single slugs: locally after commit, and in every other worker
+    through a Postgres NOTIFY sent in the writing transaction.
+
+    A Bloom filter of every existing slug rejects unknown slugs without touching the
+    database. Its false positives are cached as misses for negative_ttl, in an LRU kept
+    apart from the real tenants so junk lookups cannot evict them.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1000,
+        ttl: int = 300,
+        negative_maxsize: int = 1000,
+        negative_ttl: int = 30,
+        channel: str = NOTIFY_CHANNEL,
+    ):
+        self.channel = channel
+        self._tenants = ExpiringLRU(maxsize, ttl)
+        self._misses = ExpiringLRU(negative_maxsize, negative_ttl)
+        # None until loaded; every slug is then looked up
+        self.slugs: Optional[BloomFilter] = None
+        self._slugs_pending: Optional[set] = None
+        self._rebuild: Optional[asyncio.Task] = None
+        self._loading: Dict[str, asyncio.Future] = {}
+        # Bumped on every invalidation so loads that raced with a write are not cached
+        self._version = 0
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def cached(self, slug: str) -> Tuple[bool, Optional[Mess]]:
+        """
+        (found, mess) without touching the database; slugs rejected by the
+        Bloom filter are found as None
+        """
+        if self.slugs is not None and slug not in self.slugs:
+            return True, None
+        for cache in (self._tenants, self._misses):
+            found, mess = cache.get(slug)
+            if found:
+                return True, mess
+        return False, None
+
+    def store(self, slug: str, mess: Optional[Mess], version: int) -> None:
+        """
+        Cache a detached mess (or a miss) loaded elsewhere; skipped if an
+        invalidation happened since `version` was read
+        """
+        if version != self._version:
+            return
+        if mess is not None:
+            self._tenants.put(slug, mess)
+        else:
+            self._misses.put(slug, None)
+
+    async def get(self, slug: str) -> Optional[Mess]:
+        found, mess = self.cached(slug)
+        if found:
+            return mess
+
+        # Concurrent lookups of the same slug share one query. It runs on its own
+        # session: the requests waiting on it must not depend on whichever one started it
+        load = self._loading.get(slug)
+        if load is None:
+            load = spawn_detached(self._load(slug))
+            self._loading[slug] = load
+            load.add_done_callback(lambda done: self._loading.pop(slug, None) if self._loading.get(slug) is done else None)
+        return await asyncio.shield(load)
+
+    async def _load(self, slug: str, db: Optional[AsyncSession] = None) -> Optional[Mess]:
+        version = self._version
+        # Plain column rows: the cached copy is detached and never enters db's identity map
+        query = select(*Mess.__table__.columns).filter(Mess.slug == slug)
+        if db is not None:
+            result = await db.execute(query)
+        else:
+            async with use_session() as session:
+                result = await session.execute(query)
+        row = result.mappings().one_or_none()
+        mess = detached_mess(row) if row is not None else None
+        self.store(slug, mess, version)
+        return mess
+
+    async def load_slugs(self) -> None:
+        """
+        (Re)build the Bloom filter from the mess table.
+        Slugs written while the query runs are added afterwards.
+        """
+        self._slugs_pending = set()
+        try:
+            async with use_session() as db:
+                result = await db.execute(select(Mess.slug))
+                slugs = BloomFilter.from_keys(result.scalars().all())
+            for slug in self._slugs_pending:
+                slugs.add(slug)
+            self.slugs = slugs
+        finally:
+            self._slugs_pending = None
+
+    def invalidate(self, *slugs: str) -> None:
+        """
+        Drop cached rows for slugs touched by a write; they may exist now, so they
+        are also admitted by the Bloom filter (deleted slugs stay in it harmlessly)
+        """
+        self._version += 1
+        for slug in slugs:
+            self._tenants.pop(slug)
+            self._misses.pop(slug)
+            self._loading.pop(slug, None)
+            if self.slugs is not None:
+                self.slugs.add(slug)
+            if self._slugs_pending is not None:
+                self._slugs_pending.add(slug)
+        if self.slugs is not None and self.slugs.saturated and self._slugs_pending is None and self._rebuild is None:
+            # Called after a request's commit; the rebuild must not use that request's session.
+            # Until it starts, later invalidations must not queue another one
+            self._rebuild = spawn_detached(self.load_slugs())
+            self._rebuild.add_done_callback(lambda _: setattr(self, "_rebuild", None))
+
+    def clear(self) -> None:
+        self._version += 1
+        self._tenants.clear()
+        self._misses.clear()
+        self._loading.clear()
+
+    async def notify(self, db: AsyncSession, *slugs: str) -> None:
+        """
+        Queue an invalidation for all workers; Postgres delivers it when db commits
+        """
+        await notify(db, self.channel, json.dumps(slugs))
+
+    def on_notify(self, payload: str) -> None:
+        try:
+            slugs = json.loads(payload)
+        except ValueError:
+            logger.warning("Ignoring malformed %s notification: %r", self.channel, payload)
+            return
+        self.invalidate(*slugs)
+
+    async def on_connect(self) -> None:
+        # Anything published while we were disconnected was missed
+        self.clear()
+        await self.load_slugs()
+
+    def on_disconnect(self) -> None:
+        # Without notifications the filter could reject messes created elsewhere
+        self.slugs = None
+
+mess_registry = MessRegistry(
+    maxsize=settings.MESS_CACHE_MAX_SIZE,
+    ttl=settings.MESS_CACHE_TTL_SECONDS,
+    negative_maxsize=settings.MESS_NEGATIVE_CACHE_MAX_SIZE,
+    negative_ttl=settings.MESS_NEGATIVE_CACHE_TTL_SECONDS,
+)
+listener.subscribe(
+    mess_registry.channel,
+    mess_registry.on_notify,
+    on_connect=mess_registry.on_connect,
+    on_disconnect=mess_registry.on_disconnect,
+)
+
+# (user_id, mess_id) -> whether the user is staff of the mess
+staff_memberships = ExpiringLRU(maxsize=settings.TOKEN_CACHE_MAX_SIZE, ttl=settings.TOKEN_CACHE_TTL_SECONDS)
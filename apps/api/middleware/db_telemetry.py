@@ -0,0 +1,19 @@
+from db.telemetry import current_scope
+
+
+class DBTelemetryMiddleware:
+    """Expose the request scope to pool telemetry so connection hold time is attributed to routes"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = current_scope.set(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_scope.reset(token)
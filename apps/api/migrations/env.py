@@ -10,6 +10,7 @@ from mess.models import Mess,mess_staff
 from mess_table.models import MessTable
 from menu.models import  MenuItem, MenuItemCategory,SpicinessEnum
 from orders.models import Order, OrderItem, OrderStatusEnum,OrderTransaction,OrderTransactionStatusEnum,PaymentMethodEnum
+from analytics.models import DailyItemSales, DailyCustomerSpend
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
@@ -0,0 +1,37 @@
+"""menu_item_trgm_index
+
+Revision ID: 3a9c1e5b7d24
+Revises: d3cd28558807
+Create Date: 2026-10-18 09:12:41.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3a9c1e5b7d24'
+down_revision: Union[str, None] = 'd3cd28558807'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.create_index(
+        'ix_menu_item_name_trgm', 'menu_item', ['name'],
+        unique=False, postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}
+    )
+    op.create_index(
+        'ix_menu_item_description_trgm', 'menu_item', ['description'],
+        unique=False, postgresql_using='gin', postgresql_ops={'description': 'gin_trgm_ops'}
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_menu_item_description_trgm', table_name='menu_item', postgresql_using='gin')
+    op.drop_index('ix_menu_item_name_trgm', table_name='menu_item', postgresql_using='gin')
@@ -0,0 +1,28 @@
+"""orders_mess_status_created_index
+
+Revision ID: 5b8d2e6f0a47
+Revises: 7e2b4f9a1c36
+Create Date: 2026-10-18 14:05:27.604118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b8d2e6f0a47'
+down_revision: Union[str, None] = '7e2b4f9a1c36'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_orders_mess_status_created', 'orders', ['mess_id', 'status', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_orders_mess_status_created', table_name='orders')
@@ -0,0 +1,49 @@
+"""daily_sales_rollups
+
+Revision ID: 7e2b4f9a1c36
+Revises: 3a9c1e5b7d24
+Create Date: 2026-10-18 14:03:27.551920
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7e2b4f9a1c36'
+down_revision: Union[str, None] = '3a9c1e5b7d24'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('daily_item_sales',
+        sa.Column('mess_id', sa.UUID(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('menu_item_id', sa.UUID(), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.Column('revenue', sa.BigInteger(), nullable=False),
+        sa.ForeignKeyConstraint(['mess_id'], ['mess.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['menu_item_id'], ['menu_item.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('mess_id', 'day', 'menu_item_id')
+    )
+    op.create_table('daily_customer_spend',
+        sa.Column('mess_id', sa.UUID(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('customer_id', sa.UUID(), nullable=False),
+        sa.Column('orders', sa.Integer(), nullable=False),
+        sa.Column('spent', sa.BigInteger(), nullable=False),
+        sa.Column('last_order_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['mess_id'], ['mess.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['customer_id'], ['customer.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('mess_id', 'day', 'customer_id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('daily_customer_spend')
+    op.drop_table('daily_item_sales')
@@ -0,0 +1,45 @@
+"""order_hot_path_indexes
+
+Revision ID: 9d4f1a7c2e58
+Revises: 5b8d2e6f0a47
+Create Date: 2026-10-18 15:21:09.482716
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d4f1a7c2e58'
+down_revision: Union[str, None] = '5b8d2e6f0a47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+ACTIVE = sa.text("status NOT IN ('COMPLETED', 'CANCELLED')")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Built concurrently so orders keep flowing while a large table is indexed
+    with op.get_context().autocommit_block():
+        op.create_index('ix_orders_customer_created', 'orders', ['customer_id', 'created_at'],
+                        unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_orders_mess_active', 'orders', ['mess_id', 'created_at'],
+                        unique=False, postgresql_where=ACTIVE, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_orders_customer_active', 'orders', ['customer_id', 'created_at'],
+                        unique=False, postgresql_where=ACTIVE, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index(op.f('ix_order_items_order_id'), 'order_items', ['order_id'],
+                        unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index(op.f('ix_order_items_menu_item_id'), 'order_items', ['menu_item_id'],
+                        unique=False, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_order_items_menu_item_id'), table_name='order_items')
+    op.drop_index(op.f('ix_order_items_order_id'), table_name='order_items')
+    op.drop_index('ix_orders_customer_active', table_name='orders', postgresql_where=ACTIVE)
+    op.drop_index('ix_orders_mess_active', table_name='orders', postgresql_where=ACTIVE)
+    op.drop_index('ix_orders_customer_created', table_name='orders')
@@ -0,0 +1,42 @@
+"""order_totals
+
+Revision ID: c81e5d3f9b20
+Revises: 9d4f1a7c2e58
+Create Date: 2026-10-18 16:40:52.117390
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c81e5d3f9b20'
+down_revision: Union[str, None] = '9d4f1a7c2e58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('orders', sa.Column('total_price', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('orders', sa.Column('item_count', sa.Integer(), server_default='0', nullable=False))
+    # Backfill from the non-cancelled items, as the old Order.total_price property summed them
+    op.execute("""
+        UPDATE orders
+        SET total_price = live.total_price, item_count = live.item_count
+        FROM (
+            SELECT order_id, sum(total_price) AS total_price, count(*) AS item_count
+            FROM order_items
+            WHERE is_cancelled IS NOT TRUE
+            GROUP BY order_id
+        ) AS live
+        WHERE live.order_id = orders.id
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('orders', 'item_count')
+    op.drop_column('orders', 'total_price')
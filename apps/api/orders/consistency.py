@@ -0,0 +1,55 @@
+"""
+Check the persisted order totals (total_price, item_count) against the order items.
+
+Run from apps/api:
+    python -m orders.consistency              # report, exit status 1 on mismatches
+    python -m orders.consistency --mess SLUG  # one mess
+    python -m orders.consistency --fix        # recompute mismatched orders from their items
+"""
+import argparse
+import asyncio
+from sqlalchemy import select
+from db.session import AsyncSessionLocal, engine
+# Every mapped model must be imported for relationship resolution
+from auth.models import User, Customer
+from mess.models import Mess
+from mess_table.models import MessTable
+from menu.models import MenuItem, MenuItemCategory
+from .models import Order, OrderItem, OrderTransaction
+from .crud import inconsistent_orders, repair_totals
+
+REPORT_LIMIT = 20
+
+
+async def check(slug: str = None, fix: bool = False) -> int:
+    async with AsyncSessionLocal() as db:
+        mess_id = None
+        if slug:
+            mess_id = (await db.execute(select(Mess.id).where(Mess.slug == slug))).scalar_one_or_none()
+            if mess_id is None:
+                raise SystemExit(f"Mess {slug!r} not found")
+
+        rows = (await db.execute(inconsistent_orders(mess_id))).all()
+        for row in rows[:REPORT_LIMIT]:
+            print(
+                f"order {row.id}: total_price {row.total_price} (items say {row.actual_total_price}), "
+                f"item_count {row.item_count} (items say {row.actual_item_count})"
+            )
+        if len(rows) > REPORT_LIMIT:
+            print(f"... and {len(rows) - REPORT_LIMIT} more")
+        print(f"{len(rows)} inconsistent orders")
+
+        if fix and rows:
+            repaired = await repair_totals(db, mess_id)
+            await db.commit()
+            print(f"repaired {repaired} orders")
+    await engine.dispose()
+    return 1 if rows and not fix else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mess", help="slug of a single mess to check")
+    parser.add_argument("--fix", action="store_true", help="recompute totals of inconsistent orders")
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(check(args.mess, args.fix)))
@@ -0,0 +1,149 @@
+import uuid
+from typing import List, Optional, Tuple
+from sqlalchemy import Boolean, DateTime, Integer, cast, column, false, func, literal, or_, select, true, update, values
+from sqlalchemy.dialects.postgresql import UUID, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+from menu.models import MenuItem
+from mess_table.models import MessTable
+from .models import Order, OrderItem
+
+# (id, menu_item_id, quantity) of an order line
+Line = Tuple[uuid.UUID, uuid.UUID, int]
+
+
+async def adjust_totals(db: AsyncSession, order: Order, price_delta: int, count_delta: int, **values) -> None:
+    """
+    Apply an item change to the order's persisted total_price and item_count,
+    together with any other column values given, in one UPDATE. The increment is
+    done by the UPDATE itself, so concurrent changes to the same order queue on the
+    row lock instead of overwriting each other.
+    """
+    result = await db.execute(
+        update(Order)
+        .where(Order.id == order.id)
+        .values(total_price=Order.total_price + price_delta, item_count=Order.item_count + count_delta, **values)
+        .returning(Order.total_price, Order.item_count)
+        .execution_options(synchronize_session=False)
+    )
+    total_price, item_count = result.one()
+    set_committed_value(order, "total_price", total_price)
+    set_committed_value(order, "item_count", item_count)
+    for key, value in values.items():
+        set_committed_value(order, key, value)
+
+
+def live_items_total():
+    """total_price and item_count as recomputed from the order's non-cancelled items"""
+    live = (OrderItem.order_id == Order.id, OrderItem.is_cancelled.isnot(True))
+    total_price = select(func.coalesce(func.sum(OrderItem.total_price), 0)).where(*live).scalar_subquery()
+    item_count = select(func.count(OrderItem.id)).where(*live).scalar_subquery()
+    return total_price, item_count
+
+
+def inconsistent_orders(mess_id: Optional[uuid.UUID] = None):
+    """Orders whose stored totals disagree with their items, with both versions"""
+    total_price, item_count = live_items_total()
+    query = (
+        select(
+            Order.id,
+            Order.mess_id,
+            Order.total_price,
+            Order.item_count,
+            total_price.label("actual_total_price"),
+            item_count.label("actual_item_count"),
+        )
+        .where(or_(Order.total_price != total_price, Order.item_count != item_count))
+        .order_by(Order.created_at)
+    )
+    if mess_id is not None:
+        query = query.where(Order.mess_id == mess_id)
+    return query
+
+
+async def repair_totals(db: AsyncSession, mess_id: Optional[uuid.UUID] = None) -> int:
+    """Recompute the stored totals of inconsistent orders from their items; returns how many changed"""
+    total_price, item_count = live_items_total()
+    query = (
+        update(Order)
+        .where(or_(Order.total_price != total_price, Order.item_count != item_count))
+        .values(total_price=total_price, item_count=item_count)
+        .returning(Order.id)
+        .execution_options(synchronize_session=False)
+    )
+    if mess_id is not None:
+        query = query.where(Order.mess_id == mess_id)
+    result = await db.execute(query)
+    return len(result.all())
+
+
+def place_order_statement(order: Order, lines: List[Line]):
+    """
+    Insert an order and its items in one statement, returning the order's table
+    and total_price. Lines are priced from menu_item in the same statement, joined
+    only to active, in-stock items of the order's mess, and the order row is only
+    inserted if every line was priced and its table belongs to the mess; no row
+    back means nothing was written. Ids and timestamps come from the caller, which
+    already has everything else the response needs.
+    """
+    rows = values(
+        column("id", UUID(as_uuid=True)),
+        column("menu_item_id", UUID(as_uuid=True)),
+        column("quantity", Integer),
+        name="lines",
+    ).data(lines)
+    # Line totals are stored as integers, truncated like int() does
+    priced = (
+        select(
+            rows.c.id,
+            rows.c.menu_item_id,
+            rows.c.quantity,
+            cast(func.trunc(MenuItem.price * rows.c.quantity), Integer).label("total_price"),
+        )
+        .select_from(rows)
+        .join(MenuItem, MenuItem.id == rows.c.menu_item_id)
+        .where(MenuItem.mess_id == order.mess_id, MenuItem.is_active.is_(True), MenuItem.in_stock.is_(True))
+        .cte("priced")
+    )
+    priced_count = select(func.count()).select_from(priced).scalar_subquery()
+    total_price = select(cast(func.sum(priced.c.total_price), Integer)).scalar_subquery()
+    columns = ["id", "customer_id", "mess_id", "table_id", "status", "created_at", "updated_at",
+               "is_cancelled", "has_added_items", "total_price", "item_count"]
+    new_order = (
+        insert(Order)
+        .from_select(columns, select(
+            literal(order.id, UUID(as_uuid=True)),
+            literal(order.customer_id, UUID(as_uuid=True)),
+            literal(order.mess_id, UUID(as_uuid=True)),
+            MessTable.id,
+            literal(order.status, Order.status.type),
+            literal(order.created_at, DateTime(timezone=True)),
+            literal(order.updated_at, DateTime(timezone=True)),
+            literal(False, Boolean),
+            literal(False, Boolean),
+            total_price,
+            literal(len(lines), Integer),
+        ).where(
+            MessTable.id == order.table_id,
+            MessTable.mess_id == order.mess_id,
+            priced_count == len(lines),
+        ))
+        .returning(Order.id, Order.table_id, Order.total_price)
+        .cte("new_order")
+    )
+    new_items = (
+        insert(OrderItem)
+        .from_select(
+            ["id", "order_id", "menu_item_id", "quantity", "total_price", "is_cancelled"],
+            select(priced.c.id, new_order.c.id, priced.c.menu_item_id, priced.c.quantity, priced.c.total_price, false())
+            .select_from(priced)
+            .join(new_order, true()),
+        )
+        .returning(OrderItem.id)
+        .cte("new_items")
+    )
+    return (
+        select(MessTable, new_order.c.total_price)
+        .join(new_order, new_order.c.table_id == MessTable.id)
+        .add_cte(new_items)
+    )
@@ -0,0 +1,86 @@
+import base64
+import hashlib
+import json
+import uuid
+from datetime import datetime
+from typing import List, Optional, Tuple
+from pydantic import TypeAdapter
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from . import models, schema
+
+# Position of an order in the feed: (status rank, created_at, id), all descending
+FeedKey = Tuple[int, datetime, uuid.UUID]
+
+feed_adapter = TypeAdapter(List[schema.AdminOrderResponse])
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(key: FeedKey) -> str:
+    rank, created_at, order_id = key
+    raw = json.dumps([rank, created_at.isoformat(), str(order_id)]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> FeedKey:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        rank, created_at, order_id = json.loads(raw)
+        return int(rank), datetime.fromisoformat(created_at), uuid.UUID(order_id)
+    except (ValueError, TypeError, AttributeError) as e:
+        # AttributeError: uuid.UUID() given a non-string, e.g. a JSON number
+        raise InvalidCursor(str(e)) from e
+
+
+def active_orders_query(mess_id: uuid.UUID, limit: int, after: Optional[FeedKey] = None):
+    """
+    Orders still in service, most advanced status first and newest first within a
+    status, after the given key. Only the active slice is read (ix_orders_mess_active),
+    never history. One extra row is fetched to tell whether another page follows.
+    """
+    rank = models.status_order.label("rank")
+    query = (
+        select(models.Order, rank)
+        .where(models.Order.mess_id == mess_id, models.active_orders())
+        .options(
+            selectinload(models.Order.customer),
+            selectinload(models.Order.table),
+            selectinload(models.Order.transaction),
+        )
+        .order_by(rank.desc(), models.Order.created_at.desc(), models.Order.id.desc())
+        .limit(limit + 1)
+    )
+    if after is not None:
+        query = query.where(tuple_(models.status_order, models.Order.created_at, models.Order.id) < tuple_(*after))
+    return query
+
+
+async def active_orders_page(
+    db: AsyncSession,
+    mess_id: uuid.UUID,
+    limit: int,
+    after: Optional[FeedKey] = None,
+) -> Tuple[list, Optional[FeedKey]]:
+    """One page of the feed and the key to continue from (None on the last page)"""
+    rows = (await db.execute(active_orders_query(mess_id, limit, after))).all()
+    next_key = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_key = (last.rank, last.Order.created_at, last.Order.id)
+    return [row.Order for row in rows], next_key
+
+
+def etag_for(body: bytes) -> str:
+    return '"%s"' % hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
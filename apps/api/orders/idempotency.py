@@ -0,0 +1,201 @@
+import hashlib
+import json
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, NamedTuple, Optional, Tuple
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import delete, null, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from core.config import settings
+from .models import IdempotencyKey
+
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+PURGE_INTERVAL_SECONDS = 3600
+
+# (scope, customer_id, Idempotency-Key); scope names the endpoint
+Key = Tuple[str, uuid.UUID, str]
+
+
+class StoredResponse(NamedTuple):
+    fingerprint: str
+    status_code: int
+    body: Any
+
+
+class IdempotencyInProgress(Exception):
+    """The first request with this key has claimed it but not stored its response yet"""
+
+
+class IdempotencyKeyReused(Exception):
+    """The key was already used for a request with a different payload"""
+
+
+def fingerprint(payload) -> str:
+    raw = json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(",", ":")).encode()
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+
+def matching(key: Key):
+    scope, customer_id, idempotency_key = key
+    return (
+        IdempotencyKey.scope == scope,
+        IdempotencyKey.customer_id == customer_id,
+        IdempotencyKey.key == idempotency_key,
+    )
+
+
+class IdempotentRequest:
+    """
+    A request's claim on its key. When replay is set the key was used before and
+    the stored response is returned as is; otherwise the handler runs and ends with
+    save(), or release() if it fails after the claim was committed. Without a key
+    save() is a plain commit.
+    """
+
+    def __init__(self, store: "IdempotencyStore", key: Optional[Key], stored: Optional[StoredResponse] = None):
+        self.store = store
+        self.key = key
+        self.stored = stored
+
+    @property
+    def replay(self) -> Optional[JSONResponse]:
+        if self.stored is None:
+            return None
+        return JSONResponse(self.stored.body, status_code=self.stored.status_code, headers={REPLAYED_HEADER: "true"})
+
+    async def save(self, db: AsyncSession, body, status_code: int = 200) -> None:
+        """Store the response and commit it together with the handler's own writes"""
+        if self.key is None:
+            await db.commit()
+            return
+        body = jsonable_encoder(body)
+        result = await db.execute(
+            update(IdempotencyKey)
+            .where(*matching(self.key))
+            .values(status_code=status_code, response=body)
+            .returning(IdempotencyKey.fingerprint)
+        )
+        stored = StoredResponse(result.scalar_one(), status_code, body)
+        await db.commit()
+        self.store.remember(self.key, stored)
+
+    async def release(self, db: AsyncSession) -> None:
+        """Give the key back after a failure, so that a retry runs the handler again"""
+        await db.rollback()
+        if self.key is None:
+            return
+        await db.execute(delete(IdempotencyKey).where(*matching(self.key), IdempotencyKey.status_code.is_(None)))
+        await db.commit()
+
+
+class IdempotencyStore:
+    """
+    Responses of recent requests made with an Idempotency-Key, so a retry is answered
+    with the first response instead of doing the work again. Each worker keeps the
+    most recent ones in an LRU; the idempotency_keys table shares them between
+    workers and settles duplicates that arrive together, through its primary key.
+    """
+
+    def __init__(self, ttl: int = 86400, maxsize: int = 10000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._responses: "OrderedDict[Key, Tuple[float, StoredResponse]]" = OrderedDict()
+        self._next_purge = 0.0
+
+    def get(self, key: Key) -> Optional[StoredResponse]:
+        entry = self._responses.get(key)
+        if entry is None:
+            return None
+        expires, stored = entry
+        if time.monotonic() >= expires:
+            del self._responses[key]
+            return None
+        self._responses.move_to_end(key)
+        return stored
+
+    def remember(self, key: Key, stored: StoredResponse) -> None:
+        self._responses.pop(key, None)
+        self._responses[key] = (time.monotonic() + self.ttl, stored)
+        while len(self._responses) > self.maxsize:
+            self._responses.popitem(last=False)
+
+    async def claim(
+        self,
+        db: AsyncSession,
+        scope: str,
+        customer_id: uuid.UUID,
+        idempotency_key: Optional[str],
+        payload,
+        commit: bool = False,
+    ) -> IdempotentRequest:
+        """
+        Claim the key in db's transaction, or find the response stored for it. A
+        duplicate arriving while the claim is uncommitted waits on the row and then
+        replays the first response. Handlers that call out to other services before
+        writing pass commit=True, so that a duplicate meanwhile gets
+        IdempotencyInProgress instead of waiting. Raises IdempotencyKeyReused when
+        the key comes back with a different payload.
+        """
+        if idempotency_key is None:
+            return IdempotentRequest(self, None)
+        key = (scope, customer_id, idempotency_key)
+        request_fingerprint = fingerprint(payload)
+
+        stored = self.get(key)
+        if stored is None:
+            now = datetime.now(timezone.utc)
+            await self.purge(db)
+            claim = insert(IdempotencyKey).values(
+                scope=scope,
+                customer_id=customer_id,
+                key=idempotency_key,
+                fingerprint=request_fingerprint,
+                created_at=now,
+            )
+            # An expired key is claimed again in place
+            claim = claim.on_conflict_do_update(
+                index_elements=[IdempotencyKey.scope, IdempotencyKey.customer_id, IdempotencyKey.key],
+                set_={
+                    "fingerprint": claim.excluded.fingerprint,
+                    "created_at": claim.excluded.created_at,
+                    "status_code": null(),
+                    "response": null(),
+                },
+                where=IdempotencyKey.created_at < now - timedelta(seconds=self.ttl),
+            ).returning(IdempotencyKey.created_at)
+            if (await db.execute(claim)).first() is not None:
+                if commit:
+                    await db.commit()
+                return IdempotentRequest(self, key)
+
+            row = (await db.execute(
+                select(IdempotencyKey.fingerprint, IdempotencyKey.status_code, IdempotencyKey.response)
+                .where(*matching(key))
+            )).first()
+            if row is None or row.status_code is None:
+                raise IdempotencyInProgress(idempotency_key)
+            stored = StoredResponse(row.fingerprint, row.status_code, row.response)
+            self.remember(key, stored)
+
+        if stored.fingerprint != request_fingerprint:
+            raise IdempotencyKeyReused(idempotency_key)
+        return IdempotentRequest(self, key, stored)
+
+    async def purge(self, db: AsyncSession) -> None:
+        """Delete expired keys, at most once per PURGE_INTERVAL_SECONDS per worker"""
+        if time.monotonic() < self._next_purge:
+            return
+        self._next_purge = time.monotonic() + PURGE_INTERVAL_SECONDS
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.ttl)
+        await db.execute(delete(IdempotencyKey).where(IdempotencyKey.created_at < cutoff))
+
+    def clear(self) -> None:
+        self._responses.clear()
+
+
+idempotency_store = IdempotencyStore(ttl=settings.IDEMPOTENCY_KEY_TTL_SECONDS, maxsize=settings.IDEMPOTENCY_CACHE_MAX_SIZE)
@@ -1,11 +1,11 @@
-from sqlalchemy import Boolean, Column, String, Integer, DateTime, ForeignKey, Enum as SqlEnum
+from sqlalchemy import Boolean, Column, String, Integer, DateTime, ForeignKey, Index, Enum as SqlEnum
 from enum import Enum
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
 import uuid
 from db.base import Base
-from sqlalchemy import case
+from sqlalchemy import bindparam, case, text
 
 class OrderStatusEnum(str,Enum):
     PENDING = "pending"
@@ -41,18 +41,43 @@ class Order(Base):
     onupdate=lambda: datetime.now(timezone.utc))
     is_cancelled = Column(Boolean, default=False)
     has_added_items = Column(Boolean, default=False)
+    # Sum and count of the non-cancelled items, maintained by orders.crud on every item change
+    total_price = Column(Integer, nullable=False, default=0, server_default="0")
+    item_count = Column(Integer, nullable=False, default=0, server_default="0")
     mess = relationship("Mess", back_populates="orders")
     table = relationship("MessTable", back_populates="orders")
     items = relationship("OrderItem", back_populates="order")
     transaction = relationship("OrderTransaction", back_populates="order",uselist=False)
     customer = relationship("Customer", back_populates="orders")
 
+    __table_args__ = (
+        # Per-mess order history by status and time: hourly analytics buckets
+        Index('ix_orders_mess_status_created', 'mess_id', 'status', 'created_at'),
+        # A customer's order history (my-orders)
+        Index('ix_orders_customer_created', 'customer_id', 'created_at'),
+        # Orders still in service are a small, hot slice of the table: the admin
+        # feed per mess and the customer's open order popup
+        Index('ix_orders_mess_active', 'mess_id', 'created_at',
+              postgresql_where=text("status NOT IN ('COMPLETED', 'CANCELLED')")),
+        Index('ix_orders_customer_active', 'customer_id', 'created_at',
+              postgresql_where=text("status NOT IN ('COMPLETED', 'CANCELLED')")),
+    )
 
-    @property
-    def total_price(self) -> int:
-        return sum(item.total_price for item in self.items if not item.is_cancelled)
 
 
+INACTIVE_STATUSES = [OrderStatusEnum.COMPLETED, OrderStatusEnum.CANCELLED]
+
+
+def active_orders():
+    """
+    Filter for orders still in service. The statuses are rendered inline instead of
+    bound, so the planner can match the partial ix_orders_*_active indexes even
+    with a generic plan for the prepared statement.
+    """
+    return Order.status.not_in(
+        bindparam('inactive_statuses', INACTIVE_STATUSES, expanding=True, literal_execute=True, type_=Order.status.type)
+    )
+
 
 status_order = case(
     (Order.status == OrderStatusEnum.PENDING, 1),
@@ -69,8 +94,8 @@ class OrderItem(Base):
     __tablename__ = "order_items"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    order_id = Column(UUID(as_uuid=True), ForeignKey("orders.id", ondelete="CASCADE"), nullable=False)
-    menu_item_id = Column(UUID(as_uuid=True), ForeignKey("menu_item.id", ondelete="SET NULL"), nullable=True)
+    order_id = Column(UUID(as_uuid=True), ForeignKey("orders.id", ondelete="CASCADE"), nullable=False, index=True)
+    menu_item_id = Column(UUID(as_uuid=True), ForeignKey("menu_item.id", ondelete="SET NULL"), nullable=True, index=True)
     quantity = Column(Integer, nullable=False)
     total_price = Column(Integer, nullable=False)
     is_cancelled = Column(Boolean, default=False)
@@ -94,3 +119,15 @@ class OrderTransaction(Base):
     updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
     order = relationship("Order", back_populates="transaction")
 
+
+class IdempotencyKey(Base):
+    """Response of a request made with an Idempotency-Key; status_code is null while it runs"""
+    __tablename__ = "idempotency_keys"
+
+    scope = Column(String, primary_key=True)
+    customer_id = Column(UUID(as_uuid=True), ForeignKey("customer.id", ondelete="CASCADE"), primary_key=True)
+    key = Column(String, primary_key=True)
+    fingerprint = Column(String, nullable=False)
+    status_code = Column(Integer, nullable=True)
+    response = Column(JSONB, nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, index=True)
@@ -1,36 +1,120 @@
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
 from httpx import AsyncClient
 from sqlalchemy.orm import Session,selectinload,joinedload
 from core.config import settings
 from db.session import get_async_session
-from . import schema, models
+from . import crud, feed, idempotency, schema, models, state
+from .idempotency import idempotency_store
 from menu.models import MenuItem
+from mess_table.models import MessTable
+from menu.schema import MenuItemResponse
+from menu.cache import menu_cache
+from menu.profile_store import preference_store
+from analytics.rollups import record_completed_order
 import uuid
 from mess.dependencies import get_mess_and_customer_context, MessCustomerContext, require_mess_access
-from sqlalchemy import select,update
+from sqlalchemy import delete,insert,select,update
+from sqlalchemy.exc import IntegrityError
 
 from sqlalchemy.ext.asyncio import AsyncSession
 from core.socket import sio
 import json
+from datetime import datetime, timezone
 
 router = APIRouter(prefix="/{mess_slug}/orders", tags=["orders"])
 
 
+async def get_active_item_lines(db: AsyncSession, order_id: uuid.UUID):
+    """Menu item features and quantities of an order's non-cancelled items"""
+    result = await db.execute(
+        select(MenuItem.calories, MenuItem.spiciness, MenuItem.is_veg, models.OrderItem.quantity)
+        .join(models.OrderItem, models.OrderItem.menu_item_id == MenuItem.id)
+        .where(models.OrderItem.order_id == order_id, models.OrderItem.is_cancelled == False)
+    )
+    return [(row, row.quantity) for row in result.all()]
+
+
+async def raise_unplaceable(db: AsyncSession, mess_id: uuid.UUID, order: schema.OrderCreate):
+    """
+    Find out why place_order_statement inserted nothing, or failed on a row deleted
+    while it ran, and raise the matching error
+    """
+    menu_item_ids = {item.menu_item_id for item in order.items}
+    result = await db.execute(
+        select(MenuItem.id, MenuItem.is_active, MenuItem.in_stock)
+        .where(MenuItem.id.in_(menu_item_ids), MenuItem.mess_id == mess_id),
+        bind_arguments={"writes": True}
+    )
+    menu_items = {row.id: row for row in result.all()}
+    missing_items = menu_item_ids - menu_items.keys()
+    if missing_items:
+        raise HTTPException(status_code=404, detail=f"Menu items not found: {list(missing_items)}")
+    for item in order.items:
+        menu_item = menu_items[item.menu_item_id]
+        if not menu_item.is_active:
+            raise HTTPException(status_code=400, detail=f"Menu item {item.menu_item_id} is not active")
+        if not menu_item.in_stock:
+            raise HTTPException(status_code=400, detail=f"Menu item {item.menu_item_id} is not in stock")
+    table = await db.execute(
+        select(MessTable.id).where(MessTable.id == order.table_id, MessTable.mess_id == mess_id),
+        bind_arguments={"writes": True}
+    )
+    if table.first() is None:
+        raise HTTPException(status_code=404, detail="Table not found")
+    # Everything checks out now, so the menu or the table changed while the order was placed
+    raise HTTPException(status_code=409, detail="The menu changed while placing the order, please retry")
+
+
+async def claim_idempotency_key(
+    db: AsyncSession,
+    scope: str,
+    context: MessCustomerContext,
+    idempotency_key: Optional[str],
+    payload,
+    commit: bool = False,
+) -> idempotency.IdempotentRequest:
+    try:
+        return await idempotency_store.claim(db, scope, context.customer.id, idempotency_key, payload, commit=commit)
+    except idempotency.IdempotencyInProgress:
+        raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+    except idempotency.IdempotencyKeyReused:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+
+
 @router.get("/incomplete", response_model=List[schema.AdminOrderResponse])
 async def get_orders(
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    if_none_match: Optional[str] = Header(None),
     db: AsyncSession = Depends(get_async_session),
     context: MessCustomerContext = Depends(require_mess_access)
 ):
-    orders = await db.execute(select(models.Order).filter(models.Order.mess_id == context.mess.id).options(selectinload(models.Order.customer),selectinload(models.Order.table),selectinload(models.Order.items),selectinload(models.Order.transaction)).order_by(models.status_order.desc(),models.Order.created_at.desc()))
-    return orders.scalars().all()
+    """
+    Orders still in service, one page at a time. X-Next-Cursor is set when more
+    pages follow; send it back as cursor. Send the page's ETag as If-None-Match
+    when polling to get 304 Not Modified if nothing on it changed.
+    """
+    try:
+        after = feed.decode_cursor(cursor) if cursor else None
+    except feed.InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    orders, next_key = await feed.active_orders_page(db, context.mess.id, limit, after)
+    body = feed.feed_adapter.dump_json(feed.feed_adapter.validate_python(orders, from_attributes=True))
+    headers = {"ETag": feed.etag_for(body), "Cache-Control": "no-cache"}
+    if next_key is not None:
+        headers["X-Next-Cursor"] = feed.encode_cursor(next_key)
+    if feed.etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 @router.get("/my-orders", response_model=Optional[schema.MyOrderResponse])
 async def get_my_orders(
     db: AsyncSession = Depends(get_async_session),
     context: MessCustomerContext = Depends(get_mess_and_customer_context)
 ):
-    orders = await db.execute(select(models.Order).filter(models.Order.customer_id == context.customer.id).options(selectinload(models.Order.customer),selectinload(models.Order.table),selectinload(models.Order.items),selectinload(models.Order.transaction)))
+    orders = await db.execute(select(models.Order).filter(models.Order.customer_id == context.customer.id).options(selectinload(models.Order.customer),selectinload(models.Order.table),selectinload(models.Order.transaction)))
     orders = orders.scalars().all()
     if not orders:
         return schema.MyOrderResponse(
@@ -49,7 +133,11 @@ async def get_order(
     db: AsyncSession = Depends(get_async_session),
     context: MessCustomerContext = Depends(require_mess_access)
 ):
-    order = await db.execute(select(models.Order).filter(models.Order.id == order_id).options(selectinload(models.Order.customer),selectinload(models.Order.table),selectinload(models.Order.items).selectinload(models.OrderItem.menu_item),selectinload(models.Order.transaction)))
+    # Clears has_added_items below, so read from the primary rather than a lagging replica
+    order = await db.execute(
+        select(models.Order).filter(models.Order.id == order_id).options(selectinload(models.Order.customer),selectinload(models.Order.table),selectinload(models.Order.items).selectinload(models.OrderItem.menu_item),selectinload(models.Order.transaction)),
+        bind_arguments={"writes": True}
+    )
     order = order.scalars().first()
     if order.has_added_items:
         order.has_added_items = False
@@ -67,63 +155,75 @@ async def get_order(
 @router.post("/", response_model=schema.OrderCreateResponse)
 async def create_order(
     order: schema.OrderCreate,
+    idempotency_key: Optional[str] = Header(None, max_length=idempotency.MAX_KEY_LENGTH),
     db: AsyncSession = Depends(get_async_session),
     context: MessCustomerContext = Depends(get_mess_and_customer_context)
 ):
-    menu_item_ids = [item.menu_item_id for item in order.items]
-    
-    result = await db.execute(
-        select(MenuItem).filter(MenuItem.id.in_(menu_item_ids))
-    )
-    menu_items = result.scalars().all()
-    
-    menu_items_dict = {item.id: item for item in menu_items}
-    
-    missing_items = set(menu_item_ids) - set(menu_items_dict.keys())
-    if missing_items:
-        raise HTTPException(
-            status_code=404, 
-            detail=f"Menu items not found: {list(missing_items)}"
-        )
-    
-    # Create the order
+    """
+    Place an order. Retries sent with the same Idempotency-Key get the first
+    response back instead of placing the order again.
+    """
+    idempotent = await claim_idempotency_key(db, "create_order", context, idempotency_key, order)
+    if idempotent.replay is not None:
+        return idempotent.replay
+
+    # Prices and availability are checked by the insert itself, against menu_item
+    # as it is now; the cached snapshot only supplies features for the profiles
+    lines = [(uuid.uuid4(), item.menu_item_id, item.quantity) for item in order.items]
+    now = datetime.now(timezone.utc)
     db_order = models.Order(
+        id=uuid.uuid4(),
         customer_id=context.customer.id,
         mess_id=context.mess.id,
         table_id=order.table_id,
-        status=order.status
+        status=order.status,
+        created_at=now,
+        updated_at=now,
+        is_cancelled=False,
+        has_added_items=False,
+        item_count=len(lines)
     )
-    db.add(db_order)
-    await db.flush()  
-    
-    order_items = []
-    for item in order.items:
-        menu_item = menu_items_dict[item.menu_item_id]
-        order_items.append(models.OrderItem(
-            order_id=db_order.id,
-            menu_item_id=item.menu_item_id,
-            quantity=item.quantity,
-            total_price=menu_item.price * item.quantity
-        ))
-    
-    db.add_all(order_items)
-    
-    await db.commit()
-    await db.refresh(db_order)
-    result = await db.execute(
-    select(models.Order)
-    .filter(models.Order.id == db_order.id)
-    .options(
-        selectinload(models.Order.customer),
-        selectinload(models.Order.table),
-        selectinload(models.Order.items),
-        selectinload(models.Order.transaction)
+    # One round trip for the order and its items; the statement writes, so keep it on the primary
+    try:
+        result = await db.execute(crud.place_order_statement(db_order, lines), bind_arguments={"writes": True})
+        placed = result.first()
+    except IntegrityError:
+        # A menu item or the table was deleted while the statement ran
+        placed = None
+    if placed is None:
+        await db.rollback()
+        await raise_unplaceable(db, context.mess.id, order)
+    table, db_order.total_price = placed
+    created = schema.OrderCreateResponse(
+        id=db_order.id,
+        table_id=db_order.table_id,
+        mess_id=db_order.mess_id,
+        status=db_order.status
     )
+    # Features for the profiles; read before the commit so record() follows it directly
+    menu = await menu_cache.get(db, context.mess.id)
+    await idempotent.save(db, created)
+    preference_store.record(
+        context.mess.id,
+        context.customer.id,
+        [(menu.by_id[item.menu_item_id], item.quantity) for item in order.items if item.menu_item_id in menu.by_id]
     )
-    db_order = result.scalar_one()
 
-    await sio.emit("add_order", schema.AdminOrderResponse.model_validate(db_order).model_dump(mode="json"), room=f"admin_order_{context.mess.slug}")
-    return db_order
+    # Built from what is already in memory; db_order is never added to the session
+    response = schema.AdminOrderResponse(
+        id=db_order.id,
+        table_id=db_order.table_id,
+        created_at=db_order.created_at,
+        status=db_order.status,
+        total_price=db_order.total_price,
+        item_count=db_order.item_count,
+        has_added_items=False,
+        customer=schema.UserRead.model_validate(context.customer),
+        table=schema.MessTableRead.model_validate(table),
+        transaction=None
+    )
+    await sio.emit("add_order", response.model_dump(mode="json"), room=f"admin_order_{context.mess.slug}")
+    return created
 
 
 @router.get("/popup", response_model=Optional[schema.OrderPopupResponse])
@@ -138,14 +238,10 @@ async def get_order_popup(
     
     order = await db.execute(
         select(models.Order)
-        .options(selectinload(models.Order.items))
         .filter(
             models.Order.mess_id == context.mess.id,
             models.Order.customer_id == context.customer.id,
-            models.Order.status.not_in([
-                models.OrderStatusEnum.COMPLETED,
-                models.OrderStatusEnum.CANCELLED
-            ]),
+            models.active_orders(),
             models.Order.table_id == table_id if table_id else True,
         )
         .order_by(models.Order.created_at.desc())
@@ -205,7 +301,7 @@ async def update_order(
     db: AsyncSession = Depends(get_async_session),
     context: MessCustomerContext = Depends(get_mess_and_customer_context)
 ):
-    db_order = await db.execute(select(models.Order).filter(models.Order.id == order_id))
+    db_order = await db.execute(select(models.Order).filter(models.Order.id == order_id, models.Order.mess_id == context.mess.id))
     db_order = db_order.scalars().first()
     if not db_order:
         raise HTTPException(status_code=404, detail="Order not found")
@@ -216,13 +312,34 @@ async def update_order(
             detail="Cannot update completed or cancelled order"
         )
     
-    if order.status == models.OrderStatusEnum.CANCELLED:
-        db_order.is_cancelled = True
-    
-    for key, value in order.model_dump(exclude_unset=True).items():
-        setattr(db_order, key, value)
-    
+    was_cancelled = bool(db_order.is_cancelled)
+    values = order.model_dump(exclude_unset=True)
+    target = values.pop("status", None)
+    if target == models.OrderStatusEnum.CANCELLED:
+        # Same as the other cancel routes: totals zeroed and the items cancelled below
+        values.update(is_cancelled=True, total_price=0, item_count=0)
+    is_cancelled = bool(values.get("is_cancelled", was_cancelled))
+    lines = await get_active_item_lines(db, order_id) if is_cancelled != was_cancelled else []
+    
+    if target is not None:
+        try:
+            await state.transition(db, db_order, target, **values)
+        except state.TransitionConflict as e:
+            raise HTTPException(status_code=409, detail=str(e))
+    else:
+        for key, value in values.items():
+            setattr(db_order, key, value)
+    if target == models.OrderStatusEnum.CANCELLED:
+        await db.execute(
+            update(models.OrderItem).where(
+                models.OrderItem.order_id == order_id,
+                models.OrderItem.is_cancelled == False
+            ).values(is_cancelled=True)
+        )
+    elif target == models.OrderStatusEnum.COMPLETED:
+        await record_completed_order(db, order_id)
     await db.commit()
+    preference_store.record(context.mess.id, db_order.customer_id, lines, sign=-1 if db_order.is_cancelled else 1)
     await db.refresh(db_order)
     return db_order
 
@@ -234,58 +351,54 @@ async def update_order_status(
     db: AsyncSession = Depends(get_async_session),
     context: MessCustomerContext = Depends(require_mess_access)
 ):
+    db_order = await db.execute(
+        select(models.Order).filter(
+            models.Order.id == order_id,
+            models.Order.mess_id == context.mess.id
+        ).options(selectinload(models.Order.transaction))
+    )
+    db_order = db_order.scalars().first()
+    
+    if not db_order:
+        raise HTTPException(status_code=404, detail="Order not found")
+
+    cancelled_lines = []
+    if status == models.OrderStatusEnum.CANCELLED:
+        cancelled_lines = await get_active_item_lines(db, order_id)
+        values = {"is_cancelled": True, "total_price": 0, "item_count": 0}
+    else:
+        values = {}
     try:
-        db_order = await db.execute(
-            select(models.Order).filter(
-                models.Order.id == order_id,
-                models.Order.mess_id == context.mess.id
-            ).options(selectinload(models.Order.transaction))
+        await state.transition(db, db_order, status, **values)
+    except state.TransitionConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    if status == models.OrderStatusEnum.CANCELLED:
+        await db.execute(
+            update(models.OrderItem).where(
+                models.OrderItem.order_id == order_id,
+                models.OrderItem.is_cancelled == False
+            ).values(is_cancelled=True)
         )
-        db_order = db_order.scalars().first()
-        
-        if not db_order:
-            raise HTTPException(status_code=404, detail="Order not found")
-            
-        if db_order.status in [models.OrderStatusEnum.COMPLETED, models.OrderStatusEnum.CANCELLED]:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Cannot update already {db_order.status} order"
-            )
-
-        if status == models.OrderStatusEnum.CANCELLED and db_order.status == models.OrderStatusEnum.SERVED:
-            raise HTTPException(status_code=400, detail="Order is already served")
-
-        # Update order status
-        db_order.status = status
-        
-        if status == models.OrderStatusEnum.CANCELLED:
-            db_order.is_cancelled = True
-            await db.execute(
-                update(models.OrderItem).where(
-                    models.OrderItem.order_id == order_id,
-                    models.OrderItem.is_cancelled == False
-                ).values(is_cancelled=True)
-            )
-        
-        # Commit the database transaction first
-        await db.commit()
-        
-        # Only emit socket event after successful commit
-        # Convert SQLAlchemy model to dict properly
-        order_data = {
-            "id": str(db_order.id),
-            "status": db_order.status.value,
-            "is_cancelled": db_order.is_cancelled,
-            "mess_id": str(db_order.mess_id),
-            "is_paid": db_order.transaction.status == models.OrderTransactionStatusEnum.SUCCESS if db_order.transaction else False,
-        }
-        await sio.emit("order_update", order_data, room=f"order_{db_order.id}")
-        
-        return db_order
-
-    except Exception as e:
-        await db.rollback()
-        raise HTTPException(status_code=500, detail="Failed to update order status")
+    elif status == models.OrderStatusEnum.COMPLETED:
+        await record_completed_order(db, order_id)
+    
+    # Commit the database transaction first
+    await db.commit()
+    preference_store.record(context.mess.id, db_order.customer_id, cancelled_lines, sign=-1)
+    
+    # Only emit socket event after successful commit
+    # Convert SQLAlchemy model to dict properly
+    order_data = {
+        "id": str(db_order.id),
+        "status": db_order.status.value,
+        "is_cancelled": db_order.is_cancelled,
+        "mess_id": str(db_order.mess_id),
+        "is_paid": db_order.transaction.status == models.OrderTransactionStatusEnum.SUCCESS if db_order.transaction else False,
+    }
+    await sio.emit("order_update", order_data, room=f"order_{db_order.id}")
+    
+    return db_order
 
 @router.patch("/{order_id}/customer-cancel", response_model=schema.OrderUpdate)
 async def update_order_status(
@@ -303,12 +416,14 @@ async def update_order_status(
     if not db_order:
         raise HTTPException(status_code=404, detail="Order not found")
     
-    if db_order.status in [models.OrderStatusEnum.COMPLETED, models.OrderStatusEnum.CANCELLED, models.OrderStatusEnum.SERVED]:
-        raise HTTPException(status_code=400, detail=f"Cannot cancel already {db_order.status} order")
-    
-    # Update order
-    db_order.status = models.OrderStatusEnum.CANCELLED
-    db_order.is_cancelled = True
+    cancelled_lines = await get_active_item_lines(db, order_id)
+    try:
+        await state.transition(
+            db, db_order, models.OrderStatusEnum.CANCELLED,
+            is_cancelled=True, total_price=0, item_count=0
+        )
+    except state.TransitionConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
     
     # Update order items
     await db.execute(
@@ -321,7 +436,7 @@ async def update_order_status(
     )
     
     await db.commit()
-    await db.refresh(db_order)
+    preference_store.record(context.mess.id, db_order.customer_id, cancelled_lines, sign=-1)
     data={
         "id": str(db_order.id),
         "status": models.OrderStatusEnum.CANCELLED.value,
@@ -341,33 +456,39 @@ async def complete_order(
     db: AsyncSession = Depends(get_async_session),
     context: MessCustomerContext = Depends(require_mess_access)
 ):
-    db_order = await db.execute(select(models.Order).options(selectinload(models.Order.transaction),selectinload(models.Order.items)).filter(models.Order.id == order_id,models.Order.mess_id == context.mess.id))
+    db_order = await db.execute(select(models.Order).options(selectinload(models.Order.transaction)).filter(models.Order.id == order_id,models.Order.mess_id == context.mess.id))
     db_order = db_order.scalars().first()
     if not db_order:
         raise HTTPException(status_code=404, detail="Order not found")
     
-    if  db_order.transaction is not None:
+    if db_order.status == models.OrderStatusEnum.COMPLETED and db_order.transaction is None:
+        return db_order
+
+    try:
+        await state.transition(db, db_order, models.OrderStatusEnum.COMPLETED)
+    except state.TransitionConflict as e:
+        if e.current != models.OrderStatusEnum.COMPLETED:
+            raise HTTPException(status_code=409, detail=str(e))
+        # Completed concurrently or earlier; only the payment is left to settle
         await db.execute(update(models.OrderTransaction).where(models.OrderTransaction.order_id == order_id).values(status=models.OrderTransactionStatusEnum.SUCCESS))
-        db_order.status = models.OrderStatusEnum.COMPLETED
         await db.commit()
         return db_order
-    
-    if db_order.status == models.OrderStatusEnum.COMPLETED:
-        return db_order
-    
-    db_order.transaction = models.OrderTransaction(
-        order_id=order_id,
-        transaction_id=str(uuid.uuid4()).replace("-", ""),
-        payment_url=f"#",
-        payment_id=str(uuid.uuid4()).replace("-", ""),
-        amount=db_order.total_price,
-        currency=context.mess.currency,
-        payment_method=models.PaymentMethodEnum.CASH,
-        status=models.OrderTransactionStatusEnum.SUCCESS,
-    )
-    db_order.status = models.OrderStatusEnum.COMPLETED
+
+    if db_order.transaction is not None:
+        db_order.transaction.status = models.OrderTransactionStatusEnum.SUCCESS
+    else:
+        db_order.transaction = models.OrderTransaction(
+            order_id=order_id,
+            transaction_id=str(uuid.uuid4()).replace("-", ""),
+            payment_url=f"#",
+            payment_id=str(uuid.uuid4()).replace("-", ""),
+            amount=db_order.total_price,
+            currency=context.mess.currency,
+            payment_method=models.PaymentMethodEnum.CASH,
+            status=models.OrderTransactionStatusEnum.SUCCESS,
+        )
+    await record_completed_order(db, order_id)
     await db.commit()
-    await db.refresh(db_order)
     order_data = {
         "id": str(db_order.id),
         "status": db_order.status.value,
@@ -389,7 +510,7 @@ async def cancel_order_item(
         select(models.OrderItem)
         .options(
             selectinload(models.OrderItem.order).selectinload(models.Order.transaction),
-            selectinload(models.OrderItem.order).selectinload(models.Order.items)
+            selectinload(models.OrderItem.menu_item)
         )
         .filter(
             models.OrderItem.id == item_id,
@@ -412,14 +533,21 @@ async def cancel_order_item(
     
     db_item.is_cancelled = True
     db_item.order.has_added_items = True
+    await crud.adjust_totals(db, db_item.order, -db_item.total_price, -1)
+    # Cancelling the last live item cancels the order, in the same transaction
+    order_cancelled = db_item.order.item_count == 0
+    if order_cancelled:
+        try:
+            await state.transition(
+                db, db_item.order, models.OrderStatusEnum.CANCELLED,
+                is_cancelled=True, has_added_items=True
+            )
+        except state.TransitionConflict as e:
+            raise HTTPException(status_code=409, detail=str(e))
     await db.commit()
+    preference_store.record(context.mess.id, db_item.order.customer_id, [(db_item.menu_item, db_item.quantity)], sign=-1)
     await db.refresh(db_item)
-    if len([item for item in db_item.order.items if not item.is_cancelled]) == 0:
-        db_item.order.status = models.OrderStatusEnum.CANCELLED
-        db_item.order.is_cancelled = True
-        db_item.order.has_added_items = True
-        db_item.is_cancelled = True
-        await db.commit()
+    if order_cancelled:
         data={
         "id": str(db_item.order.id),
         "status": models.OrderStatusEnum.CANCELLED.value,
@@ -440,7 +568,7 @@ async def cancel_order_item(
     db: AsyncSession = Depends(get_async_session),
     context: MessCustomerContext = Depends(require_mess_access)
 ):
-    db_item = await db.execute(select(models.OrderItem).options(selectinload(models.OrderItem.order)).filter(models.OrderItem.id == item_id,models.OrderItem.order_id == order_id))
+    db_item = await db.execute(select(models.OrderItem).options(selectinload(models.OrderItem.order),selectinload(models.OrderItem.menu_item)).filter(models.OrderItem.id == item_id,models.OrderItem.order_id == order_id))
     db_item = db_item.scalars().first()
     if not db_item:
         raise HTTPException(status_code=404, detail="Order item not found")
@@ -457,7 +585,9 @@ async def cancel_order_item(
         return db_item
     
     db_item.is_cancelled = True
+    await crud.adjust_totals(db, db_item.order, -db_item.total_price, -1)
     await db.commit()
+    preference_store.record(context.mess.id, db_item.order.customer_id, [(db_item.menu_item, db_item.quantity)], sign=-1)
     await db.refresh(db_item)
     await sio.emit("cancel_order_item", str(db_item.id), room=f"order_{db_item.order_id}")
     return db_item
@@ -482,7 +612,7 @@ async def add_order_item(
         )
     
     menu_item_ids = [item.menu_item_id for item in items]
-    result = await db.execute(select(MenuItem).filter(MenuItem.id.in_(menu_item_ids)))
+    result = await db.execute(select(MenuItem).filter(MenuItem.id.in_(menu_item_ids), MenuItem.mess_id == context.mess.id))
     menu_items = result.scalars().all()
     menu_items_dict = {item.id: item for item in menu_items}
     missing_items = set(menu_item_ids) - set(menu_items_dict.keys())
@@ -496,50 +626,57 @@ async def add_order_item(
         if not menu_item.in_stock:
             raise HTTPException(status_code=400, detail=f"Menu item {item.menu_item_id} is not in stock")
         
-    db_items = []
-    for item in items:
-        menu_item = menu_items_dict[item.menu_item_id]
-        db_items.append(models.OrderItem(
-            order_id=order_id,
-            menu_item_id=item.menu_item_id,
-            quantity=item.quantity,
-            total_price=menu_item.price * item.quantity,
-            is_cancelled=False
-        ))
-    
-    db_order.has_added_items = True
-    db_order.status = models.OrderStatusEnum.PENDING
-    db.add_all(db_items)
-    db.add(db_order)
+    # Line totals are stored as integers
+    rows = [
+        {
+            "order_id": order_id,
+            "menu_item_id": item.menu_item_id,
+            "quantity": item.quantity,
+            "total_price": int(menu_items_dict[item.menu_item_id].price * item.quantity),
+            "is_cancelled": False,
+        }
+        for item in items
+    ]
+    # One batched INSERT for all rows, generated ids back in input order
+    result = await db.execute(
+        insert(models.OrderItem).returning(models.OrderItem.id, sort_by_parameter_order=True),
+        rows
+    )
+    new_ids = result.scalars().all()
+    await crud.adjust_totals(
+        db, db_order, sum(row["total_price"] for row in rows), len(rows),
+        has_added_items=True, status=models.OrderStatusEnum.PENDING
+    )
     await db.commit()
-    
-    for item in db_items:
-        await db.refresh(item)
-    
-    new_item_ids = [item.id for item in db_items]
-    stmt = (
-        select(models.OrderItem)
-        .options(selectinload(models.OrderItem.menu_item))
-        .where(models.OrderItem.id.in_(new_item_ids))
+    preference_store.record(
+        context.mess.id,
+        db_order.customer_id,
+        [(menu_items_dict[item.menu_item_id], item.quantity) for item in items]
     )
     
-    result = await db.execute(stmt)
-    new_order_items = result.scalars().all()
-    new_items_response = [schema.OrderItemResponse.model_validate(item).model_dump(mode="json") for item in new_order_items]
+    new_items = [
+        schema.OrderItemResponse(
+            id=item_id,
+            menu_item=MenuItemResponse.model_validate(menu_items_dict[row["menu_item_id"]]),
+            **row
+        )
+        for item_id, row in zip(new_ids, rows)
+    ]
     response={
-        "items":new_items_response,
+        "items":[item.model_dump(mode="json") for item in new_items],
         "order_id":str(order_id)
     }
     await sio.emit("add_order_item", response, room=f"admin_order_{context.mess.slug}")
  
     
-    return db_items
+    return new_items
 
 
 
 @router.delete("/{order_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_order(order_id: uuid.UUID, db: Session = Depends(get_async_session),context: MessCustomerContext = Depends(get_mess_and_customer_context)):
-    db_order = db.query(models.Order).filter(models.Order.id == order_id).first()
+async def delete_order(order_id: uuid.UUID, db: AsyncSession = Depends(get_async_session),context: MessCustomerContext = Depends(get_mess_and_customer_context)):
+    db_order = await db.execute(select(models.Order).filter(models.Order.id == order_id, models.Order.mess_id == context.mess.id))
+    db_order = db_order.scalars().first()
     if not db_order:
         raise HTTPException(status_code=404, detail="Order not found")
     
@@ -550,18 +687,23 @@ def delete_order(order_id: uuid.UUID, db: Session = Depends(get_async_session),c
             detail="Can only delete pending or cancelled orders"
         )
     
-    db.delete(db_order)
-    db.commit()
+    # A cancelled order's lines were taken out of the profile when it was cancelled
+    lines = [] if db_order.is_cancelled else await get_active_item_lines(db, order_id)
+    # Items and transaction go with it through the ON DELETE CASCADE foreign keys
+    await db.execute(delete(models.Order).where(models.Order.id == order_id))
+    await db.commit()
+    preference_store.record(context.mess.id, db_order.customer_id, lines, sign=-1)
 
 
-@router.put("/items/{item_id}", response_model=schema.OrderItemResponse)
-def update_order_item(
-    item_id: uuid.UUID,
-    item: schema.OrderItemUpdate,
-    db: Session = Depends(get_async_session),
-    context: MessCustomerContext = Depends(get_mess_and_customer_context)
-):
-    db_item = db.query(models.OrderItem).filter(models.OrderItem.id == item_id).first()
+async def get_modifiable_item(db: AsyncSession, item_id: uuid.UUID, mess_id: uuid.UUID) -> models.OrderItem:
+    """An item of a pending or received order of this mess, with its order and menu item loaded"""
+    db_item = await db.execute(
+        select(models.OrderItem)
+        .join(models.Order, models.Order.id == models.OrderItem.order_id)
+        .options(selectinload(models.OrderItem.order), selectinload(models.OrderItem.menu_item))
+        .filter(models.OrderItem.id == item_id, models.Order.mess_id == mess_id)
+    )
+    db_item = db_item.scalars().first()
     if not db_item:
         raise HTTPException(status_code=404, detail="Order item not found")
     
@@ -569,31 +711,46 @@ def update_order_item(
     if db_item.order.status not in [models.OrderStatusEnum.PENDING, models.OrderStatusEnum.RECEIVED]:
         raise HTTPException(
             status_code=400,
-            detail="Can only update items in pending or received orders"
+            detail="Can only change items in pending or received orders"
         )
-    
-    for key, value in item.model_dump(exclude_unset=True).items():
-        setattr(db_item, key, value)
-    
-    db.commit()
-    db.refresh(db_item)
     return db_item
 
-@router.delete("/items/{item_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_order_item(item_id: uuid.UUID, db: Session = Depends(get_async_session),context: MessCustomerContext = Depends(get_mess_and_customer_context)):
-    db_item = db.query(models.OrderItem).filter(models.OrderItem.id == item_id).first()
-    if not db_item:
-        raise HTTPException(status_code=404, detail="Order item not found")
+
+@router.put("/items/{item_id}", response_model=schema.OrderItemResponse)
+async def update_order_item(
+    item_id: uuid.UUID,
+    item: schema.OrderItemUpdate,
+    db: AsyncSession = Depends(get_async_session),
+    context: MessCustomerContext = Depends(get_mess_and_customer_context)
+):
+    db_item = await get_modifiable_item(db, item_id, context.mess.id)
+    if item.quantity is None or item.quantity == db_item.quantity:
+        return db_item
     
-    # Check if order can be modified
-    if db_item.order.status not in [models.OrderStatusEnum.PENDING, models.OrderStatusEnum.RECEIVED]:
-        raise HTTPException(
-            status_code=400,
-            detail="Can only delete items from pending or received orders"
+    # Keep the unit price the item was ordered at
+    quantity_delta = item.quantity - db_item.quantity
+    new_total = round(db_item.total_price * item.quantity / db_item.quantity)
+    if not db_item.is_cancelled:
+        await crud.adjust_totals(db, db_item.order, new_total - db_item.total_price, 0)
+    db_item.quantity = item.quantity
+    db_item.total_price = new_total
+    await db.commit()
+    if not db_item.is_cancelled and db_item.menu_item is not None:
+        preference_store.record(
+            context.mess.id, db_item.order.customer_id,
+            [(db_item.menu_item, abs(quantity_delta))], sign=1 if quantity_delta > 0 else -1
         )
-    
-    db.delete(db_item)
-    db.commit()
+    return db_item
+
+@router.delete("/items/{item_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_order_item(item_id: uuid.UUID, db: AsyncSession = Depends(get_async_session),context: MessCustomerContext = Depends(get_mess_and_customer_context)):
+    db_item = await get_modifiable_item(db, item_id, context.mess.id)
+    if not db_item.is_cancelled:
+        await crud.adjust_totals(db, db_item.order, -db_item.total_price, -1)
+    await db.delete(db_item)
+    await db.commit()
+    if not db_item.is_cancelled and db_item.menu_item is not None:
+        preference_store.record(context.mess.id, db_item.order.customer_id, [(db_item.menu_item, db_item.quantity)], sign=-1)
 
 
 @router.get("/transactions/{transaction_id}", response_model=schema.OrderTransactionResponse)
@@ -605,8 +762,34 @@ async def get_order_transaction(transaction_id: uuid.UUID, db: AsyncSession = De
     return transaction
 
 @router.post("/{order_id}/checkout/initiate/khalti", response_model=schema.OrderTransactionResponse)
-async def checkout_khalti(order_id: uuid.UUID, db: AsyncSession = Depends(get_async_session),context: MessCustomerContext = Depends(get_mess_and_customer_context)):
-    db_order = await db.execute(select(models.Order).options(selectinload(models.Order.transaction),selectinload(models.Order.items)).filter(models.Order.id == order_id))
+async def checkout_khalti(
+    order_id: uuid.UUID,
+    idempotency_key: Optional[str] = Header(None, max_length=idempotency.MAX_KEY_LENGTH),
+    db: AsyncSession = Depends(get_async_session),
+    context: MessCustomerContext = Depends(get_mess_and_customer_context)
+):
+    """
+    Start a Khalti payment. Retries sent with the same Idempotency-Key get the first
+    response back without calling Khalti again; the key is committed before the
+    call, so a retry that arrives during it gets 409.
+    """
+    idempotent = await claim_idempotency_key(db, "checkout_khalti", context, idempotency_key, {"order_id": order_id}, commit=True)
+    if idempotent.replay is not None:
+        return idempotent.replay
+    try:
+        return await initiate_khalti_payment(order_id, db, context, idempotent)
+    except Exception:
+        await idempotent.release(db)
+        raise
+
+
+async def initiate_khalti_payment(
+    order_id: uuid.UUID,
+    db: AsyncSession,
+    context: MessCustomerContext,
+    idempotent: idempotency.IdempotentRequest,
+):
+    db_order = await db.execute(select(models.Order).options(selectinload(models.Order.transaction)).filter(models.Order.id == order_id))
     db_order = db_order.scalars().first()
     if not db_order:
         raise HTTPException(status_code=404, detail="Order not found")
@@ -651,16 +834,14 @@ async def checkout_khalti(order_id: uuid.UUID, db: AsyncSession = Depends(get_as
                     payment_method=models.PaymentMethodEnum.KHALTI,
                     status=models.OrderTransactionStatusEnum.PENDING,
                 )
-                    await db.commit()
-                    await db.refresh(db_order)
-                    return db_order.transaction
                 else:
                     db_order.transaction.payment_url = response.get("payment_url")
                     db_order.transaction.payment_id = response.get("pidx")
                     db_order.transaction.status = models.OrderTransactionStatusEnum.PENDING
-                    await db.commit()
-                    await db.refresh(db_order)
-                    return db_order.transaction
+                await db.flush()
+                transaction = schema.OrderTransactionResponse.model_validate(db_order.transaction)
+                await idempotent.save(db, transaction)
+                return transaction
                 
             else:
                 raise HTTPException(status_code=400, detail="Failed to initiate payment")
@@ -671,7 +852,11 @@ async def checkout_khalti(order_id: uuid.UUID, db: AsyncSession = Depends(get_as
     
 @router.get("/{order_id}/checkout/callback/khalti", response_model=Optional[schema.OrderTransactionResponse])
 async def checkout_callback_khalti(order_id: uuid.UUID, is_success: bool,transaction_id: Optional[str] = None,db: AsyncSession = Depends(get_async_session),context: MessCustomerContext = Depends(get_mess_and_customer_context)):
-    db_order = await db.execute(select(models.Order).options(selectinload(models.Order.transaction),selectinload(models.Order.items)).filter(models.Order.id == order_id))
+    # Settles the payment below, so read the transaction from the primary, not a lagging replica
+    db_order = await db.execute(
+        select(models.Order).options(selectinload(models.Order.transaction)).filter(models.Order.id == order_id),
+        bind_arguments={"writes": True}
+    )
     db_order = db_order.scalars().first()
     if not db_order:
         raise HTTPException(status_code=404, detail="Order not found")
@@ -684,7 +869,12 @@ async def checkout_callback_khalti(order_id: uuid.UUID, is_success: bool,transac
 
     if is_success and transaction_id:
         await db.execute(update(models.OrderTransaction).where(models.OrderTransaction.order_id == order_id).values(status=models.OrderTransactionStatusEnum.SUCCESS ,transaction_id=transaction_id))
-        await db.execute(update(models.Order).where(models.Order.id == order_id).values(status=models.OrderStatusEnum.COMPLETED))
+        try:
+            await state.transition(db, db_order, models.OrderStatusEnum.COMPLETED)
+            await record_completed_order(db, order_id)
+        except state.TransitionConflict as e:
+            if e.current != models.OrderStatusEnum.COMPLETED:
+                raise HTTPException(status_code=409, detail=str(e))
         await sio.emit("order_paid", {"id": str(db_order.id), "status": models.OrderStatusEnum.COMPLETED.value,"paid_with":models.PaymentMethodEnum.KHALTI.value,"transaction_id":transaction_id}, room=f"admin_order_{context.mess.slug}")
     else:
         await db.delete(db_order.transaction)
@@ -116,6 +116,7 @@ class AdminOrderResponse(BaseModel):
     created_at: datetime
     status: OrderStatusEnum
     total_price: int
+    item_count: int
     has_added_items: bool
     customer: Optional['UserRead'] = None
     table: Optional['MessTableRead'] = None
@@ -0,0 +1,70 @@
+from typing import Dict, FrozenSet, Optional
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+from .models import Order, OrderStatusEnum
+
+PENDING = OrderStatusEnum.PENDING
+RECEIVED = OrderStatusEnum.RECEIVED
+PREPARING = OrderStatusEnum.PREPARING
+READY = OrderStatusEnum.READY
+SERVED = OrderStatusEnum.SERVED
+COMPLETED = OrderStatusEnum.COMPLETED
+CANCELLED = OrderStatusEnum.CANCELLED
+
+KITCHEN = frozenset({PENDING, RECEIVED, PREPARING, READY, SERVED})
+
+# Statuses each status may move to. The kitchen can step back and forth while an
+# order is in service; served food can no longer be cancelled, and completed or
+# cancelled orders never change again.
+TRANSITIONS: Dict[OrderStatusEnum, FrozenSet[OrderStatusEnum]] = {
+    PENDING: KITCHEN | {COMPLETED, CANCELLED},
+    RECEIVED: KITCHEN | {COMPLETED, CANCELLED},
+    PREPARING: KITCHEN | {COMPLETED, CANCELLED},
+    READY: KITCHEN | {COMPLETED, CANCELLED},
+    SERVED: KITCHEN | {COMPLETED},
+    COMPLETED: frozenset(),
+    CANCELLED: frozenset(),
+}
+
+
+def sources(target: OrderStatusEnum) -> FrozenSet[OrderStatusEnum]:
+    """Statuses from which an order may move to target"""
+    return frozenset(status for status, targets in TRANSITIONS.items() if target in targets)
+
+
+class TransitionConflict(Exception):
+    """The order was not in a status that can move to the target"""
+
+    def __init__(self, current: Optional[OrderStatusEnum], target: OrderStatusEnum):
+        self.current = current
+        self.target = target
+        current_name = current.value if current is not None else "deleted"
+        super().__init__(f"Cannot move {current_name} order to {target.value}")
+
+
+async def transition(db: AsyncSession, order: Order, target: OrderStatusEnum, **values) -> None:
+    """
+    Move an order to target, together with any other column values given, in one
+    conditional UPDATE ... WHERE status IN (...) RETURNING. The check and the write
+    are the same statement, so of two racing transitions the second is evaluated
+    against the row the first committed, and raises TransitionConflict if it is no
+    longer allowed. The order is updated in place either way.
+    """
+    result = await db.execute(
+        update(Order)
+        .where(Order.id == order.id, Order.status.in_(sources(target)))
+        .values(status=target, **values)
+        .returning(Order.updated_at)
+        .execution_options(synchronize_session=False)
+    )
+    updated_at = result.scalar_one_or_none()
+    if updated_at is None:
+        current = (await db.execute(select(Order.status).where(Order.id == order.id))).scalar_one_or_none()
+        if current is not None:
+            set_committed_value(order, "status", current)
+        raise TransitionConflict(current, target)
+    set_committed_value(order, "status", target)
+    set_committed_value(order, "updated_at", updated_at)
+    for key, value in values.items():
+        set_committed_value(order, key, value)
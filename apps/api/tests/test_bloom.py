@@ -0,0 +1,130 @@
+"""
+The Bloom filter in front of the mess registry, and the registry rebuilding it
+from the mess table once writes have saturated it. The mess table is replaced by
+a list of slugs.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+import pytest
+from db import session as db_session
+from mess import registry as registry_module
+from mess.registry import MessRegistry
+from utils.bloom import BloomFilter
+
+
+def slugs(prefix: str, n: int):
+    return [f"{prefix}-{i}" for i in range(n)]
+
+
+def false_positive_rate(bloom: BloomFilter, n: int = 20000) -> float:
+    return sum(key in bloom for key in slugs("absent", n)) / n
+
+
+def test_no_false_negatives_after_add():
+    bloom = BloomFilter(capacity=1000)
+    for key in slugs("mess", 1000):
+        bloom.add(key)
+
+    assert all(key in bloom for key in slugs("mess", 1000))
+    assert not bloom.saturated
+
+
+def test_false_positives_stay_near_error_rate_within_capacity():
+    bloom = BloomFilter.from_keys(slugs("mess", 1000), error_rate=0.01, headroom=1.0)
+
+    assert false_positive_rate(bloom) < 0.02
+
+
+def test_empty_filter_rejects_everything():
+    assert false_positive_rate(BloomFilter.from_keys([]), n=1000) == 0.0
+
+
+def test_saturated_filter_keeps_every_key_but_admits_more_strangers():
+    bloom = BloomFilter(capacity=100)
+    for key in slugs("mess", 100):
+        bloom.add(key)
+    within_capacity = false_positive_rate(bloom)
+    for key in slugs("later", 900):
+        bloom.add(key)
+
+    assert bloom.saturated
+    assert all(key in bloom for key in slugs("mess", 100) + slugs("later", 900))
+    assert false_positive_rate(bloom) > within_capacity
+
+
+class FakeMessTable:
+    """Stands in for use_session() over the mess table; each query can be held until released"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = 0
+        self.sessions = []
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+        self.release.set()
+
+    @asynccontextmanager
+    async def use_session(self):
+        # The request session the query would have borrowed, if any
+        self.sessions.append(db_session._request_session.get())
+        yield self
+
+    async def execute(self, query):
+        self.queries += 1
+        rows = list(self.rows)
+        self.started.set()
+        await self.release.wait()
+        return SimpleNamespace(scalars=lambda: SimpleNamespace(all=lambda: rows))
+
+
+@pytest.fixture
+def mess_table(monkeypatch):
+    table = FakeMessTable(slugs("mess", 10))
+    monkeypatch.setattr(registry_module, "use_session", table.use_session)
+    return table
+
+
+def test_saturated_filter_is_rebuilt_outside_the_request_session(mess_table):
+    async def scenario():
+        registry = MessRegistry()
+        await registry.load_slugs()
+        registry.slugs = BloomFilter(capacity=1)
+        mess_table.started.clear()
+        # Invalidations run after a request's commit, with its session published
+        db_session._request_session.set(object())
+        for slug in slugs("mess-new", 3):
+            registry.invalidate(slug)
+        await mess_table.started.wait()
+        while registry.slugs.saturated:
+            await asyncio.sleep(0)
+        # Let any further rebuild run before counting
+        for _ in range(10):
+            await asyncio.sleep(0)
+        return registry
+
+    registry = asyncio.run(scenario())
+
+    # The initial load, then a single rebuild
+    assert mess_table.queries == 2
+    assert mess_table.sessions == [None, None]
+    assert not registry.slugs.saturated
+    assert all(slug in registry.slugs for slug in slugs("mess", 10))
+
+
+def test_slugs_written_during_a_rebuild_are_kept(mess_table):
+    async def scenario():
+        registry = MessRegistry()
+        mess_table.release.clear()
+        rebuild = asyncio.create_task(registry.load_slugs())
+        await mess_table.started.wait()
+        # Created after the query read the table
+        registry.invalidate("mess-created")
+        mess_table.release.set()
+        await rebuild
+        return registry
+
+    registry = asyncio.run(scenario())
+
+    assert "mess-created" in registry.slugs
+    assert registry.cached("mess-created") == (False, None)
@@ -0,0 +1,265 @@
+"""
+Idempotency-Key handling: the per-worker LRU of stored responses, and claims,
+replays and releases against the idempotency_keys table.
+
+The claim tests need a Postgres database: set TEST_DATABASE_URI. Everything is
+created in the test_idempotency schema, which is dropped afterwards. Run from apps/api:
+    TEST_DATABASE_URI=postgresql+asyncpg://... python -m pytest tests
+"""
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+# The routes first: they import the auth stack in the order the app does
+from orders.route import claim_idempotency_key
+from db.base import Base
+from auth.models import Customer, User
+from mess.models import Mess
+from orders.idempotency import (
+    REPLAYED_HEADER,
+    IdempotencyKeyReused,
+    IdempotencyStore,
+    StoredResponse,
+    fingerprint,
+)
+from orders.models import IdempotencyKey
+
+SCHEMA = "test_idempotency"
+DATABASE_URI = os.environ.get("TEST_DATABASE_URI")
+
+needs_database = pytest.mark.skipif(not DATABASE_URI, reason="TEST_DATABASE_URI is not set")
+
+CUSTOMER = uuid.uuid4()
+PAYLOAD = {"table_id": "t1", "items": [{"menu_item_id": "m1", "quantity": 2}]}
+
+
+def key(name="k1"):
+    return ("create_order", CUSTOMER, name)
+
+
+def stored(payload=PAYLOAD, body=None):
+    return StoredResponse(fingerprint(payload), 200, body or {"id": "o1"})
+
+
+class NoDatabase:
+    """Fails the test if the claim reaches the database"""
+
+    async def execute(self, *args, **kwargs):
+        raise AssertionError("unexpected query")
+
+    async def commit(self):
+        self.committed = True
+
+
+def test_remembered_response_is_returned():
+    store = IdempotencyStore()
+    store.remember(key(), stored())
+
+    assert store.get(key()) == stored()
+    assert store.get(key("k2")) is None
+
+
+def test_least_recently_used_response_is_evicted():
+    store = IdempotencyStore(maxsize=2)
+    store.remember(key("k1"), stored())
+    store.remember(key("k2"), stored())
+    store.get(key("k1"))
+    store.remember(key("k3"), stored())
+
+    assert store.get(key("k2")) is None
+    assert store.get(key("k1")) is not None
+    assert store.get(key("k3")) is not None
+
+
+def test_expired_response_is_dropped():
+    store = IdempotencyStore(ttl=0)
+    store.remember(key(), stored())
+
+    assert store.get(key()) is None
+
+
+def test_fingerprint_ignores_key_order():
+    assert fingerprint({"a": 1, "b": [1, 2]}) == fingerprint({"b": [1, 2], "a": 1})
+    assert fingerprint({"a": 1}) != fingerprint({"a": 2})
+
+
+def test_request_without_key_is_not_tracked():
+    async def scenario():
+        db = NoDatabase()
+        request = await IdempotencyStore().claim(db, "create_order", CUSTOMER, None, PAYLOAD)
+        await request.save(db, {"id": "o1"})
+        return request, db
+
+    request, db = asyncio.run(scenario())
+
+    assert request.key is None and request.replay is None
+    assert db.committed
+
+
+def test_remembered_response_is_replayed_without_a_query():
+    store = IdempotencyStore()
+    store.remember(key(), stored(body={"id": "o1"}))
+
+    request = asyncio.run(store.claim(NoDatabase(), "create_order", CUSTOMER, "k1", PAYLOAD))
+
+    assert request.replay.status_code == 200
+    assert request.replay.body == b'{"id":"o1"}'
+    assert request.replay.headers[REPLAYED_HEADER] == "true"
+
+
+def test_remembered_key_with_other_payload_is_rejected():
+    store = IdempotencyStore()
+    store.remember(key(), stored())
+
+    with pytest.raises(IdempotencyKeyReused):
+        asyncio.run(store.claim(NoDatabase(), "create_order", CUSTOMER, "k1", {**PAYLOAD, "table_id": "t2"}))
+
+
+async def seed(db: AsyncSession):
+    owner = User(email="owner@test.local", hashed_password="-", is_active=True, is_superuser=False, is_verified=True)
+    db.add(owner)
+    await db.flush()
+    mess = Mess(name="Test", slug="test-idempotency", owner_id=owner.id)
+    db.add(mess)
+    await db.flush()
+    customer = Customer(email="customer@test.local", hashed_password="-", is_active=True, is_superuser=False,
+                        is_verified=True, mess_id=mess.id)
+    db.add(customer)
+    await db.commit()
+    return SimpleNamespace(mess=mess, customer=customer)
+
+
+def in_schema(scenario):
+    """Run scenario(Session, context) against a freshly created schema, dropped afterwards"""
+    async def run():
+        engine = create_async_engine(
+            DATABASE_URI.split("?")[0],
+            connect_args={"server_settings": {"search_path": f"{SCHEMA}, public"}},
+        )
+        Session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        async with engine.begin() as conn:
+            await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm SCHEMA public"))
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+            await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+            await conn.run_sync(Base.metadata.create_all)
+        try:
+            async with Session() as db:
+                context = await seed(db)
+            return await scenario(Session, context)
+        finally:
+            async with engine.begin() as conn:
+                await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+            await engine.dispose()
+
+    return asyncio.run(run())
+
+
+async def stored_row(Session, context):
+    async with Session() as db:
+        result = await db.execute(select(IdempotencyKey).where(IdempotencyKey.customer_id == context.customer.id))
+        return result.scalars().one_or_none()
+
+
+@needs_database
+def test_stored_response_is_replayed_by_another_worker():
+    async def scenario(Session, context):
+        async with Session() as db:
+            first = await IdempotencyStore().claim(db, "create_order", context.customer.id, "k1", PAYLOAD)
+            await first.save(db, {"id": "o1"}, status_code=201)
+        # A fresh store has nothing in its LRU, so the response comes from the table
+        async with Session() as db:
+            retry = await IdempotencyStore().claim(db, "create_order", context.customer.id, "k1", PAYLOAD)
+        return first, retry
+
+    first, retry = in_schema(scenario)
+
+    assert first.replay is None
+    assert retry.replay.status_code == 201
+    assert retry.replay.body == b'{"id":"o1"}'
+
+
+@needs_database
+def test_key_reused_with_other_payload_is_422():
+    async def scenario(Session, context):
+        async with Session() as db:
+            first = await claim_idempotency_key(db, "create_order", context, "k1", PAYLOAD)
+            await first.save(db, {"id": "o1"})
+        async with Session() as db:
+            with pytest.raises(HTTPException) as rejected:
+                await claim_idempotency_key(db, "create_order", context, "k1", {**PAYLOAD, "table_id": "t2"})
+        return rejected.value
+
+    rejected = in_schema(scenario)
+
+    assert rejected.status_code == 422
+
+
+@needs_database
+def test_key_in_progress_is_409():
+    async def scenario(Session, context):
+        async with Session() as db:
+            # Committed claim without a response yet, like a Khalti checkout calling out
+            await IdempotencyStore().claim(db, "checkout_khalti", context.customer.id, "k1", PAYLOAD, commit=True)
+            async with Session() as other:
+                with pytest.raises(HTTPException) as rejected:
+                    await claim_idempotency_key(other, "checkout_khalti", context, "k1", PAYLOAD)
+        return rejected.value
+
+    rejected = in_schema(scenario)
+
+    assert rejected.status_code == 409
+
+
+@needs_database
+def test_expired_key_is_claimed_again_in_place():
+    async def scenario(Session, context):
+        store = IdempotencyStore(ttl=60)
+        async with Session() as db:
+            first = await store.claim(db, "create_order", context.customer.id, "k1", PAYLOAD)
+            await first.save(db, {"id": "o1"})
+            # Past the ttl; this store already purged, so the row is still there
+            await db.execute(
+                update(IdempotencyKey)
+                .where(IdempotencyKey.customer_id == context.customer.id)
+                .values(created_at=datetime.now(timezone.utc) - timedelta(minutes=2))
+            )
+            await db.commit()
+        store.clear()
+        other_payload = {**PAYLOAD, "table_id": "t2"}
+        async with Session() as db:
+            second = await store.claim(db, "create_order", context.customer.id, "k1", other_payload, commit=True)
+        return second, await stored_row(Session, context), other_payload
+
+    second, row, other_payload = in_schema(scenario)
+
+    assert second.replay is None
+    assert row.fingerprint == fingerprint(other_payload)
+    assert row.status_code is None and row.response is None
+    assert row.created_at > datetime.now(timezone.utc) - timedelta(minutes=1)
+
+
+@needs_database
+def test_release_after_failure_lets_a_retry_run():
+    async def scenario(Session, context):
+        store = IdempotencyStore()
+        async with Session() as db:
+            claimed = await store.claim(db, "checkout_khalti", context.customer.id, "k1", PAYLOAD, commit=True)
+            # The payment provider failed; the handler gives the key back
+            await claimed.release(db)
+        released = await stored_row(Session, context)
+        async with Session() as db:
+            retry = await store.claim(db, "checkout_khalti", context.customer.id, "k1", PAYLOAD)
+            await retry.save(db, {"pidx": "p1"})
+        return released, retry, await stored_row(Session, context)
+
+    released, retry, row = in_schema(scenario)
+
+    assert released is None
+    assert retry.replay is None
+    assert (row.status_code, row.response) == (200, {"pidx": "p1"})
@@ -0,0 +1,66 @@
+"""
+MenuColumns.name_mask narrows candidates with the name trigram index; it must
+still match exactly the names a plain substring search over every row finds.
+"""
+import random
+import uuid
+from datetime import datetime
+import numpy as np
+import pytest
+from menu.columns import MenuColumns
+from menu.schema import MenuItemSnapshot
+
+NAMES = [
+    "Chicken Tikka Masala", "Paneer Tikka", "Veg Momo", "Buff Momo (Steamed)", "Jhol-Momo",
+    "Crème Brûlée", "Açaí Bowl", "Smørrebrød", "Phở Bò", "Gyūdon", "Straße Pretzel",
+    "Dal Bhat Tarkari", "Sel Roti", "Aloo_Tama", "7UP 500ml", "Chow Mein", "Mo:Mo",
+    "दाल भात", "寿司 Platter", "Käse Spätzle", "İskender Kebab", "ÅLAND PANCAKE", "",
+]
+
+QUERIES = [
+    # Shorter than a trigram: every row is a candidate
+    "", "a", "Mo", "é", "ö", "寿", " M",
+    # Within one word, any case
+    "chick", "TIKKA", "momo", "brûl", "CRÈME", "spätz", "smørre", "phở", "दाल", "寿司",
+    # Across word boundaries and punctuation
+    "n tikka", "momo (", "l-mo", "o:m", "loo_t", "p 5", "a mas",
+    # Absent
+    "pizza", "xyz", "brulee", "tikka chicken",
+]
+
+
+def snapshot(name: str) -> MenuItemSnapshot:
+    now = datetime.now()
+    return MenuItemSnapshot(
+        id=uuid.uuid4(), mess_id=uuid.uuid4(), category_id=uuid.uuid4(), name=name, price=100,
+        calories=None, spiciness=None, is_veg=False, created_at=now, updated_at=now,
+    )
+
+
+def brute_force(columns: MenuColumns, q: str) -> np.ndarray:
+    return np.char.find(columns.names, q.lower()) >= 0
+
+
+@pytest.fixture(scope="module")
+def columns():
+    return MenuColumns([snapshot(name) for name in NAMES])
+
+
+@pytest.mark.parametrize("q", QUERIES)
+def test_name_mask_matches_brute_force(columns, q):
+    np.testing.assert_array_equal(columns.name_mask(q), brute_force(columns, q))
+
+
+def test_name_mask_matches_brute_force_on_random_substrings(columns):
+    random.seed(8)
+    for _ in range(500):
+        name = random.choice(NAMES).lower()
+        start = random.randrange(len(name) + 1)
+        q = name[start:start + random.randint(1, 8)]
+        if random.random() < 0.5:
+            q = q.upper()
+        np.testing.assert_array_equal(columns.name_mask(q), brute_force(columns, q), err_msg=repr(q))
+
+
+def test_name_mask_of_empty_menu():
+    assert MenuColumns([]).name_mask("momo").shape == (0,)
@@ -0,0 +1,87 @@
+"""
+Active order feed: cursors handed to clients, and If-None-Match handling.
+"""
+import base64
+import json
+import uuid
+from datetime import datetime, timedelta, timezone
+import pytest
+# The routes first: they import the auth stack in the order the app does
+import orders.route  # noqa: F401
+from orders.feed import InvalidCursor, decode_cursor, encode_cursor, etag_for, etag_matches
+
+KEY = (3, datetime(2025, 3, 1, 12, 30, 15, 123456, tzinfo=timezone(timedelta(hours=5, minutes=45))), uuid.uuid4())
+
+
+def encoded(value) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip("=")
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor(KEY)
+
+    assert decode_cursor(cursor) == KEY
+    assert "=" not in cursor
+    # Safe to put in a query string as is
+    assert set(cursor) <= set("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_")
+
+
+def test_cursor_round_trip_keeps_the_instant():
+    decoded = decode_cursor(encode_cursor(KEY))
+
+    assert decoded[1].utcoffset() == KEY[1].utcoffset()
+    assert decoded[1].astimezone(timezone.utc) == KEY[1].astimezone(timezone.utc)
+
+
+@pytest.mark.parametrize("cursor", [
+    "",
+    "!!!",
+    "a",
+    encode_cursor(KEY)[:-6],
+    base64.urlsafe_b64encode(b"\xff\xfe\xfd").decode(),
+    encoded(None),
+    encoded({"rank": 3}),
+    encoded([3, KEY[1].isoformat()]),
+    encoded([3, KEY[1].isoformat(), str(KEY[2]), "extra"]),
+    encoded(["three", KEY[1].isoformat(), str(KEY[2])]),
+    encoded([[3], KEY[1].isoformat(), str(KEY[2])]),
+    encoded([3, "yesterday", str(KEY[2])]),
+    encoded([3, 1740812415, str(KEY[2])]),
+    encoded([3, KEY[1].isoformat(), "not-a-uuid"]),
+    encoded([3, KEY[1].isoformat(), 42]),
+    encoded([3, KEY[1].isoformat(), None]),
+])
+def test_tampered_cursor_is_invalid(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor)
+
+
+def test_invalid_cursor_is_a_value_error():
+    assert issubclass(InvalidCursor, ValueError)
+
+
+ETAG = etag_for(b'[{"id": 1}]')
+
+
+def test_etag_is_quoted_and_content_based():
+    assert ETAG.startswith('"') and ETAG.endswith('"')
+    assert etag_for(b'[{"id": 1}]') == ETAG
+    assert etag_for(b'[{"id": 2}]') != ETAG
+
+
+@pytest.mark.parametrize("if_none_match, expected", [
+    (None, False),
+    ("", False),
+    (ETAG, True),
+    ("W/" + ETAG, True),
+    ('"other", ' + ETAG, True),
+    ('"other",W/' + ETAG + ' , "more"', True),
+    ("*", True),
+    ('"other", *', True),
+    ('"other"', False),
+    ('W/"other"', False),
+    (ETAG.strip('"'), False),
+    ("w/" + ETAG, False),
+])
+def test_etag_matches(if_none_match, expected):
+    assert etag_matches(if_none_match, ETAG) is expected
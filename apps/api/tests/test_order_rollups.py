@@ -0,0 +1,88 @@
+"""
+Completing an order through PUT /{order_id} adds it to the daily rollups.
+
+Needs a Postgres database: set TEST_DATABASE_URI. Everything is created in the
+test_rollups schema, which is dropped afterwards. Run from apps/api:
+    TEST_DATABASE_URI=postgresql+asyncpg://... python -m pytest tests
+"""
+import asyncio
+import os
+from types import SimpleNamespace
+import pytest
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+# The routes first: they import the auth stack in the order the app does
+from orders.route import update_order
+from db.base import Base
+from auth.models import Customer, User
+from mess.models import Mess
+from mess_table.models import MessTable
+from menu.models import MenuItem, MenuItemCategory
+from analytics.models import DailyCustomerSpend, DailyItemSales
+from orders import schema
+from orders.models import Order, OrderItem, OrderStatusEnum
+
+SCHEMA = "test_rollups"
+DATABASE_URI = os.environ.get("TEST_DATABASE_URI")
+
+pytestmark = pytest.mark.skipif(not DATABASE_URI, reason="TEST_DATABASE_URI is not set")
+
+
+async def seed(db: AsyncSession):
+    owner = User(email="owner@test.local", hashed_password="-", is_active=True, is_superuser=False, is_verified=True)
+    db.add(owner)
+    await db.flush()
+    mess = Mess(name="Test", slug="test-rollups", owner_id=owner.id)
+    db.add(mess)
+    await db.flush()
+    category = MenuItemCategory(name="Mains", slug="test-mains", mess_id=mess.id)
+    table = MessTable(table_name="Table 1", capacity=4, mess_id=mess.id, is_active=True)
+    customer = Customer(email="customer@test.local", hashed_password="-", is_active=True, is_superuser=False,
+                        is_verified=True, mess_id=mess.id)
+    db.add_all([category, table, customer])
+    await db.flush()
+    item = MenuItem(mess_id=mess.id, category_id=category.id, name="Momo", price=150, calories=400, is_veg=True)
+    db.add(item)
+    await db.flush()
+    order = Order(customer_id=customer.id, mess_id=mess.id, table_id=table.id, status=OrderStatusEnum.SERVED,
+                  total_price=450, item_count=1)
+    db.add(order)
+    await db.flush()
+    db.add(OrderItem(order_id=order.id, menu_item_id=item.id, quantity=3, total_price=450, is_cancelled=False))
+    await db.commit()
+    return mess, customer, item, order
+
+
+async def complete_through_put():
+    engine = create_async_engine(
+        DATABASE_URI.split("?")[0],
+        connect_args={"server_settings": {"search_path": f"{SCHEMA}, public"}},
+    )
+    Session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm SCHEMA public"))
+        await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        await conn.run_sync(Base.metadata.create_all)
+    try:
+        async with Session() as db:
+            mess, customer, item, order = await seed(db)
+            context = SimpleNamespace(mess=mess, customer=customer)
+            await update_order(order.id, schema.OrderUpdate(status=OrderStatusEnum.COMPLETED), db=db, context=context)
+
+        async with Session() as db:
+            items = (await db.execute(select(DailyItemSales).where(DailyItemSales.mess_id == mess.id))).scalars().all()
+            spend = (await db.execute(select(DailyCustomerSpend).where(DailyCustomerSpend.mess_id == mess.id))).scalars().all()
+            return item, customer, items, spend
+    finally:
+        async with engine.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        await engine.dispose()
+
+
+def test_put_completion_updates_rollups():
+    item, customer, items, spend = asyncio.run(complete_through_put())
+
+    assert [(row.menu_item_id, row.quantity, row.revenue) for row in items] == [(item.id, 3, 450)]
+    assert [(row.customer_id, row.orders, row.spent) for row in spend] == [(customer.id, 1, 450)]
@@ -0,0 +1,194 @@
+"""
+Order status transitions: the allowed edges, and state.transition's conditional
+UPDATE against a real table.
+
+The transition tests need a Postgres database: set TEST_DATABASE_URI. Everything
+is created in the test_order_state schema, which is dropped afterwards. Run from apps/api:
+    TEST_DATABASE_URI=postgresql+asyncpg://... python -m pytest tests
+"""
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+import pytest
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+# The routes first: they import the auth stack in the order the app does
+import orders.route  # noqa: F401
+from db.base import Base
+from auth.models import Customer, User
+from mess.models import Mess
+from mess_table.models import MessTable
+from orders import state
+from orders.models import Order, OrderStatusEnum
+
+SCHEMA = "test_order_state"
+DATABASE_URI = os.environ.get("TEST_DATABASE_URI")
+
+needs_database = pytest.mark.skipif(not DATABASE_URI, reason="TEST_DATABASE_URI is not set")
+
+ALLOWED = [
+    (OrderStatusEnum.PENDING, OrderStatusEnum.RECEIVED),
+    (OrderStatusEnum.READY, OrderStatusEnum.PREPARING),
+    (OrderStatusEnum.PREPARING, OrderStatusEnum.CANCELLED),
+    (OrderStatusEnum.SERVED, OrderStatusEnum.COMPLETED),
+    (OrderStatusEnum.SERVED, OrderStatusEnum.READY),
+]
+FORBIDDEN = [
+    (OrderStatusEnum.SERVED, OrderStatusEnum.CANCELLED),
+    (OrderStatusEnum.COMPLETED, OrderStatusEnum.PENDING),
+    (OrderStatusEnum.COMPLETED, OrderStatusEnum.CANCELLED),
+    (OrderStatusEnum.CANCELLED, OrderStatusEnum.PENDING),
+    (OrderStatusEnum.CANCELLED, OrderStatusEnum.COMPLETED),
+]
+
+
+@pytest.mark.parametrize("current, target", ALLOWED)
+def test_allowed_edges(current, target):
+    assert target in state.TRANSITIONS[current]
+    assert current in state.sources(target)
+
+
+@pytest.mark.parametrize("current, target", FORBIDDEN)
+def test_forbidden_edges(current, target):
+    assert target not in state.TRANSITIONS[current]
+    assert current not in state.sources(target)
+
+
+def test_final_statuses_never_change():
+    for final in (OrderStatusEnum.COMPLETED, OrderStatusEnum.CANCELLED):
+        assert state.TRANSITIONS[final] == frozenset()
+        assert all(final not in state.sources(target) for target in OrderStatusEnum)
+
+
+def test_every_status_has_transitions():
+    assert set(state.TRANSITIONS) == set(OrderStatusEnum)
+
+
+def test_conflict_message_names_both_statuses():
+    assert str(state.TransitionConflict(OrderStatusEnum.SERVED, OrderStatusEnum.CANCELLED)) == \
+        "Cannot move served order to cancelled"
+    assert str(state.TransitionConflict(None, OrderStatusEnum.COMPLETED)) == \
+        "Cannot move deleted order to completed"
+
+
+async def seed(db: AsyncSession, status: OrderStatusEnum) -> Order:
+    owner = User(email="owner@test.local", hashed_password="-", is_active=True, is_superuser=False, is_verified=True)
+    db.add(owner)
+    await db.flush()
+    mess = Mess(name="Test", slug="test-order-state", owner_id=owner.id)
+    db.add(mess)
+    await db.flush()
+    table = MessTable(table_name="Table 1", capacity=4, mess_id=mess.id, is_active=True)
+    customer = Customer(email="customer@test.local", hashed_password="-", is_active=True, is_superuser=False,
+                        is_verified=True, mess_id=mess.id)
+    db.add_all([table, customer])
+    await db.flush()
+    # An old updated_at, so the one RETURNING hands back is visibly new
+    long_ago = datetime.now(timezone.utc) - timedelta(days=1)
+    order = Order(customer_id=customer.id, mess_id=mess.id, table_id=table.id, status=status,
+                  total_price=450, item_count=1, created_at=long_ago, updated_at=long_ago)
+    db.add(order)
+    await db.commit()
+    return order
+
+
+def in_schema(scenario):
+    """Run scenario(Session) against a freshly created schema, dropped afterwards"""
+    async def run():
+        engine = create_async_engine(
+            DATABASE_URI.split("?")[0],
+            connect_args={"server_settings": {"search_path": f"{SCHEMA}, public"}},
+        )
+        Session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        async with engine.begin() as conn:
+            await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm SCHEMA public"))
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+            await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+            await conn.run_sync(Base.metadata.create_all)
+        try:
+            return await scenario(Session)
+        finally:
+            async with engine.begin() as conn:
+                await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+            await engine.dispose()
+
+    return asyncio.run(run())
+
+
+@needs_database
+def test_transition_returns_updated_at():
+    async def scenario(Session):
+        async with Session() as db:
+            order = await seed(db, OrderStatusEnum.PENDING)
+            seeded_at = order.updated_at
+            await state.transition(db, order, OrderStatusEnum.RECEIVED, has_added_items=True)
+            await db.commit()
+        async with Session() as db:
+            stored = (await db.execute(select(Order).where(Order.id == order.id))).scalar_one()
+        return seeded_at, order, stored
+
+    seeded_at, order, stored = in_schema(scenario)
+
+    assert order.status == stored.status == OrderStatusEnum.RECEIVED
+    assert order.has_added_items is stored.has_added_items is True
+    assert order.updated_at == stored.updated_at
+    assert order.updated_at > seeded_at
+
+
+@needs_database
+def test_forbidden_transition_conflicts_and_writes_nothing():
+    async def scenario(Session):
+        async with Session() as db:
+            order = await seed(db, OrderStatusEnum.SERVED)
+            with pytest.raises(state.TransitionConflict) as conflict:
+                await state.transition(db, order, OrderStatusEnum.CANCELLED)
+            await db.commit()
+        async with Session() as db:
+            stored = (await db.execute(select(Order).where(Order.id == order.id))).scalar_one()
+        return conflict.value, stored
+
+    conflict, stored = in_schema(scenario)
+
+    assert conflict.current == OrderStatusEnum.SERVED
+    assert conflict.target == OrderStatusEnum.CANCELLED
+    assert stored.status == OrderStatusEnum.SERVED
+
+
+@needs_database
+def test_stale_precondition_conflicts_with_committed_status():
+    async def scenario(Session):
+        async with Session() as db:
+            order = await seed(db, OrderStatusEnum.READY)
+        # Another request completes the order after this one loaded it as READY
+        async with Session() as other:
+            racing = (await other.execute(select(Order).where(Order.id == order.id))).scalar_one()
+            await state.transition(other, racing, OrderStatusEnum.COMPLETED)
+            await other.commit()
+        async with Session() as db:
+            with pytest.raises(state.TransitionConflict) as conflict:
+                await state.transition(db, order, OrderStatusEnum.CANCELLED)
+        return order, conflict.value
+
+    order, conflict = in_schema(scenario)
+
+    assert conflict.current == OrderStatusEnum.COMPLETED
+    # The stale copy is brought up to date with what was found
+    assert order.status == OrderStatusEnum.COMPLETED
+
+
+@needs_database
+def test_deleted_order_conflicts_without_status():
+    async def scenario(Session):
+        async with Session() as db:
+            order = await seed(db, OrderStatusEnum.PENDING)
+            await db.delete(order)
+            await db.commit()
+        async with Session() as db:
+            with pytest.raises(state.TransitionConflict) as conflict:
+                await state.transition(db, order, OrderStatusEnum.RECEIVED)
+        return conflict.value
+
+    conflict = in_schema(scenario)
+
+    assert conflict.current is None
@@ -0,0 +1,146 @@
+"""
+PreferenceProfileStore partitions: loading, events recorded meanwhile, and reloads.
+The database aggregation is replaced by rows handed to from_interactions.
+"""
+import asyncio
+import uuid
+from types import SimpleNamespace
+import pytest
+from menu import profile_store
+from menu.preference_profiles import PreferenceProfiles
+from menu.profile_store import PreferenceProfileStore
+
+MESS = uuid.uuid4()
+ALICE = uuid.uuid4()
+MOMO = SimpleNamespace(calories=400, spiciness="medium", is_veg=True)
+
+
+def row(user_id, quantity, lines):
+    return SimpleNamespace(user_id=user_id, calories=400, spiciness="medium", is_veg=True,
+                           quantity=quantity, lines=lines)
+
+
+class FakeDatabase:
+    """Stands in for load_user_preference_profiles; each load can be held until released"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.loads = 0
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def load(self, mess_id):
+        self.loads += 1
+        rows = list(self.rows)
+        self.started.set()
+        await self.release.wait()
+        return PreferenceProfiles.from_interactions(rows)
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = FakeDatabase([row(ALICE, 3, 2)])
+    monkeypatch.setattr(profile_store, "load_user_preference_profiles", database.load)
+    return database
+
+
+def test_interactions_count_order_lines(database):
+    async def scenario():
+        store = PreferenceProfileStore()
+        profiles = await store.get(MESS)
+        # Two lines in the seed query, one more through record(): three order lines
+        store.record(MESS, ALICE, [(MOMO, 1)])
+        return profiles.profile(ALICE)
+
+    profile = asyncio.run(scenario())
+
+    assert profile["total_orders"] == 3
+
+
+def test_events_recorded_during_a_load_are_kept(database):
+    async def scenario():
+        store = PreferenceProfileStore()
+        database.release.clear()
+        load = asyncio.create_task(store.get(MESS))
+        await database.started.wait()
+        # Committed after the query read its rows
+        store.record(MESS, ALICE, [(MOMO, 2)])
+        database.release.set()
+        return await load
+
+    profiles = asyncio.run(scenario())
+
+    assert profiles.profile(ALICE)["total_orders"] == 3
+    assert profiles.sums[profiles.rows[str(ALICE)]][1] == 5
+
+
+def test_events_for_unloaded_partitions_are_skipped(database):
+    async def scenario():
+        store = PreferenceProfileStore()
+        store.record(MESS, ALICE, [(MOMO, 2)])
+        return await store.get(MESS)
+
+    profiles = asyncio.run(scenario())
+
+    assert profiles.profile(ALICE)["total_orders"] == 2
+
+
+def test_expired_partitions_are_reloaded(database):
+    async def scenario():
+        store = PreferenceProfileStore(ttl=0)
+        first = await store.get(MESS)
+        # Another worker's order reached the database
+        database.rows.append(row(ALICE, 1, 1))
+        second = await store.get(MESS)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+
+    assert database.loads == 2
+    assert first is not second
+    assert second.profile(ALICE)["total_orders"] == 3
+
+
+def test_fresh_partitions_are_not_reloaded(database):
+    async def scenario():
+        store = PreferenceProfileStore(ttl=900)
+        return await store.get(MESS), await store.get(MESS)
+
+    first, second = asyncio.run(scenario())
+
+    assert database.loads == 1
+    assert first is second
+
+
+def test_concurrent_callers_share_one_load(database):
+    async def scenario():
+        # Nothing stays fresh, so only sharing the load keeps callers from loading again
+        store = PreferenceProfileStore(ttl=0)
+        database.release.clear()
+        callers = [asyncio.create_task(store.get(MESS)) for _ in range(3)]
+        await database.started.wait()
+        database.release.set()
+        return await asyncio.gather(*callers)
+
+    results = asyncio.run(scenario())
+
+    assert database.loads == 1
+    assert all(profiles is results[0] for profiles in results)
+
+
+def test_partition_evicted_during_its_load_is_not_installed(database):
+    async def scenario():
+        store = PreferenceProfileStore()
+        database.release.clear()
+        load = asyncio.create_task(store.get(MESS))
+        await database.started.wait()
+        # A menu edit changed item features after the query read them
+        store.evict(MESS)
+        database.release.set()
+        await load
+        return await store.get(MESS)
+
+    asyncio.run(scenario())
+
+    assert database.loads == 2
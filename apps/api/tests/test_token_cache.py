@@ -0,0 +1,108 @@
+"""
+Logout and revocation drop cached tokens in this worker and, through the
+token_cache NOTIFY payload, in every other one.
+"""
+import asyncio
+import uuid
+from types import SimpleNamespace
+from auth.token_cache import CUSTOMER, USER, TokenCache, hash_token
+
+
+class NotifySession:
+    """Stands in for AsyncSession and keeps the NOTIFY payloads it was asked to send"""
+
+    def __init__(self):
+        self.sent = []
+
+    async def execute(self, statement):
+        channel, payload = statement.compile().params.values()
+        self.sent.append((channel, payload))
+
+
+def user(user_id=None):
+    return SimpleNamespace(id=user_id or uuid.uuid4())
+
+
+def broadcast(cache: TokenCache, kind: str, **targets):
+    """Payloads cache.notify() would publish, as delivered to the listener"""
+    db = NotifySession()
+    asyncio.run(cache.notify(db, kind, **targets))
+    return [payload for channel, payload in db.sent if channel == cache.channel]
+
+
+def test_logout_drops_only_that_token():
+    cache = TokenCache()
+    alice = user()
+    cache.put(USER, "token-a", alice)
+    cache.put(USER, "token-b", alice)
+
+    cache.invalidate_tokens(USER, [hash_token("token-a")])
+
+    assert cache.get(USER, "token-a") is None
+    assert cache.get(USER, "token-b") is alice
+
+
+def test_revoke_drops_every_token_of_the_user_and_kind():
+    cache = TokenCache()
+    alice, bob = user(), user()
+    cache.put(USER, "token-a", alice)
+    cache.put(USER, "token-b", alice)
+    cache.put(USER, "token-c", bob)
+    # Staff and customer ids come from different tables and may collide
+    cache.put(CUSTOMER, "token-d", user(alice.id))
+
+    cache.invalidate_users(USER, [alice.id])
+
+    assert cache.get(USER, "token-a") is None
+    assert cache.get(USER, "token-b") is None
+    assert cache.get(USER, "token-c") is bob
+    assert cache.get(CUSTOMER, "token-d") is not None
+    assert cache.stats()["size"] == 2
+
+
+def test_logout_reaches_other_workers():
+    this_worker, other_worker = TokenCache(), TokenCache()
+    alice = user()
+    for cache in (this_worker, other_worker):
+        cache.put(CUSTOMER, "token-a", alice)
+        cache.put(CUSTOMER, "token-b", alice)
+
+    for payload in broadcast(this_worker, CUSTOMER, tokens=["token-a"]):
+        other_worker.on_notify(payload)
+
+    assert other_worker.get(CUSTOMER, "token-a") is None
+    assert other_worker.get(CUSTOMER, "token-b") is alice
+
+
+def test_revoke_reaches_other_workers():
+    this_worker, other_worker = TokenCache(), TokenCache()
+    alice, bob = user(), user()
+    other_worker.put(USER, "token-a", alice)
+    other_worker.put(USER, "token-b", bob)
+
+    for payload in broadcast(this_worker, USER, user_ids=[alice.id]):
+        other_worker.on_notify(payload)
+
+    assert other_worker.get(USER, "token-a") is None
+    assert other_worker.get(USER, "token-b") is bob
+
+
+def test_malformed_notification_is_ignored():
+    cache = TokenCache()
+    alice = user()
+    cache.put(USER, "token-a", alice)
+
+    cache.on_notify("not json")
+    cache.on_notify('{"tokens": []}')
+
+    assert cache.get(USER, "token-a") is alice
+
+
+def test_reconnect_clears_everything():
+    cache = TokenCache()
+    cache.put(USER, "token-a", user())
+
+    asyncio.run(cache.on_connect())
+
+    assert cache.get(USER, "token-a") is None
+    assert cache.stats()["size"] == 0